@@ -2,9 +2,11 @@ import streamlit as st
 import time
 import json
 import os
-import requests
-import re
 import random
+import re
+
+from core import (code_index, diagnosis, knowledge_store, llm_client, log_compact, log_index, perf_spans,
+                  response_cache, retrieval, scheduler, stream_parser)
 
 # ==========================================
 # 1. 页面基础配置 (必须在第一行)
@@ -118,106 +120,129 @@ java.lang.NullPointerException: The field 'loan_rate' is null in transaction dat
 }
 
 
-# 加载知识库 (JSON)
-@st.cache_data
-def load_knowledge_base():
-    path = os.path.join("public", "knowledge_index.json")
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+# 共享的 Embedding 模型 (每个服务进程只加载一次，所有会话复用)
+@st.cache_resource(show_spinner="正在加载 Embedding 模型...")
+def load_embedding_model():
+    try:
+        return retrieval.load_embedding_model()
+    except Exception:
+        # 模型或依赖缺失时退化为关键词检索
+        return None
+
+
+# 共享的知识库 (索引 + 向量检索器)：所有会话共用一份只读快照，不做 pickle 拷贝
+# 磁盘上的索引被重建后在后台热加载，进行中的查询继续用旧快照
+@st.cache_resource(show_spinner="正在打开知识库索引...")
+def get_knowledge_store():
+    return knowledge_store.KnowledgeStore(load_embedding_model())
 
 
-knowledge_base = load_knowledge_base()
+# 本轮页面运行使用的快照 (整轮保持不变)
+kb_snapshot = get_knowledge_store().current()
+knowledge_base = kb_snapshot.index
 
 
-# RAG 检索逻辑 (关键词加权)
+# RAG 检索逻辑 (向量余弦相似度 + BM25 混合打分，无模型时只走 BM25)
 def search_knowledge(query, top_k=3):
     if not knowledge_base: return []
-    scored_results = []
-    for item in knowledge_base:
-        content = item["content"]
-        score = 0
-        if query in content:
-            score += 10
-        else:
-            for char in query:
-                if char in content: score += 0.5
-        if score > 1: scored_results.append((score, item))
-    scored_results.sort(key=lambda x: x[0], reverse=True)
-    return [x[1] for x in scored_results[:top_k]]
+    nprobe = st.session_state.get("ann_nprobe")
+    return [item for item, _ in kb_snapshot.retriever.search(query, top_k, nprobe)]
+
+
+def format_source(item):
+    """切片来源展示：文件名 + 页码 (旧版索引没有来源信息时显示 本地知识库)"""
+    source = item.get("source") or "本地知识库"
+    return f"{source} · 第 {item['page']} 页" if item.get("page") else source
+
+
+def search_knowledge_batch(queries, top_k=3):
+    """批量检索：多个问题共用一次 Embedding 前向 + 一次矩阵乘"""
+    if not knowledge_base: return [[] for _ in queries]
+    nprobe = st.session_state.get("ann_nprobe")
+    return [[item for item, _ in hits] for hits in kb_snapshot.retriever.search_batch(queries, top_k, nprobe)]
 
 
 # Ollama 调用逻辑 (流式)
 # ==========================================
-# 优化版：Ollama 调用 (带健康检查 & 思考标签清洗)
+# 优化版：共享的 keep-alive 连接池 + 后台缓存健康状态
 # ==========================================
-def call_ollama_stream(model, messages):
-    url = "http://localhost:11434/api/chat"
+@st.cache_resource
+def get_ollama_client():
+    return llm_client.OllamaClient()
 
-    # 1. 先做个极速健康检查
-    try:
-        requests.get("http://localhost:11434", timeout=1)
-    except:
-        yield "❌ 连接失败: 本地 Ollama 服务未启动！请在终端运行 `ollama serve`"
-        return
 
-    payload = {"model": model, "messages": messages, "stream": True}
+# 共享的回答缓存 (SQLite 持久化，TTL + LRU 淘汰)
+@st.cache_resource
+def get_response_cache():
+    return response_cache.ResponseCache()
+
+
+# 共享的推理调度器：所有会话的请求统一排队，每个模型限制并发，相同请求合并为一个流
+@st.cache_resource
+def get_scheduler():
+    return scheduler.InferenceScheduler(get_ollama_client().chat_stream)
+
+
+# 共享的分阶段耗时记录器 (追加写入 .cache/perf_spans.jsonl，侧边栏展示滚动 p50 / p95)
+@st.cache_resource
+def get_perf_recorder():
+    return perf_spans.SpanRecorder()
+
+
+def call_ollama_stream(model, messages, metrics=None, use_cache=True, on_wait=None):
+    # 思考标签原样返回，由各页面自行渲染；命中缓存时按流式回放，未命中时经调度器排队推理
+    # on_wait(排队位置) 在排队期间被周期性调用
+    sched = get_scheduler()
+
+    def scheduled_stream(model, messages, metrics):
+        ticket = sched.submit(model, messages)
+        st.session_state.active_ticket = ticket
+        yield from sched.stream(ticket, metrics, on_wait)
+
+    yield from get_response_cache().cached_stream(
+        model, messages, scheduled_stream, bypass=not use_cache, metrics=metrics)
 
-    try:
-        # 设置 timeout 防止握手等待太久
-        with requests.post(url, json=payload, stream=True, timeout=10) as response:
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        body = json.loads(line)
-                        if "message" in body:
-                            content = body["message"]["content"]
-                            # 稍微清洗一下 DeepSeek 的思考标签，或者直接返回让前端渲染
-                            yield content
-            else:
-                yield f"❌ 模型服务报错: {response.status_code} (请检查模型名称是否正确)"
-    except Exception as e:
-        yield f"❌ 推理中断: {str(e)}"
+
+def cancel_active_inference():
+    """取消当前会话正在排队 / 生成的推理请求"""
+    ticket = st.session_state.pop("active_ticket", None)
+    if ticket is not None:
+        get_scheduler().cancel(ticket)
 
 
 # ==========================================
 # 新增：真实日志文件检索逻辑
 # ==========================================
-def search_local_logs(trace_id):
+# 共享的 Trace-ID 倒排索引 (持久化在 .cache/，每次查询前增量追加新日志)
+@st.cache_resource
+def load_log_index():
+    return log_index.LogIndex("logs")
+
+
+# 共享的 Java 工程代码索引 (每个工程目录一个，持久化在 .cache/，每次查询前按 mtime / sha1 增量更新)
+@st.cache_resource(show_spinner="正在打开代码索引...")
+def get_code_index(project_dir):
+    return code_index.CodeIndex(project_dir)
+
+
+def search_local_logs(trace_id, start=None, end=None, context_lines=0):
     """
-    遍历 logs 文件夹下的所有 .log 文件，寻找包含 trace_id 的日志行
+    在 logs 文件夹下的日志 (含 *.log.1 / *.log.gz 轮转归档) 中寻找包含 trace_id 的日志行
+    完整的 [G...] / [T...] 编号走倒排索引直接 seek (gzip 归档流式扫描)；其它关键字或索引中没有的编号走 mmap 全量扫描
+    start / end 为可选时间范围，如 "2026-01-31 10:00"；context_lines 为每个命中行前后附带的上下文行数
+    返回按时间归并的跨服务 Timeline；没找到返回 None，出错返回错误提示字符串
     """
     log_dir = "logs"
     if not os.path.exists(log_dir):
         return f"⚠️ 未找到日志目录: {log_dir}，请先创建并放入日志文件。"
 
-    found_content = []
-
-    # 遍历 logs 目录
-    for filename in os.listdir(log_dir):
-        if filename.endswith(".log"):
-            file_path = os.path.join(log_dir, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    # 简单粗暴：按行读取，找到匹配 TraceID 的行
-                    # 进阶技巧：这里其实可以做上下文窗口截取（前5行+后5行），为了演示简单我们只取匹配行
-                    file_hits = []
-                    for line in f:
-                        if trace_id in line:
-                            file_hits.append(line.strip())
-
-                    if file_hits:
-                        found_content.append(f"--- [来源文件: {filename}] ---")
-                        found_content.extend(file_hits)
-                        found_content.append("")  # 空行分隔
-            except Exception as e:
-                return f"❌ 读取文件 {filename} 失败: {str(e)}"
-
-    if not found_content:
-        return None
+    trace_id = trace_id.strip()
+    try:
+        timeline = diagnosis.aggregate_logs(load_log_index(), log_dir, trace_id, start, end, context_lines)
+    except Exception as e:
+        return f"❌ 日志检索失败: {str(e)}"
 
-    return "\n".join(found_content)
+    return timeline or None
 
 # ==========================================
 # 4. 侧边栏布局 (Sidebar)
@@ -246,10 +271,34 @@ with st.sidebar:
     st.markdown("#### ⚙️ 引擎配置")
     selected_model = st.selectbox(
         "推理模型",
-        ["qwen3-vl:8b", "deepseek-r1:8b", "qwen2.5", "llama3"],
+        llm_client.configured_models(),
         index=0
     )
-    st.info(f"🟢 系统在线\n\n已加载 {len(knowledge_base)} 个知识切片")
+    use_cache = st.toggle("⚡ 复用缓存回答", value=True, help="关闭后本次请求跳过缓存，强制模型重新推理")
+    cache_stats = get_response_cache().stats()
+    st.caption(f"🗄️ 回答缓存：命中率 {cache_stats['hit_rate']:.0%} "
+               f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']}) · "
+               f"{cache_stats['entries']} 条 · {cache_stats['bytes'] / 1024:.0f} KB")
+    sched_stats = get_scheduler().stats()
+    st.caption(f"🚦 推理队列：生成中 {sum(sched_stats['running'].values())} · "
+               f"排队 {sum(sched_stats['queued'].values())} · 已合并重复请求 {sched_stats['deduplicated']}")
+    # 性能面板：各阶段滚动 p50 / p95 与各模型生成速度
+    with st.expander("📈 性能面板"):
+        stage_stats = get_perf_recorder().stage_stats()
+        if stage_stats:
+            st.dataframe([{"阶段": s["stage"], "次数": s["n"], "p50 (ms)": round(s["p50_ms"], 1),
+                           "p95 (ms)": round(s["p95_ms"], 1)} for s in stage_stats],
+                         hide_index=True, use_container_width=True)
+            for m in get_perf_recorder().model_stats():
+                st.caption(f"🧠 {m['model']}：{m['p50_tps']:.1f} tokens/s (p50) · "
+                           f"最慢 5% {m['p5_tps']:.1f} tokens/s · {m['n']} 次")
+        else:
+            st.caption("暂无数据，发起一次对话或诊断后显示")
+
+    if get_ollama_client().is_healthy():
+        st.info(f"🟢 系统在线\n\n已加载 {len(knowledge_base)} 个知识切片")
+    else:
+        st.warning(f"🔴 Ollama 离线 ({get_ollama_client().host})\n\n已加载 {len(knowledge_base)} 个知识切片")
 
 # ==========================================
 # 5. 自定义 Header (HTML 注入)
@@ -311,29 +360,57 @@ if nav == "🎓 码哥小助手":
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
+                trace = get_perf_recorder().trace("chat", selected_model)
                 # RAG 检索
-                docs = search_knowledge(prompt)
+                with trace.span("retrieval") as retrieval_span:
+                    docs = search_knowledge(prompt)
+                retrieval_ms = retrieval_span.ms
 
                 # 构建 Prompt
+                with trace.span("prompt_build"):
+                    if docs:
+                        context = "\n".join([f"- {d['content']}" for d in docs])
+                        sys_prompt = f"你是一个友好的技术导师。请基于参考文档回答：\n{context}\n\n用户问题：{prompt}"
+                    else:
+                        sys_prompt = f"用户问：{prompt}。本地知识库没找到，请用通用知识回答并提示他查阅文档。"
                 if docs:
-                    context = "\n".join([f"- {d['content']}" for d in docs])
-                    sys_prompt = f"你是一个友好的技术导师。请基于参考文档回答：\n{context}\n\n用户问题：{prompt}"
-                    st.toast(f"已检索到 {len(docs)} 条相关文档", icon="📚")
-                else:
-                    sys_prompt = f"用户问：{prompt}。本地知识库没找到，请用通用知识回答并提示他查阅文档。"
+                    st.toast(f"已检索到 {len(docs)} 条相关文档 ({retrieval_ms:.1f} ms)", icon="📚")
 
                 # 流式输出
                 response_ph = st.empty()
-                full_res = ""
-                for chunk in call_ollama_stream(selected_model, [{"role": "user", "content": sys_prompt}]):
-                    full_res += chunk
-                    response_ph.markdown(full_res + "▌")
+                res_parts = []
+                llm_metrics = {}
+
+                def show_queue_position(pos):
+                    response_ph.markdown(f"⏳ 推理排队中，当前第 {pos} 位...")
+
+                throttle = stream_parser.RenderThrottle()
+                render_s = 0.0
+                for chunk in call_ollama_stream(selected_model, [{"role": "user", "content": sys_prompt}], llm_metrics,
+                                                use_cache, on_wait=show_queue_position):
+                    res_parts.append(chunk)
+                    if throttle.tick():
+                        t_render = time.perf_counter()
+                        response_ph.markdown("".join(res_parts) + "▌")
+                        render_s += time.perf_counter() - t_render
+                full_res = "".join(res_parts)
+                t_render = time.perf_counter()
                 response_ph.markdown(full_res)
+                render_s += time.perf_counter() - t_render
+                trace.llm(llm_metrics, throttle.tokens)
+                trace.add("render", render_s * 1000, renders=throttle.renders)
+                trace.finish(cached=bool(llm_metrics.get("cached")))
 
                 # 展示引用源
+                mode = kb_snapshot.retriever.mode
+                ttft = llm_metrics.get("ttft_ms")
+                ttft_text = f" · 首 token {ttft:.0f} ms" if ttft is not None else ""
+                if llm_metrics.get("cached"):
+                    ttft_text += " · ⚡ 缓存命中"
+                st.caption(f"⏱️ {mode}耗时 {retrieval_ms:.1f} ms{ttft_text} · {throttle.summary()}")
                 if docs:
                     with st.expander("📖 引用来源 (Grounding)"):
-                        for d in docs: st.info(d['content'][:200] + "...")
+                        for d in docs: st.info(f"📄 {format_source(d)}\n\n" + d['content'][:200] + "...")
 
         st.session_state.chat_history.append({"role": "assistant", "content": full_res})
 
@@ -358,28 +435,63 @@ elif nav == "🩺 智能故障诊断":
         with tab1:
             st.info("💡 演示提示：\n- 成功交易: `G889820260131001`\n- 失败报错: `G889820260131003` (金额超限)")
             serial = st.text_input("Global Trace ID", value="G889820260131003")
+            with st.expander("⏱️ 时间范围 / 上下文 (可选)"):
+                tc1, tc2 = st.columns(2)
+                time_start = tc1.text_input("开始时间", placeholder="2026-01-31 10:00")
+                time_end = tc2.text_input("结束时间", placeholder="2026-01-31 11:00")
+                context_lines = st.number_input("命中行前后附带的上下文行数", min_value=0, max_value=20, value=2)
 
             if st.button("📡 全链路日志聚合"):
                 with st.status("正在执行分布式链路追踪...", expanded=True) as status:
                     time.sleep(0.3)
-                    st.write(f"🔍 扫描 `/logs` 目录下的微服务日志...")
+                    st.write(f"🔍 扫描 `/logs` 目录下的微服务日志 (含轮转归档)...")
                     # 这里调用之前的 search_local_logs 函数
-                    result = search_local_logs(serial)
-
-                    if result:
-                        st.session_state.log_cache = result
+                    trace = get_perf_recorder().trace("diagnosis")
+                    with trace.span("log_aggregation", trace_id=serial.strip()):
+                        result = search_local_logs(serial, time_start.strip() or None, time_end.strip() or None,
+                                                   int(context_lines))
+
+                    if isinstance(result, str):
+                        status.update(label="❌ 日志检索失败", state="error")
+                        st.error(result)
+                    elif result:
+                        st.session_state.timeline = result
+                        st.session_state.log_cache = result.to_text()
                         status.update(label="✅ 聚合成功", state="complete", expanded=False)
-                        st.toast(f"已提取上下文日志", icon="📄")
+                        st.toast(f"已按时间线合并 {len(result.sources)} 个服务的日志", icon="📄")
                     else:
                         status.update(label="❌ 未找到日志", state="error")
                         st.error(f"未找到包含 {serial} 的日志")
 
             if "log_cache" in st.session_state:
                 log_content = st.session_state.log_cache
+                timeline = st.session_state.timeline
+                st.caption(f"🕒 跨服务时间线：{' / '.join(timeline.sources)} · 命中 {timeline.hit_count} 行")
                 st.code(log_content, language="log")
+                with st.expander("📊 时间线表格视图"):
+                    st.dataframe(timeline.to_records(), use_container_width=True)
 
         with tab2:
-            log_content = st.text_area("粘贴堆栈信息", height=200)
+            pasted_log = st.text_area("粘贴堆栈信息", height=200)
+            if pasted_log:
+                log_content = pasted_log
+
+        # 日志压缩：模板折叠 + 堆栈截断 + token 预算，减少 CPU 上的 prefill 耗时
+        compact_ms = 0.0
+        if log_content:
+            cc1, cc2 = st.columns([1, 1])
+            use_compact = cc1.toggle("🗜️ 压缩日志后再分析", value=True)
+            token_budget = cc2.number_input("Token 预算", min_value=500, max_value=16000,
+                                            value=log_compact.DEFAULT_TOKEN_BUDGET, step=500)
+            if use_compact:
+                t_compact = time.perf_counter()
+                compacted = log_compact.compact(log_content, int(token_budget))
+                compact_ms = (time.perf_counter() - t_compact) * 1000
+                st.caption(f"🗜️ 约 {compacted.raw_tokens} → {compacted.compact_tokens} tokens"
+                           f" ({compacted.raw_lines} → {compacted.compact_lines} 行, {compacted.templates} 个日志模板)")
+                with st.expander("查看压缩后送入模型的日志"):
+                    st.code(compacted.text, language="log")
+                log_content = compacted.text
 
         # 增加一个清空按钮，防止状态卡死
         c_btn1, c_btn2 = st.columns([3, 1])
@@ -387,6 +499,7 @@ elif nav == "🩺 智能故障诊断":
             analyze_btn = st.button("⚡ 启动智能根因分析", type="primary", use_container_width=True)
         with c_btn2:
             if st.button("🔄 重置"):
+                cancel_active_inference()
                 st.rerun()
 
         st.markdown('</div>', unsafe_allow_html=True)
@@ -406,41 +519,65 @@ elif nav == "🩺 智能故障诊断":
             status_indicator = st.status("🤖 AI 正在深度推理 (Chain-of-Thought)...", expanded=True)
             report_ph = st.empty()
 
-            prompt = f"""
-            你是一个金融级分布式系统架构师。请分析以下聚合的跨系统日志：
-            ```log
-            {log_content}
-            ```
-            请输出 Markdown 格式的诊断报告，包含：1.链路拓扑 2.根因分析 3.修复建议。
-            请保持专业、客观。
-            """
-
-            full_text = ""
             start_time = time.time()
-
-            # 流式接收
-            for chunk in call_ollama_stream(selected_model, [{"role": "user", "content": prompt}]):
-                full_text += chunk
-
-                # 2. 实时检测 DeepSeek 的思考标签 <think>
-                if "<think>" in full_text and "</think>" not in full_text:
-                    # 正在思考中，更新状态栏而不是主报告区
-                    think_content = full_text.split("<think>")[-1]
-                    status_indicator.write(think_content[-100:])  # 只显示最新思考，防止刷屏
-                elif "</think>" in full_text:
-                    # 思考结束，开始输出正文
+            trace = get_perf_recorder().trace("diagnosis", selected_model)
+            t_prompt = time.perf_counter()
+            prompt = diagnosis.build_prompt(log_content)
+            # 日志压缩在本轮页面运行中已经完成，计入拼 Prompt 阶段
+            trace.add("prompt_build", compact_ms + (time.perf_counter() - t_prompt) * 1000, prompt_chars=len(prompt))
+            parser = stream_parser.ThinkStreamParser()
+            throttle = stream_parser.RenderThrottle()
+            think_ph = status_indicator.empty()
+
+            def render_report(text):
+                report_ph.markdown(f'<div style="background:#0f172a; color:#e2e8f0;">{text}</div>',
+                                   unsafe_allow_html=True)
+
+            def show_queue_position(pos):
+                think_ph.write(f"⏳ 推理排队中，当前第 {pos} 位 (可点击 🔄 重置 取消)")
+
+            # 流式接收：状态机增量拆分 <think> 与正文，界面按帧率合并刷新
+            llm_metrics = {}
+            render_s = 0.0
+            for chunk in call_ollama_stream(selected_model, [{"role": "user", "content": prompt}], llm_metrics,
+                                            use_cache, on_wait=show_queue_position):
+                if throttle.tokens == 0:
+                    think_ph.empty()  # 清掉排队提示
+                was_thinking = parser.in_think
+                parser.feed(chunk)
+
+                # 思考刚结束，立刻切换状态栏 (只触发一次)
+                if was_thinking and not parser.in_think:
+                    think_ph.empty()
                     status_indicator.update(label="✅ 推理完成", state="complete", expanded=False)
-                    # 去掉思考标签，只显示正文 (可选)
-                    clean_text = re.sub(r'<think>.*?</think>', '', full_text, flags=re.DOTALL)
-                    report_ph.markdown(f'<div style="background:#0f172a; color:#e2e8f0;">{clean_text}</div>',
-                                       unsafe_allow_html=True)
+
+                if not throttle.tick():
+                    continue
+                t_render = time.perf_counter()
+                if parser.in_think:
+                    # 正在思考中，更新状态栏而不是主报告区，只显示最新思考，防止刷屏
+                    think_ph.write(parser.think_tail(100))
                 else:
-                    # 普通模型（非 R1）直接显示
-                    report_ph.markdown(f'<div style="background:#0f172a; color:#e2e8f0;">{full_text}</div>',
-                                       unsafe_allow_html=True)
+                    # 正文 (R1 已去掉思考段；普通模型直接显示)
+                    render_report(parser.answer_text)
+                render_s += time.perf_counter() - t_render
+
+            parser.finish()
+            full_text = parser.answer_text
+            t_render = time.perf_counter()
+            render_report(full_text)
+            render_s += time.perf_counter() - t_render
+            trace.llm(llm_metrics, throttle.tokens)
+            trace.add("render", render_s * 1000, renders=throttle.renders)
+            trace.finish(cached=bool(llm_metrics.get("cached")))
 
             # 最终兜底刷新
             status_indicator.update(label="✅ 分析完成", state="complete", expanded=False)
+            if llm_metrics.get("ttft_ms") is not None:
+                cache_text = " · ⚡ 缓存命中" if llm_metrics.get("cached") else ""
+                st.caption(f"⏱️ 首 token {llm_metrics['ttft_ms']:.0f} ms · 生成 {llm_metrics['total_ms'] / 1000:.1f} s"
+                           f" · 端到端 {time.time() - start_time:.1f} s · 页面渲染 {render_s * 1000:.0f} ms"
+                           f" · {throttle.summary()}{cache_text}")
 
         elif not analyze_btn:
             st.markdown(
@@ -461,10 +598,15 @@ elif nav == "📦 存量功能交接":
     with col1:
         st.markdown('<div class="content-card">', unsafe_allow_html=True)
         st.subheader("🔍 功能定位")
-        func_name = st.text_input("交易码/功能名", value="loan_approval_01 (贷款审批)")
+        project_dir = st.text_input("Java 工程目录", value=code_index.DEFAULT_PROJECT_DIR,
+                                    help="可通过环境变量 CODE_PROJECT_DIR 修改默认值")
+        func_name = st.text_input("交易码/功能名", value="loan_approval_01 (贷款审批)",
+                                  help="支持交易码、常量名、请求路径、类名、方法名")
+        gen_note = st.toggle("🤖 生成 AI 交接说明", value=True)
 
         st.info(
-            "系统将自动执行：\n1. 扫描 Java 工程目录 (AST)\n2. 提取 Controller/Service 调用链\n3. 关联《详细设计文档.docx》")
+            "系统将自动执行：\n1. 增量扫描 Java 工程目录 (仅解析变更文件)\n2. 提取 Controller/Service/Mapper 调用链\n"
+            "3. 关联 MyBatis 语句涉及的表")
 
         start_btn = st.button("🚀 生成交接指引", type="primary", use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
@@ -472,47 +614,82 @@ elif nav == "📦 存量功能交接":
     with col2:
         st.markdown('<div class="dark-console">', unsafe_allow_html=True)
 
-        if start_btn:
-            with st.status("正在构建代码知识图谱...", expanded=True) as status:
-                time.sleep(0.6)
-                st.write("📂 解析 AST 语法树 (Abstract Syntax Tree)...")
-                time.sleep(0.6)
-                st.write("🔗 关联文档: 《贷款业务需求规格说明书_v2.1.docx》...")
-                time.sleep(0.6)
-                st.write("🤖 Qwen-Coder 正在生成逻辑注释...")
-                status.update(label="✅ 生成完毕", state="complete", expanded=False)
-
-            # 模拟的 AI 输出报告
-            st.markdown(f"""
-### 📘 功能交接报告：{func_name}
-
-#### 1. 业务全景 (Based on Docs)
-该交易用于分行客户经理提交贷款审批申请。核心规则包含**黑名单校验**、**额度占用**、**利率定价**三个环节。
-
-#### 2. 代码实现链路 (Code Trace)
-* **入口**: `LoanController.java` (Line 45) -> `approve()`
-* **核心逻辑**: `LoanService.java`
-* **持久层**: `LoanMapper.xml` (Table: `T_LOAN_INFO`)
-
-#### 3. 核心逻辑解析 (AI Generated)
-```java
-// 1. 校验客户状态 (对应需求文档 3.2.1 章节)
-if (!clientService.checkStatus(clientId)) {{
-    throw new BizException("E001", "客户状态异常");
-}}
-
-// 2. 额度扣减 (注意：此处使用了 Redis 分布式锁)
-RLock lock = redisson.getLock("loan_limit_" + clientId);
-try {{
-    // ... 扣减逻辑 ...
-}} finally {{
-    lock.unlock();
-}}
-###4 .潜在风险提示
-                        
-扫描发现 LoanService.java 第 120 行存在硬编码 (Hardcode) 的利率参数 0.045，建议在接手后迁移至配置中心。 ) else: st.markdown('<div style="color:#64748b; text-align:center; padding-top:100px;">Waiting for function input...</div>', unsafe_allow_html=True)
-    ```java
-    st.markdown('</div>', unsafe_allow_html=True)""")
+        # 去掉 "(贷款审批)" 之类的中文说明，只保留交易码本身
+        query = re.split(r"[\s(（]", func_name.strip())[0] if func_name.strip() else ""
+        if start_btn and not os.path.isdir(project_dir):
+            st.error(f"❌ 工程目录不存在：{project_dir}")
+        elif start_btn and query:
+            trace = get_perf_recorder().trace("handover", selected_model if gen_note else None)
+            code_idx = get_code_index(project_dir)
+            with st.status("正在更新代码索引...", expanded=True) as status:
+                with trace.span("code_index_refresh") as sp:
+                    refresh_stats = code_idx.refresh()
+                st.write(f"📂 {refresh_stats['files']} 个源文件，重新解析 {refresh_stats['parsed']} 个，"
+                         f"移除 {refresh_stats['removed']} 个 ({sp.ms:.0f} ms)")
+                with trace.span("code_lookup", query=query) as sp:
+                    results, _ = code_idx.lookup(query)
+                st.write(f"🔗 定位到 {len(results)} 个入口 ({sp.ms:.1f} ms)")
+                status.update(label="✅ 调用链分析完毕", state="complete", expanded=False)
+
+            if not results:
+                st.warning(f"⚠️ 未在 {project_dir} 中找到与 `{query}` 相关的代码 (已尝试交易码字面量、常量、路径、类名、方法名)")
+            else:
+                report = [f"### 📘 功能交接报告：{func_name}"]
+                for i, (entry, chain) in enumerate(results, 1):
+                    tables = code_index.chain_tables(chain)
+                    report.append(f"#### {i}. 入口 `{entry['class']}.{entry['method']}()` (匹配方式：{entry['reason']})")
+                    report.append(code_index.render_chain(chain, entry["method_id"]))
+                    if tables:
+                        report.append("**涉及表**：" + "，".join(
+                            f"`{t}` ({'/'.join(sorted(k.upper() for k in kinds))})" for t, kinds in sorted(tables.items())))
+                report_md = "\n\n".join(report)
+                st.markdown(report_md)
+
+                if gen_note:
+                    # 入口方法与调用链上前几个方法的源码交给模型，生成面向接手人的说明
+                    entry, chain = results[0]
+                    with trace.span("prompt_build"):
+                        nodes = sorted(chain["nodes"].values(), key=lambda n: n["depth"])[:6]
+                        sources = "\n\n".join(f"// {n['path']}:{n['line']}\n{code_idx.snippet(n)}" for n in nodes)
+                        prompt = f"""
+                        你是一名资深 Java 架构师，正在向新同事交接功能 "{func_name}"。
+                        以下是静态分析得到的调用链：
+                        {report_md}
+
+                        以下是链路上主要方法的源码：
+                        ```java
+                        {sources}
+                        ```
+                        请用 Markdown 输出：1.业务流程概述 2.关键逻辑与数据表 3.潜在风险与接手注意事项。
+                        只依据给出的代码，不要编造不存在的类或方法。
+                        """
+                    note_ph = st.empty()
+                    parser = stream_parser.ThinkStreamParser()
+                    throttle = stream_parser.RenderThrottle()
+                    llm_metrics = {}
+                    render_s = 0.0
+                    for chunk in call_ollama_stream(selected_model, [{"role": "user", "content": prompt}], llm_metrics,
+                                                    use_cache):
+                        parser.feed(chunk)
+                        if not throttle.tick():
+                            continue
+                        t_render = time.perf_counter()
+                        note_ph.markdown(parser.answer_text if not parser.in_think else f"💭 {parser.think_tail(100)}")
+                        render_s += time.perf_counter() - t_render
+                    parser.finish()
+                    t_render = time.perf_counter()
+                    note_ph.markdown(parser.answer_text)
+                    render_s += time.perf_counter() - t_render
+                    trace.llm(llm_metrics, throttle.tokens)
+                    trace.add("render", render_s * 1000, renders=throttle.renders)
+            trace.finish(query=query)
+
+        else:
+            st.markdown('<div style="color:#64748b; text-align:center; padding-top:100px;">Waiting for function input...</div>',
+                        unsafe_allow_html=True)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
 # --- Tab 4: 知识库管理 ---
 elif nav == "📚 知识库管理":
     st.markdown("### 📚 交付知识库透视 (RAG Core)")
@@ -522,6 +699,29 @@ elif nav == "📚 知识库管理":
     c1.metric("已向量化文档", f"{len(knowledge_base)} 个")
     c2.metric("Embedding 维度", "384 维 (MiniLM)")
     c3.metric("多模态解析", "RapidOCR 启用")
+    kb_store = get_knowledge_store()
+    st.caption(f"🗂️ 索引版本 {kb_snapshot.version} · 加载于 {time.strftime('%H:%M:%S', time.localtime(kb_snapshot.loaded_at))}"
+               f" · 热加载 {kb_store.reloads} 次 (磁盘上的索引更新后自动生效)")
+    if knowledge_base.has_vectors:
+        rerank_text = " · 精确重排已启用" if knowledge_base.exact_vectors is not None else ""
+        st.caption(f"🧮 向量存储 {knowledge_base.header['dtype']} · 检索矩阵 "
+                   f"{knowledge_base.vectors.nbytes / 2**20:.1f} MB{rerank_text}")
+    if kb_store.last_error:
+        st.warning(f"⚠️ 最近一次热加载失败，继续使用旧索引：{kb_store.last_error}")
+    qc_stats = kb_store.query_cache.stats()
+    q1, q2, q3 = st.columns(3)
+    q1.metric("检索结果缓存命中率", f"{qc_stats['result_hit_rate']:.0%}",
+              help=f"{qc_stats['result_hits']} 命中 / {qc_stats['result_misses']} 未命中 · {qc_stats['result_entries']} 条")
+    q2.metric("Query 向量缓存命中率", f"{qc_stats['vector_hit_rate']:.0%}",
+              help=f"{qc_stats['vector_hits']} 命中 / {qc_stats['vector_misses']} 未命中 · {qc_stats['vector_entries']} 条")
+    q3.metric("累计节省检索耗时", f"{qc_stats['saved_ms'] / 1000:.2f} s", help="按未命中时的平均耗时估算")
+    ann = kb_snapshot.retriever.ann
+    if ann is not None:
+        # IVF 检索参数：nprobe 越大召回越高、越慢 (用 scripts/build_ann.py 的 recall 报告挑选)
+        nprobe = st.slider("🧭 IVF nprobe (召回率 / 延迟权衡)", 1, ann.n_lists,
+                           min(st.session_state.get("ann_nprobe", kb_snapshot.retriever.nprobe), ann.n_lists))
+        st.session_state.ann_nprobe = nprobe
+        st.caption(f"近似检索：{ann.n_lists} 个桶，每次查询约扫描 {nprobe / ann.n_lists:.1%} 的切片")
 
     st.divider()
 
@@ -530,7 +730,7 @@ elif nav == "📚 知识库管理":
 
     with t1:
         st.dataframe(
-            [{"ID": k["id"], "内容摘要": k["content"][:80]+"...", "来源": "本地知识库"} for k in knowledge_base],
+            [{"ID": k["id"], "内容摘要": k["content"][:80]+"...", "来源": format_source(k)} for k in knowledge_base],
             use_container_width=True
         )
 
@@ -538,11 +738,11 @@ elif nav == "📚 知识库管理":
         st.warning("⚠️ 高能预警：这就是计算机眼中的知识")
         if knowledge_base and 'vector' in knowledge_base[0]:
             # 模拟展示第一个切片的向量
-            vec = knowledge_base[0]['vector']
+            vec = knowledge_base[0]['vector'].astype(float).tolist()
             st.markdown(f"**切片 ID-{knowledge_base[0]['id']} 的向量指纹 (前50维):**")
             st.bar_chart(vec[:50], height=200, color="#2563eb")
             with st.expander("查看完整 384 维数组数据"):
-                st.code(str(vec), language="json")
+                st.code(json.dumps(vec), language="json")
         else:
             # 如果没有真实向量，模拟一个图表
             mock_vec = [random.uniform(-1, 1) for _ in range(50)]
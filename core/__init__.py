@@ -0,0 +1,6 @@
+"""
+神码智核 - 后端引擎包
+
+app.py (Streamlit 页面) 与 scripts/ 下的离线脚本共用的检索 / 日志 / 推理逻辑都放在这里，
+页面代码只负责渲染。
+"""
@@ -0,0 +1,190 @@
+"""
+IVF 近似最近邻索引 (知识库达到百万切片时替代逐行暴力打分)
+
+- 构建：在向量样本上训练球面 k-means (余弦)，得到 n_lists 个质心；每个切片归入最相似的质心所在的桶
+- 查询：先算 query 与所有质心的相似度，只在最相似的 nprobe 个桶里做精确打分
+  nprobe 越大召回越高、越慢；nprobe = n_lists 时等价于暴力检索
+- 与向量放在同一个索引目录，ivf.json 最后写出，存在即代表完整；切片数与索引不一致时视为过期不加载
+
+目录内的文件：
+    ivf.json             元信息：切片数、桶数、构建时间
+    ivf_centroids.npy    float32[L, D]，已 L2 归一化的质心
+    ivf_offsets.npy      int64[L+1]，第 l 个桶在 ivf_rows 中的区间
+    ivf_rows.npy         int32[N]，按桶分组的切片行号 (桶内升序)
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+IVF_META_FILE = "ivf.json"
+CENTROIDS_FILE = "ivf_centroids.npy"
+LIST_OFFSETS_FILE = "ivf_offsets.npy"
+LIST_ROWS_FILE = "ivf_rows.npy"
+
+# k-means 每个质心使用的训练样本数
+SAMPLES_PER_LIST = 256
+KMEANS_ITERS = 20
+# 分配阶段每批处理的向量数 (控制 B x L 得分矩阵的内存)
+ASSIGN_BATCH = 65536
+DEFAULT_NPROBE = int(os.environ.get("KB_ANN_NPROBE", "16"))
+
+
+def default_n_lists(count):
+    """经验值：桶数约为 4 * sqrt(N)"""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(vectors, centroids, batch=ASSIGN_BATCH):
+    """每个向量最相似的质心编号"""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        block = np.asarray(vectors[start:start + batch], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(vectors, n_lists, iters=KMEANS_ITERS, seed=0):
+    """球面 k-means：在最多 n_lists * SAMPLES_PER_LIST 个样本上训练"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample_size = min(n, n_lists * SAMPLES_PER_LIST)
+    sample_rows = np.sort(rng.choice(n, sample_size, replace=False))
+    sample = _normalize(np.asarray(vectors[sample_rows], dtype=np.float32))
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        centroids[present] = np.add.reduceat(sample[order], starts, axis=0)
+        # 空桶：重新挑一个随机样本作为质心
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class IvfIndex:
+    def __init__(self, centroids, list_offsets, list_rows, meta=None):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.meta = meta or {}
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, iters=KMEANS_ITERS, seed=0):
+        count = len(vectors)
+        n_lists = min(n_lists or default_n_lists(count), count)
+        centroids = train_centroids(vectors, n_lists, iters, seed)
+        assign = _assign(vectors, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=list_offsets[1:])
+        meta = {"count": count, "lists": n_lists, "created_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        return cls(centroids, list_offsets, list_rows, meta)
+
+    def write(self, index_dir):
+        """
+        先写临时文件再逐个 os.replace (ivf.json 最后替换)：
+        对已在服务的索引目录重建时，正在 mmap 旧 ivf_rows.npy 的进程不会读到被截断的文件
+        """
+        for name, array in ((CENTROIDS_FILE, self.centroids), (LIST_OFFSETS_FILE, self.list_offsets),
+                            (LIST_ROWS_FILE, self.list_rows)):
+            path = os.path.join(index_dir, name)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        meta_path = os.path.join(index_dir, IVF_META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def open(cls, index_dir, expected_count=None):
+        """打开目录下的 IVF 索引；不存在或与切片数不一致 (过期) 时返回 None"""
+        meta_path = os.path.join(index_dir, IVF_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if expected_count is not None and meta.get("count") != expected_count:
+            return None
+        return cls(np.load(os.path.join(index_dir, CENTROIDS_FILE)),
+                   np.load(os.path.join(index_dir, LIST_OFFSETS_FILE)),
+                   np.load(os.path.join(index_dir, LIST_ROWS_FILE), mmap_mode="r"),
+                   meta)
+
+    def candidates(self, query_vec, nprobe=DEFAULT_NPROBE):
+        """query 最相似的 nprobe 个桶内的所有切片行号 (升序)"""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        sims = self.centroids @ query_vec
+        lists = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        parts = [self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+
+    def search(self, matrix, query_vec, top_k=3, nprobe=DEFAULT_NPROBE):
+        """返回 (行号数组, 得分数组)，按得分降序"""
+        rows = self.candidates(query_vec, nprobe)
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ query_vec
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+
+def recall_report(matrix, ivf, nprobes=(1, 2, 4, 8, 16, 32, 64), top_k=10, n_queries=200, noise=0.05, seed=0):
+    """
+    以精确检索为基准评估 recall@k：从索引中随机取向量加少量噪声作为查询
+    返回 [{"nprobe", "recall", "avg_ms", "scanned"}]，另附一行 nprobe=None 的暴力检索耗时
+    """
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    rows = rng.choice(n, min(n_queries, n), replace=False)
+    queries = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+    queries = _normalize(queries + rng.normal(0, noise, queries.shape).astype(np.float32))
+
+    exact, t0 = [], time.perf_counter()
+    for q in queries:
+        scores = np.asarray(matrix @ q, dtype=np.float32)
+        k = min(top_k, n)
+        exact.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    report = [{"nprobe": None, "recall": 1.0, "avg_ms": (time.perf_counter() - t0) * 1000 / len(queries),
+               "scanned": n}]
+
+    for nprobe in nprobes:
+        if nprobe > ivf.n_lists:
+            break
+        hit, t0 = 0, time.perf_counter()
+        for q, truth in zip(queries, exact):
+            found, _ = ivf.search(matrix, q, top_k, nprobe)
+            hit += len(truth.intersection(found.tolist()))
+        elapsed = time.perf_counter() - t0
+        scanned = sum(len(ivf.candidates(q, nprobe)) for q in queries)
+        report.append({"nprobe": nprobe, "recall": hit / sum(len(t) for t in exact),
+                       "avg_ms": elapsed * 1000 / len(queries), "scanned": scanned // len(queries)})
+    return report
+
+
+def print_recall_report(report, top_k=10):
+    print(f"📐 IVF recall@{top_k} (以暴力检索为基准):")
+    print("    nprobe   recall   平均耗时     扫描切片")
+    for r in report:
+        label = "exact" if r["nprobe"] is None else str(r["nprobe"])
+        print(f"    {label:>6}   {r['recall']:6.1%}   {r['avg_ms']:7.2f} ms   {r['scanned']:>8}")
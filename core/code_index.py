@@ -0,0 +1,733 @@
+"""
+Java 工程代码索引 (存量功能交接页使用)
+
+把 Java 源码和 MyBatis Mapper XML 解析成结构化信息，持久化在 SQLite 里：
+- 类 / 接口 (包名、角色：controller / service / mapper / component)、继承与实现关系
+- 方法 (行号范围、@XxxMapping 路径)、方法内的调用 (接收者类型按 字段 / 参数 / 局部变量 声明推断)
+- 字符串字面量 (交易码、URL 等)、注解中引用的常量名
+- MyBatis 语句 (namespace + id -> 表名)，含 XML 与 @Select / @Insert 等注解 SQL
+查询交易码 (如 loan_approval_01) 或常量名 (如 TX_APPROVAL) 时：字面量 / 常量 / 方法名 / 路径 -> 入口方法，
+再沿调用边展开 Controller -> Service(接口 -> 实现) -> Mapper -> 表，全部走索引，毫秒级返回。
+
+解析器不依赖第三方库：先用一个正则去掉注释、抽出字符串字面量 (长度不变，行号不变)，
+再按 { } ; 的嵌套结构识别类型 / 方法 / 字段声明。不追求完整的 Java 语法，覆盖 Spring + MyBatis 工程的常见写法。
+
+增量维护与 core.log_index 相同：按文件 (mtime, 大小) 判断是否变化，变了再比对 sha1，内容确实变了才重新解析；
+待解析的文件多时用进程池并行解析，结果在主进程中单事务写入。
+"""
+import bisect
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_PROJECT_DIR = os.environ.get("CODE_PROJECT_DIR", "code")
+CACHE_DIR = ".cache"
+SKIP_DIRS = {".git", ".svn", ".idea", ".gradle", ".mvn", "target", "build", "out", "bin", "node_modules"}
+# 待解析文件数超过该值才启用进程池
+PARALLEL_MIN_FILES = 64
+PARSE_CHUNKSIZE = 16
+# 调用链展开的默认深度 / 节点上限
+CHAIN_MAX_DEPTH = 8
+CHAIN_MAX_NODES = 200
+
+# 注释、文本块、字符串、字符字面量
+LEXICAL_PATTERN = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"""(?:.|\n)*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.S)
+STRUCTURE_PATTERN = re.compile(r"[{};]")
+PACKAGE_PATTERN = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.M)
+IMPORT_PATTERN = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+)\s*;", re.M)
+
+_ANNOS = r"(?P<annos>(?:@[\w.]+(?:\s*\((?:[^()]|\([^()]*\))*\))?\s*)*)"
+ANNOTATION_PATTERN = re.compile(r"@([\w.]+)(?:\s*\(((?:[^()]|\([^()]*\))*)\))?")
+TYPE_PATTERN = re.compile(
+    r"^\s*" + _ANNOS +
+    r"(?:(?:public|protected|private|abstract|final|static|sealed|non-sealed|strictfp)\s+)*"
+    r"(?P<kind>class|interface|enum|record|@interface)\s+(?P<name>\w+)(?P<rest>.*)$", re.S)
+METHOD_PATTERN = re.compile(
+    r"^\s*" + _ANNOS +
+    r"(?:(?:public|protected|private|abstract|final|static|synchronized|native|default|strictfp)\s+)*"
+    r"(?:<[^<>]*(?:<[^<>]*>[^<>]*)*>\s*)?"
+    r"(?P<ret>[\w.$]+(?:\s*<[^;{}]*?>)?(?:\s*\[\s*\])*\s+)?"
+    r"(?P<name>\w+)\s*\((?P<params>.*)\)\s*(?:throws\s+[\w.,\s]+)?$", re.S)
+FIELD_PATTERN = re.compile(
+    r"^\s*" + _ANNOS +
+    r"(?:(?:public|protected|private|static|final|transient|volatile)\s+)*"
+    r"(?P<type>[\w.$]+(?:\s*<[^;{}]*?>)?(?:\s*\[\s*\])*)\s+(?P<name>\w+)\s*(?:=.*)?$", re.S)
+# 参数 / 局部变量声明：Type name / Type<..> name
+VARIABLE_PATTERN = re.compile(r"\b(?P<type>[A-Z][\w$]*)(?:\s*<[^;=(){}]*?>)?(?:\s*\[\s*\])*\s+(?P<name>[a-z_$][\w$]*)\s*[=;:,)]")
+QUALIFIED_CALL_PATTERN = re.compile(r"\b(?P<recv>[A-Za-z_$][\w$]*)\s*\.\s*(?P<name>[A-Za-z_$][\w$]*)\s*\(")
+BARE_CALL_PATTERN = re.compile(r"(?<![\w$.])(?P<name>[a-z_$][\w$]*)\s*\(")
+CONSTANT_PATTERN = re.compile(r"\b([A-Z][A-Z0-9_]{2,})\b")
+# 值得进索引的字面量：交易码、路径、编号 (长 SQL / 提示文案不进)
+LITERAL_KEEP_PATTERN = re.compile(r"^[\w./:\-]{2,100}$")
+
+KEYWORDS = {"if", "for", "while", "switch", "catch", "synchronized", "try", "return", "new", "else", "do",
+            "throw", "super", "this", "case", "assert", "finally"}
+MAPPING_ANNOTATIONS = {"RequestMapping", "GetMapping", "PostMapping", "PutMapping", "DeleteMapping", "PatchMapping"}
+SQL_ANNOTATIONS = {"Select": "select", "Insert": "insert", "Update": "update", "Delete": "delete"}
+# 不当作项目内类型解析的常见 JDK / 框架类型
+COMMON_TYPES = {"String", "Object", "Integer", "Long", "Boolean", "Double", "BigDecimal", "List", "Map", "Set",
+                "Optional", "Stream", "Collectors", "Arrays", "Collections", "Objects", "System", "Math",
+                "StringBuilder", "Logger", "LoggerFactory", "LocalDate", "LocalDateTime", "Date", "UUID"}
+
+MAPPER_NAMESPACE_PATTERN = re.compile(r"<mapper\s+[^>]*namespace\s*=\s*\"([^\"]+)\"")
+MAPPER_STATEMENT_PATTERN = re.compile(
+    r"<(select|insert|update|delete)\b[^>]*?\bid\s*=\s*\"([^\"]+)\"[^>]*>(.*?)</\1\s*>", re.S | re.I)
+SQL_TABLE_PATTERN = re.compile(r"\b(?:from|join|into|update|table)\s+([`\"\[]?[A-Za-z_][\w.$]*[`\"\]]?)", re.I)
+SQL_NOT_TABLES = {"select", "set", "where", "dual", "values", "lateral", "unnest"}
+
+
+def _blank(text):
+    return re.sub(r"[^\n]", " ", text)
+
+
+def _line_of(newlines, pos):
+    return bisect.bisect_right(newlines, pos) + 1
+
+
+def sql_tables(sql):
+    tables = []
+    for m in SQL_TABLE_PATTERN.finditer(re.sub(r"<[^>]+>", " ", sql)):
+        name = m.group(1).strip("`\"[]")
+        if name.lower() not in SQL_NOT_TABLES and not name.startswith("#") and name not in tables:
+            tables.append(name)
+    return tables
+
+
+def _strip_generics(name):
+    return re.sub(r"<.*>", "", name).strip().split(".")[-1].replace("[]", "").strip()
+
+
+def _split_types(text):
+    """extends / implements 子句 -> 简单类名列表 (忽略泛型参数)"""
+    depth, buf, out = 0, [], []
+    for ch in text:
+        if ch == "<":
+            depth += 1
+        elif ch == ">":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            out.append("".join(buf))
+            buf = []
+            continue
+        if depth == 0 and ch != ">":
+            buf.append(ch)
+    out.append("".join(buf))
+    return [_strip_generics(t) for t in out if t.strip()]
+
+
+def _supers(rest):
+    rest = rest.split("{")[0]
+    m_ext = re.search(r"\bextends\s+(.+?)(?=\bimplements\b|$)", rest, re.S)
+    m_impl = re.search(r"\bimplements\s+(.+)$", rest, re.S)
+    return (_split_types(m_ext.group(1)) if m_ext else []) + (_split_types(m_impl.group(1)) if m_impl else [])
+
+
+def _role(annotations, name, kind):
+    if annotations & {"Controller", "RestController"} or name.endswith("Controller"):
+        return "controller"
+    if annotations & {"Mapper", "Repository"} or name.endswith(("Mapper", "Dao", "DAO", "Repository")):
+        return "mapper"
+    if "Service" in annotations or name.endswith(("Service", "ServiceImpl")):
+        return "service"
+    if annotations & {"Component", "Configuration"}:
+        return "component"
+    return "other"
+
+
+class _JavaParser:
+    """单个 .java 文件 -> 结构化结果 (只含基本类型，便于跨进程传回)"""
+
+    def __init__(self, source):
+        self.literals = []  # [(引号位置, 值)]
+        self.code = LEXICAL_PATTERN.sub(self._strip_token, source)
+        self.newlines = [i for i, ch in enumerate(self.code) if ch == "\n"]
+        self.literal_pos = [p for p, _ in self.literals]
+        m = PACKAGE_PATTERN.search(self.code)
+        self.package = m.group(1) if m else ""
+        self.imports = {name.split(".")[-1]: name for name in IMPORT_PATTERN.findall(self.code)}
+        self.result = {"classes": [], "methods": [], "calls": [], "literals": [], "refs": [], "statements": []}
+
+    def _strip_token(self, m):
+        text = m.group(0)
+        if text.startswith("/"):
+            return _blank(text)
+        if text.startswith('"'):
+            quote = 3 if text.startswith('"""') else 1
+            self.literals.append((m.start(), text[quote:len(text) - quote]))
+            return text[:quote] + _blank(text[quote:len(text) - quote]) + text[len(text) - quote:]
+        return "'" + " " * (len(text) - 2) + "'"
+
+    def line(self, pos):
+        return _line_of(self.newlines, pos)
+
+    def literals_in(self, start, end):
+        lo = bisect.bisect_left(self.literal_pos, start)
+        hi = bisect.bisect_left(self.literal_pos, end)
+        return self.literals[lo:hi]
+
+    def annotations(self, header, offset):
+        """[(简单名, 参数起止位置)]"""
+        m = re.match(r"\s*" + _ANNOS, header)
+        out = []
+        for a in ANNOTATION_PATTERN.finditer(header, 0, m.end("annos") if m else 0):
+            out.append((a.group(1).split(".")[-1], offset + a.start(), offset + a.end(), a.group(2) or ""))
+        return out
+
+    def fqcn(self, simple):
+        if simple in self.imports:
+            return self.imports[simple]
+        return f"{self.package}.{simple}" if self.package else simple
+
+    def parse(self):
+        code = self.code
+        stack = []  # [(kind, info, start)]；kind: type / method / block / inline
+        boundary = 0
+        for m in STRUCTURE_PATTERN.finditer(code):
+            ch, pos = m.group(0), m.start()
+            top = stack[-1] if stack else None
+            in_body = top is None or top[0] == "type"
+            header = code[boundary:pos]
+            if ch == "{":
+                if top is not None and top[0] == "inline":
+                    stack.append(("inline", None, pos))
+                    continue
+                if in_body and (header.count("(") > header.count(")") or header.rstrip().endswith(("=", ","))):
+                    # 注解数组参数 / 字段初始化中的 { }：不是声明边界
+                    stack.append(("inline", None, pos))
+                    continue
+                stack.append(self._open(top, header, boundary, pos))
+                boundary = pos + 1
+            elif ch == "}":
+                if not stack:
+                    boundary = pos + 1
+                    continue
+                kind, info, start = stack.pop()
+                if kind == "inline":
+                    continue
+                if kind == "type":
+                    info["end_line"] = self.line(pos)
+                elif kind == "method":
+                    info["end_line"] = self.line(pos)
+                    self._method_body(info, start, pos)
+                boundary = pos + 1
+            else:
+                if top is not None and top[0] == "inline":
+                    continue
+                if top is not None and top[0] == "type":
+                    self._member(top[1], header, boundary, pos)
+                boundary = pos + 1
+        self._collect_literals()
+        return self.result
+
+    def _open(self, top, header, offset, pos):
+        if top is None or top[0] == "type":
+            m = TYPE_PATTERN.match(header)
+            if m:
+                return ("type", self._add_type(m, top[1] if top else None, offset), pos)
+            if top is not None:
+                m = METHOD_PATTERN.match(header)
+                if m and m.group("name") not in KEYWORDS:
+                    return ("method", self._add_method(top[1], m, offset, pos), pos)
+        return ("block", None, pos)
+
+    def _add_type(self, m, outer, offset):
+        annos = self.annotations(m.group(0), offset)
+        names = {a[0] for a in annos}
+        name = m.group("name")
+        kind = "annotation" if m.group("kind") == "@interface" else m.group("kind")
+        prefix = outer["fqcn"] if outer else self.package
+        info = {"cid": len(self.result["classes"]), "fqcn": f"{prefix}.{name}" if prefix else name, "name": name,
+                "kind": kind, "role": _role(names, name, kind), "line": self.line(offset + m.start("name")),
+                "end_line": None, "supers": _supers(m.group("rest")), "fields": {}, "mapping": "",
+                "start": offset, "annos": annos}
+        for anno, a_start, a_end, _ in annos:
+            if anno in MAPPING_ANNOTATIONS:
+                lits = self.literals_in(a_start, a_end)
+                info["mapping"] = lits[0][1] if lits else ""
+        self.result["classes"].append(info)
+        return info
+
+    def _add_method(self, cls, m, offset, body_start, abstract=False):
+        annos = self.annotations(m.group(0), offset)
+        name = m.group("name")
+        mapping, tables = "", None
+        for anno, a_start, a_end, args in annos:
+            lits = self.literals_in(a_start, a_end)
+            if anno in MAPPING_ANNOTATIONS and lits:
+                mapping = cls["mapping"].rstrip("/") + "/" + lits[0][1].lstrip("/") if cls["mapping"] else lits[0][1]
+            if anno in SQL_ANNOTATIONS and lits:
+                tables = (SQL_ANNOTATIONS[anno], sql_tables(" ".join(v for _, v in lits)))
+            for const in CONSTANT_PATTERN.findall(args):
+                self.result["refs"].append((const, len(self.result["methods"])))
+        params = m.group("params")
+        info = {"mid": len(self.result["methods"]), "cid": cls["cid"], "name": name,
+                "line": self.line(offset + m.start("name")), "end_line": None if not abstract else self.line(body_start),
+                "mapping": mapping, "signature": re.sub(r"\s+", " ", f"{name}({params.strip()})")[:300],
+                "params": params, "start": offset, "abstract": abstract}
+        self.result["methods"].append(info)
+        if tables is not None:
+            self.result["statements"].append((cls["fqcn"], name, tables[0], ",".join(tables[1]), info["line"]))
+        return info
+
+    def _member(self, cls, header, offset, pos):
+        """类体中以 ; 结尾的成员：字段 (记录类型用于解析调用) 或 接口 / 抽象方法"""
+        m = METHOD_PATTERN.match(header)
+        if m and m.group("ret") and m.group("name") not in KEYWORDS and "=" not in header[:m.start("params")]:
+            self._add_method(cls, m, offset, pos, abstract=True)
+            return
+        m = FIELD_PATTERN.match(header)
+        if m:
+            cls["fields"][m.group("name")] = _strip_generics(m.group("type"))
+            cls.setdefault("field_spans", []).append((offset, pos, m.group("name")))
+
+    def _method_body(self, method, start, end):
+        cls = self.result["classes"][method["cid"]]
+        body = self.code[start:end]
+        types = dict(cls["fields"])
+        for scope in (method["params"], body):
+            for v in VARIABLE_PATTERN.finditer(scope + ")"):
+                types.setdefault(v.group("name"), v.group("type"))
+        calls = self.result["calls"]
+        seen = set()
+        for c in QUALIFIED_CALL_PATTERN.finditer(body):
+            recv, name = c.group("recv"), c.group("name")
+            if recv == "this":
+                continue
+            recv_type = types.get(recv) or (recv if recv[0].isupper() else None)
+            if recv_type is None or recv_type in COMMON_TYPES or (recv_type, name) in seen:
+                continue
+            seen.add((recv_type, name))
+            calls.append((method["mid"], self.fqcn(recv_type), recv_type, name, self.line(start + c.start("name"))))
+        for c in BARE_CALL_PATTERN.finditer(body):
+            name = c.group("name")
+            before = body[max(0, c.start() - 4):c.start()]
+            if name in KEYWORDS or before.endswith("new ") or (cls["name"], name) in seen:
+                continue
+            seen.add((cls["name"], name))
+            calls.append((method["mid"], cls["fqcn"], cls["name"], name, self.line(start + c.start("name"))))
+
+    def _collect_literals(self):
+        """字面量归属：所在方法 (含方法注解) / 所在常量字段 / 所在类；字面量按位置有序，一次扫描完成"""
+        methods = sorted((m["start"], self._end_pos(m), m["mid"], m["cid"]) for m in self.result["methods"])
+        fields = sorted((s, e, name, c["cid"]) for c in self.result["classes"] for s, e, name in c.get("field_spans", ()))
+        classes = sorted((c["start"], c["cid"]) for c in self.result["classes"])
+        class_starts = [s for s, _ in classes]
+        kept = [(pos, value.strip()) for pos, value in self.literals if LITERAL_KEEP_PATTERN.match(value.strip())]
+        positions = [pos for pos, _ in kept]
+        for (pos, value), method, field in zip(kept, _innermost(methods, positions), _innermost(fields, positions)):
+            cid, mid, name = None, None, None
+            if method is not None:
+                mid, cid = method[2], method[3]
+            elif field is not None:
+                name, cid = field[2], field[3]
+            else:
+                k = bisect.bisect_right(class_starts, pos)
+                cid = classes[k - 1][1] if k else None
+            self.result["literals"].append((value, cid, mid, name, self.line(pos)))
+
+    def _end_pos(self, method):
+        end_line = method["end_line"] or method["line"]
+        return self.newlines[end_line - 1] if end_line - 1 < len(self.newlines) else len(self.code)
+
+
+def _innermost(spans, positions):
+    """spans 为按起点排序的 (start, end, ...)，互相嵌套或不相交；对升序的每个位置给出包含它的最内层 span"""
+    stack, i = [], 0
+    for pos in positions:
+        while i < len(spans) and spans[i][0] <= pos:
+            stack.append(spans[i])
+            i += 1
+        while stack and stack[-1][1] < pos:
+            stack.pop()
+        yield stack[-1] if stack else None
+
+
+def parse_java(source):
+    result = _JavaParser(source).parse()
+    classes = [(c["cid"], c["fqcn"], c["name"], c["kind"], c["role"], c["line"], c["end_line"], c["supers"])
+               for c in result["classes"]]
+    methods = [(m["mid"], m["cid"], m["name"], m["line"], m["end_line"], m["mapping"], m["signature"])
+               for m in result["methods"]]
+    return {"classes": classes, "methods": methods, "calls": result["calls"], "literals": result["literals"],
+            "refs": result["refs"], "statements": result["statements"]}
+
+
+def parse_mapper_xml(source):
+    result = {"classes": [], "methods": [], "calls": [], "literals": [], "refs": [], "statements": []}
+    m = MAPPER_NAMESPACE_PATTERN.search(source)
+    if m is None:
+        return result
+    namespace = m.group(1)
+    for s in MAPPER_STATEMENT_PATTERN.finditer(source):
+        line = source.count("\n", 0, s.start()) + 1
+        result["statements"].append((namespace, s.group(2), s.group(1).lower(), ",".join(sql_tables(s.group(3))), line))
+    return result
+
+
+def _parse_task(args):
+    """进程池任务：读文件、算 sha1；内容与已索引的一致时不解析"""
+    path, rel, known_sha1 = args
+    with open(path, "rb") as f:
+        raw = f.read()
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if sha1 == known_sha1:
+        return rel, sha1, None
+    text = raw.decode("utf-8", errors="replace")
+    try:
+        parsed = parse_java(text) if rel.endswith(".java") else parse_mapper_xml(text)
+    except RecursionError:
+        parsed = {"classes": [], "methods": [], "calls": [], "literals": [], "refs": [], "statements": []}
+    return rel, sha1, parsed
+
+
+def default_db_path(project_dir, cache_dir=CACHE_DIR):
+    """每个工程目录一个索引库 (按绝对路径哈希区分，scripts 下的 CLI 与 app.py 共用同一个库)"""
+    digest = hashlib.sha1(os.path.abspath(project_dir).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(cache_dir, f"code_index_{digest}.sqlite")
+
+
+class CodeIndex:
+    def __init__(self, project_dir=DEFAULT_PROJECT_DIR, db_path=None, workers=None):
+        self.project_dir = project_dir
+        self.db_path = db_path or default_db_path(project_dir)
+        self.workers = workers
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,
+                mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, sha1 TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS classes (
+                class_id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, fqcn TEXT NOT NULL, name TEXT NOT NULL,
+                kind TEXT NOT NULL, role TEXT NOT NULL, line INTEGER, end_line INTEGER);
+            CREATE TABLE IF NOT EXISTS supers (class_id INTEGER NOT NULL, file_id INTEGER NOT NULL, super_name TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS methods (
+                method_id INTEGER PRIMARY KEY, class_id INTEGER NOT NULL, file_id INTEGER NOT NULL, name TEXT NOT NULL,
+                line INTEGER, end_line INTEGER, mapping TEXT, signature TEXT);
+            CREATE TABLE IF NOT EXISTS calls (
+                method_id INTEGER NOT NULL, file_id INTEGER NOT NULL, recv_fqcn TEXT, recv_type TEXT NOT NULL,
+                callee TEXT NOT NULL, line INTEGER);
+            CREATE TABLE IF NOT EXISTS literals (
+                value TEXT NOT NULL, file_id INTEGER NOT NULL, class_id INTEGER, method_id INTEGER, field TEXT, line INTEGER);
+            CREATE TABLE IF NOT EXISTS refs (name TEXT NOT NULL, file_id INTEGER NOT NULL, method_id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS statements (
+                file_id INTEGER NOT NULL, namespace TEXT NOT NULL, statement_id TEXT NOT NULL, kind TEXT,
+                tables TEXT, line INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_classes_name ON classes (name);
+            CREATE INDEX IF NOT EXISTS idx_classes_fqcn ON classes (fqcn);
+            CREATE INDEX IF NOT EXISTS idx_classes_file ON classes (file_id);
+            CREATE INDEX IF NOT EXISTS idx_supers_name ON supers (super_name);
+            CREATE INDEX IF NOT EXISTS idx_supers_file ON supers (file_id);
+            CREATE INDEX IF NOT EXISTS idx_methods_class ON methods (class_id, name);
+            CREATE INDEX IF NOT EXISTS idx_methods_name ON methods (name);
+            CREATE INDEX IF NOT EXISTS idx_methods_file ON methods (file_id);
+            CREATE INDEX IF NOT EXISTS idx_calls_method ON calls (method_id);
+            CREATE INDEX IF NOT EXISTS idx_calls_file ON calls (file_id);
+            CREATE INDEX IF NOT EXISTS idx_literals_value ON literals (value);
+            CREATE INDEX IF NOT EXISTS idx_literals_file ON literals (file_id);
+            CREATE INDEX IF NOT EXISTS idx_literals_field ON literals (field);
+            CREATE INDEX IF NOT EXISTS idx_refs_name ON refs (name);
+            CREATE INDEX IF NOT EXISTS idx_refs_file ON refs (file_id);
+            CREATE INDEX IF NOT EXISTS idx_statements_key ON statements (namespace, statement_id);
+            CREATE INDEX IF NOT EXISTS idx_statements_file ON statements (file_id);
+        """)
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def list_source_files(self):
+        """工程目录下的 .java 与 .xml (相对路径，按路径排序)"""
+        out = []
+        for root, dirs, files in os.walk(self.project_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in files:
+                if name.endswith((".java", ".xml")):
+                    out.append(os.path.relpath(os.path.join(root, name), self.project_dir))
+        return sorted(out)
+
+    def refresh(self):
+        """增量更新索引，返回 {"files", "parsed", "unchanged", "removed", "elapsed_ms"}"""
+        t0 = time.perf_counter()
+        with self._lock:
+            known = {row[1]: row for row in self._conn.execute("SELECT file_id, path, mtime_ns, size, sha1 FROM files")}
+            paths = self.list_source_files() if os.path.isdir(self.project_dir) else []
+            removed = set(known) - set(paths)
+            for rel in removed:
+                self._drop_file(known[rel][0])
+
+            tasks, stats = [], {}
+            for rel in paths:
+                path = os.path.join(self.project_dir, rel)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                stats[rel] = (st.st_mtime_ns, st.st_size)
+                row = known.get(rel)
+                if row is not None and (row[2], row[3]) == stats[rel]:
+                    continue
+                tasks.append((path, rel, row[4] if row is not None else None))
+
+            parsed = 0
+            for rel, sha1, result in self._run_tasks(tasks):
+                mtime_ns, size = stats[rel]
+                row = known.get(rel)
+                if result is None:
+                    # 只是 mtime 变了 (如 git checkout)，内容未变
+                    self._conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE file_id = ?",
+                                       (mtime_ns, size, row[0]))
+                    continue
+                if row is not None:
+                    self._drop_file(row[0])
+                cur = self._conn.execute("INSERT INTO files (path, mtime_ns, size, sha1) VALUES (?, ?, ?, ?)",
+                                         (rel, mtime_ns, size, sha1))
+                self._store(cur.lastrowid, result)
+                parsed += 1
+            self._conn.commit()
+        return {"files": len(paths), "parsed": parsed, "unchanged": len(paths) - parsed, "removed": len(removed),
+                "elapsed_ms": (time.perf_counter() - t0) * 1000}
+
+    def _run_tasks(self, tasks):
+        if len(tasks) >= PARALLEL_MIN_FILES and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                yield from executor.map(_parse_task, tasks, chunksize=PARSE_CHUNKSIZE)
+        else:
+            for task in tasks:
+                yield _parse_task(task)
+
+    def _drop_file(self, file_id):
+        for table in ("files", "classes", "supers", "methods", "calls", "literals", "refs", "statements"):
+            self._conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+
+    def _store(self, file_id, result):
+        """把解析结果中的局部编号换成数据库 ID 后写入"""
+        conn = self._conn
+        class_ids, method_ids = {}, {}
+        for cid, fqcn, name, kind, role, line, end_line, supers in result["classes"]:
+            cur = conn.execute("INSERT INTO classes (file_id, fqcn, name, kind, role, line, end_line) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)", (file_id, fqcn, name, kind, role, line, end_line))
+            class_ids[cid] = cur.lastrowid
+            conn.executemany("INSERT INTO supers (class_id, file_id, super_name) VALUES (?, ?, ?)",
+                             [(cur.lastrowid, file_id, s) for s in supers])
+        for mid, cid, name, line, end_line, mapping, signature in result["methods"]:
+            cur = conn.execute("INSERT INTO methods (class_id, file_id, name, line, end_line, mapping, signature) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (class_ids[cid], file_id, name, line, end_line, mapping, signature))
+            method_ids[mid] = cur.lastrowid
+        conn.executemany("INSERT INTO calls (method_id, file_id, recv_fqcn, recv_type, callee, line) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(method_ids[mid], file_id, fq, t, callee, line) for mid, fq, t, callee, line in result["calls"]])
+        conn.executemany("INSERT INTO literals (value, file_id, class_id, method_id, field, line) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(v, file_id, class_ids.get(cid), method_ids.get(mid), field, line)
+                          for v, cid, mid, field, line in result["literals"]])
+        conn.executemany("INSERT INTO refs (name, file_id, method_id) VALUES (?, ?, ?)",
+                         [(name, file_id, method_ids[mid]) for name, mid in result["refs"]])
+        conn.executemany("INSERT INTO statements (file_id, namespace, statement_id, kind, tables, line) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", [(file_id,) + tuple(s) for s in result["statements"]])
+
+    def stats(self):
+        with self._lock:
+            counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("files", "classes", "methods", "calls", "statements")}
+        return counts
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    _METHOD_COLUMNS = ("SELECT m.method_id, m.name, m.line, m.end_line, m.mapping, m.signature, "
+                       "c.class_id, c.fqcn, c.name, c.kind, c.role, f.path "
+                       "FROM methods m JOIN classes c ON c.class_id = m.class_id JOIN files f ON f.file_id = m.file_id ")
+
+    @staticmethod
+    def _method_row(row):
+        keys = ("method_id", "method", "line", "end_line", "mapping", "signature", "class_id", "fqcn", "class",
+                "kind", "role", "path")
+        return dict(zip(keys, row))
+
+    def find_entries(self, query, limit=20):
+        """交易码 / 常量 / URL 路径 / 方法名 / 类名 -> 入口方法 (controller 优先)"""
+        query = query.strip()
+        if not query:
+            return []
+        conn = self._conn
+        method_ids, reasons = [], {}
+
+        def add(ids, reason):
+            for (mid,) in ids:
+                if mid is not None and mid not in reasons:
+                    reasons[mid] = reason
+                    method_ids.append(mid)
+
+        with self._lock:
+            # 1. 字面量：方法体 / 方法注解中直接出现
+            rows = conn.execute("SELECT method_id, class_id, field FROM literals WHERE value = ?", (query,)).fetchall()
+            add([(r[0],) for r in rows], "字面量")
+            # 1'. 查询的是常量名 (如 TX_APPROVAL)：换成常量值，再找直接写该值的方法
+            for (value,) in conn.execute("SELECT DISTINCT value FROM literals WHERE field = ?", (query,)).fetchall():
+                value_rows = conn.execute("SELECT method_id, class_id, field FROM literals WHERE value = ?",
+                                          (value,)).fetchall()
+                add([(r[0],) for r in value_rows], f"常量 {query} = {value}")
+                rows.extend(value_rows)
+            # 2. 字面量定义在常量字段上 (或直接查常量名)：找注解中引用该常量的方法
+            add(conn.execute("SELECT method_id FROM refs WHERE name = ?", (query,)), f"常量 {query}")
+            for _, _, field in rows:
+                if field:
+                    add(conn.execute("SELECT method_id FROM refs WHERE name = ?", (field,)), f"常量 {field}")
+            # 3. 类级别字面量 (如类上的 @RequestMapping)：取该类所有带路径的方法
+            for _, class_id, field in rows:
+                if class_id is not None and not field:
+                    add(conn.execute("SELECT method_id FROM methods WHERE class_id = ? AND mapping != ''", (class_id,)),
+                        "类注解")
+            # 4. 方法名 / 类名 / 路径
+            add(conn.execute("SELECT method_id FROM methods WHERE name = ?", (query,)), "方法名")
+            add(conn.execute("SELECT m.method_id FROM methods m JOIN classes c ON c.class_id = m.class_id "
+                             "WHERE c.name = ?", (query,)), "类名")
+            if not method_ids and ("/" in query or "_" in query):
+                add(conn.execute("SELECT method_id FROM methods WHERE mapping LIKE ? LIMIT ?",
+                                 (f"%{query}%", limit)), "请求路径")
+            if not method_ids:
+                return []
+            placeholders = ",".join("?" * len(method_ids[:500]))
+            rows = conn.execute(self._METHOD_COLUMNS + f"WHERE m.method_id IN ({placeholders})", method_ids[:500])
+            entries = [dict(self._method_row(r), reason=reasons[r[0]]) for r in rows]
+        role_rank = {"controller": 0, "service": 1, "component": 2, "other": 3, "mapper": 4}
+        order = {mid: i for i, mid in enumerate(method_ids)}
+        entries.sort(key=lambda e: (role_rank.get(e["role"], 9), order[e["method_id"]]))
+        return entries[:limit]
+
+    def _resolve(self, recv_fqcn, recv_type, callee):
+        """调用目标：按 全限定名 (退化到简单名) 找类，接口再展开到实现类，返回被调方法行"""
+        conn = self._conn
+        classes = conn.execute("SELECT class_id, name, kind, fqcn FROM classes WHERE fqcn = ?", (recv_fqcn,)).fetchall()
+        if not classes:
+            classes = conn.execute("SELECT class_id, name, kind, fqcn FROM classes WHERE name = ?", (recv_type,)).fetchall()
+        targets = []
+        for class_id, name, kind, _ in classes:
+            impls = []
+            if kind == "interface":
+                impls = conn.execute("SELECT s.class_id FROM supers s JOIN classes c ON c.class_id = s.class_id "
+                                     "WHERE s.super_name = ? AND c.kind != 'interface'", (name,)).fetchall()
+            for (cid,) in impls or [(class_id,)]:
+                targets += conn.execute(self._METHOD_COLUMNS + "WHERE m.class_id = ? AND m.name = ?",
+                                        (cid, callee)).fetchall()
+            if impls and not targets:
+                # 实现类里没找到 (如默认方法)，退回接口本身
+                targets += conn.execute(self._METHOD_COLUMNS + "WHERE m.class_id = ? AND m.name = ?",
+                                        (class_id, callee)).fetchall()
+        return [self._method_row(r) for r in targets]
+
+    def _statements(self, node):
+        rows = self._conn.execute(
+            "SELECT s.kind, s.tables, f.path, s.line FROM statements s JOIN files f ON f.file_id = s.file_id "
+            "WHERE s.namespace = ? AND s.statement_id = ?", (node["fqcn"], node["method"])).fetchall()
+        return [{"kind": k, "tables": [t for t in (tables or "").split(",") if t], "path": p, "line": line}
+                for k, tables, p, line in rows]
+
+    def call_chain(self, method_id, max_depth=CHAIN_MAX_DEPTH, max_nodes=CHAIN_MAX_NODES):
+        """
+        从入口方法沿调用边广度优先展开，返回 {"nodes": {method_id: 节点}, "edges": [(调用方, 被调方, 行号)]}
+        节点含 类 / 方法 / 角色 / 文件 / 行号；mapper 方法附带 MyBatis 语句与表名
+        只展开落在工程内的调用 (JDK / 第三方库的调用解析不到类，自然被忽略)
+        """
+        with self._lock:
+            row = self._conn.execute(self._METHOD_COLUMNS + "WHERE m.method_id = ?", (method_id,)).fetchone()
+            if row is None:
+                return {"nodes": {}, "edges": []}
+            root = self._method_row(row)
+            nodes, edges = {method_id: dict(root, depth=0)}, []
+            frontier = [method_id]
+            for depth in range(1, max_depth + 1):
+                next_frontier = []
+                for caller in frontier:
+                    calls = self._conn.execute("SELECT recv_fqcn, recv_type, callee, line FROM calls WHERE method_id = ? "
+                                               "ORDER BY line", (caller,)).fetchall()
+                    for recv_fqcn, recv_type, callee, line in calls:
+                        for target in self._resolve(recv_fqcn, recv_type, callee):
+                            tid = target["method_id"]
+                            if tid == caller:
+                                continue
+                            edges.append((caller, tid, line))
+                            if tid in nodes or len(nodes) >= max_nodes:
+                                continue
+                            nodes[tid] = dict(target, depth=depth)
+                            next_frontier.append(tid)
+                frontier = next_frontier
+                if not frontier:
+                    break
+            for node in nodes.values():
+                node["statements"] = self._statements(node)
+        return {"nodes": nodes, "edges": edges}
+
+    def lookup(self, query, max_depth=CHAIN_MAX_DEPTH):
+        """交易码 -> [(入口方法, 调用链)]；返回 (结果, 耗时 ms)"""
+        t0 = time.perf_counter()
+        entries = self.find_entries(query)
+        # 同一条链上已经出现过的方法不再作为独立入口
+        results, covered = [], set()
+        for entry in entries:
+            if entry["method_id"] in covered:
+                continue
+            chain = self.call_chain(entry["method_id"], max_depth)
+            covered.update(chain["nodes"])
+            results.append((entry, chain))
+        return results, (time.perf_counter() - t0) * 1000
+
+    def snippet(self, node, max_lines=40):
+        """读取方法源码 (最多 max_lines 行)"""
+        path = os.path.join(self.project_dir, node["path"])
+        start, end = node["line"], node.get("end_line") or node["line"]
+        end = min(end, start + max_lines - 1)
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.readlines()
+        except OSError:
+            return ""
+        return "".join(lines[start - 1:end])
+
+
+def chain_tables(chain):
+    """调用链涉及的表 -> 操作类型集合"""
+    tables = {}
+    for node in chain["nodes"].values():
+        for s in node["statements"]:
+            for t in s["tables"]:
+                tables.setdefault(t, set()).add(s["kind"])
+    return tables
+
+
+def render_chain(chain, root_id):
+    """调用链 -> 缩进的 Markdown 列表 (深度优先，重复出现的节点只展开一次)"""
+    children = {}
+    for caller, callee, line in chain["edges"]:
+        if callee not in [c for c, _ in children.get(caller, [])]:
+            children.setdefault(caller, []).append((callee, line))
+    lines, expanded = [], set()
+
+    def visit(mid, depth, line):
+        node = chain["nodes"].get(mid)
+        if node is None:
+            return
+        at = f" (调用处第 {line} 行)" if line else ""
+        route = f" `{node['mapping']}`" if node.get("mapping") else ""
+        lines.append(f"{'  ' * depth}- **[{node['role']}]** `{node['class']}.{node['method']}()`{route} — "
+                     f"{node['path']}:{node['line']}{at}")
+        for s in node["statements"]:
+            lines.append(f"{'  ' * (depth + 1)}- 🗄️ {s['kind'].upper()} {', '.join(s['tables']) or '(未识别表名)'}"
+                         f" — {s['path']}:{s['line']}")
+        if mid in expanded:
+            return
+        expanded.add(mid)
+        for child, child_line in children.get(mid, []):
+            if child not in expanded:
+                visit(child, depth + 1, child_line)
+
+    visit(root_id, 0, None)
+    return "\n".join(lines)
@@ -0,0 +1,29 @@
+"""
+故障诊断的日志聚合与 Prompt (诊断页、scripts/batch_diagnose.py、scripts/loadtest.py 共用)
+
+三处必须完全一致：Prompt 文本是回答缓存键的一部分，批量诊断才能与页面共享缓存；
+压测才能真实反映页面的检索路径与 Prompt 长度。
+"""
+from core import log_index, log_timeline
+
+DIAGNOSIS_PROMPT = """
+            你是一个金融级分布式系统架构师。请分析以下聚合的跨系统日志：
+            ```log
+            {log_content}
+            ```
+            请输出 Markdown 格式的诊断报告，包含：1.链路拓扑 2.根因分析 3.修复建议。
+            请保持专业、客观。
+            """
+
+
+def build_prompt(log_content):
+    return DIAGNOSIS_PROMPT.format(log_content=log_content)
+
+
+def aggregate_logs(index, log_dir, trace_id, start=None, end=None, context_lines=0):
+    """
+    检索 trace_id 的日志 (完整编号走倒排索引 + gzip 归档扫描，其余走全量扫描)，按时间归并为跨服务 Timeline
+    start / end 为可选时间范围，如 "2026-01-31 10:00"；context_lines 为每个命中行前后附带的上下文行数
+    """
+    hits = log_index.search_hits(index, log_dir, trace_id, start, end)
+    return log_timeline.build_timeline(trace_id, log_dir, hits, context_lines, context_lines)
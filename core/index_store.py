@@ -0,0 +1,361 @@
+"""
+二进制知识库索引 (替代巨型 knowledge_index.json)
+
+目录布局 (默认 public/knowledge_index/)：
+    header.json   元信息：切片数、维度、向量精度、是否已归一化、Embedding 模型
+    vectors.bin   向量块 (N x D，float32 / float16 / int8，行已 L2 归一化)，np.memmap 只读打开
+    vectors_exact.bin  量化索引 (float16 / int8) 额外保留的 float32 原始向量，只在精确重排时按行读取
+    scales.npy    int8 索引的逐维缩放系数 (见 core/quantize.py)
+    offsets.npy   int64[N+1]，第 i 个切片文本在 texts.bin 中的字节区间
+    texts.bin     所有切片文本 (UTF-8) 顺序拼接
+    meta.jsonl    每行一个切片的元数据 {"id": ..., "source": 源文件路径, "page": 页码 (非分页文档为 null)}
+    lexical.json / lex_*   BM25 倒排索引 (见 core/lexical_index.py)
+    ivf.json / ivf_*       可选的 IVF 近似最近邻索引 (见 core/ann_index.py)
+
+向量和文本都按需 mmap，多个会话 / 进程共享同一份操作系统页缓存，冷启动不再需要解析 JSON。
+"""
+import json
+import mmap
+import os
+import shutil
+import time
+
+import numpy as np
+
+from core import ann_index, lexical_index, quantize
+
+FORMAT_VERSION = 1
+DEFAULT_INDEX_DIR = os.path.join("public", "knowledge_index")
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+EXACT_VECTORS_FILE = "vectors_exact.bin"
+SCALES_FILE = "scales.npy"
+OFFSETS_FILE = "offsets.npy"
+TEXTS_FILE = "texts.bin"
+META_FILE = "meta.jsonl"
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+def index_exists(index_dir=DEFAULT_INDEX_DIR):
+    return os.path.exists(os.path.join(index_dir, HEADER_FILE))
+
+
+def read_header(index_dir=DEFAULT_INDEX_DIR):
+    with open(os.path.join(index_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class KnowledgeIndex:
+    """
+    只读知识库：index[i] 返回 {"id", "content", "source", "page", "vector"}，
+    vector 为全精度向量 (有原始向量副本时取副本，int8 无副本时反量化)
+
+    元数据按列紧凑存放 (id 元组 + 来源字典编码 + 页码数组)，不为每个切片保留一个 dict；
+    向量数组设为只读，整个对象可以放心地在所有会话之间共享
+    """
+
+    def __init__(self, header, vectors, offsets, texts, meta, lexical=None, ann=None, scales=None,
+                 exact_vectors=None):
+        self.header = header
+        self.lexical = lexical
+        self.ann = ann
+        self.vectors = vectors
+        self.scales = scales
+        self.exact_vectors = exact_vectors
+        self.offsets = offsets
+        if isinstance(vectors, np.ndarray) and not isinstance(vectors, np.memmap):
+            vectors.flags.writeable = False
+        self._texts = texts
+        self._ids, self._sources, self._source_codes, self._pages = _compact_meta(meta)
+
+    @classmethod
+    def open(cls, index_dir=DEFAULT_INDEX_DIR):
+        header = read_header(index_dir)
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的索引版本: {header.get('version')}")
+
+        count, dim = header["count"], header["dim"]
+        if count:
+            vectors = np.memmap(os.path.join(index_dir, VECTORS_FILE), dtype=header["dtype"],
+                                mode="r", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=header["dtype"])
+        scales = None
+        if header["dtype"] == "int8":
+            scales = np.load(os.path.join(index_dir, SCALES_FILE))
+        exact_vectors = None
+        if header.get("exact") and count:
+            exact_vectors = np.memmap(os.path.join(index_dir, EXACT_VECTORS_FILE), dtype=np.float32,
+                                      mode="r", shape=(count, dim))
+        offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+
+        texts_path = os.path.join(index_dir, TEXTS_FILE)
+        if os.path.getsize(texts_path):
+            with open(texts_path, "rb") as f:
+                texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            texts = b""
+
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = [json.loads(line) for line in f if line.strip()]
+        lexical = None
+        if lexical_index.lexical_index_exists(index_dir):
+            lexical = lexical_index.LexicalIndex.open(index_dir)
+        ann = ann_index.IvfIndex.open(index_dir, expected_count=count)
+        return cls(header, vectors, offsets, texts, meta, lexical, ann, scales, exact_vectors)
+
+    @classmethod
+    def from_records(cls, records, dtype="float32"):
+        """由旧版 JSON 记录列表在内存中构建 (兼容尚未转换的 knowledge_index.json)"""
+        texts, offsets, meta, vectors = [], [0], [], []
+        for rec in records:
+            data = rec["content"].encode("utf-8")
+            texts.append(data)
+            offsets.append(offsets[-1] + len(data))
+            meta.append({"id": rec["id"], "source": rec.get("source", ""), "page": rec.get("page")})
+            vectors.append(rec.get("vector") or [])
+
+        dim = len(vectors[0]) if vectors else 0
+        if vectors and all(len(v) == dim for v in vectors):
+            matrix = _normalize(np.asarray(vectors, dtype=np.float32)).astype(dtype)
+        else:
+            dim, matrix = 0, np.zeros((len(meta), 0), dtype=dtype)
+        header = _make_header(len(meta), dim, dtype)
+        lexical = lexical_index.LexicalIndex.from_texts(rec["content"] for rec in records)
+        return cls(header, matrix, np.asarray(offsets, dtype=np.int64), b"".join(texts), meta, lexical)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        rec = self.meta(i)
+        rec["content"] = self.content(i)
+        if self.has_vectors:
+            rec["vector"] = self.vector(i)
+        return rec
+
+    def vector(self, i):
+        if self.exact_vectors is not None:
+            return self.exact_vectors[i]
+        if self.scales is not None:
+            return self.vectors[i].astype(np.float32) * self.scales
+        return self.vectors[i]
+
+    def meta(self, i):
+        page = int(self._pages[i])
+        return {"id": self._ids[i], "source": self._sources[self._source_codes[i]],
+                "page": None if page < 0 else page}
+
+    def iter_meta(self):
+        """只遍历元数据 (不解码文本、不触碰向量)"""
+        for i in range(len(self)):
+            yield self.meta(i)
+
+    def close(self):
+        """释放 mmap 引用 (Windows 下替换索引目录前必须先关闭)"""
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self.vectors = self.offsets = self.lexical = self.ann = self.exact_vectors = None
+        self._texts = b""
+
+    @property
+    def has_vectors(self):
+        return self.header["dim"] > 0
+
+    def content(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self._texts[start:end].decode("utf-8")
+
+
+def _compact_meta(meta):
+    """[{"id", "source", "page"}] -> (ids, 来源表, 来源编号数组, 页码数组 (无页码为 -1))"""
+    ids, sources, codes, pages = [], {}, [], []
+    for m in meta:
+        ids.append(m["id"])
+        codes.append(sources.setdefault(m.get("source", ""), len(sources)))
+        page = m.get("page")
+        pages.append(-1 if page is None else page)
+    return (tuple(ids), tuple(sources), np.asarray(codes, dtype=np.int32),
+            np.asarray(pages, dtype=np.int32))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _make_header(count, dim, dtype, model="", exact=False, ann_lists=None):
+    """ann_lists 为构建时请求的 IVF 桶数 (0 = 自动，None = 未构建)，增量构建时据此沿用"""
+    return {
+        "version": FORMAT_VERSION,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "normalized": True,
+        "exact": exact,
+        "model": model,
+        "ann_lists": ann_lists,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def update_header(index_dir=DEFAULT_INDEX_DIR, **fields):
+    """
+    原地更新 header.json (写临时文件后 os.replace)，并记录 updated_at
+    用于在已有索引上单独重建附属文件 (如 build_ann.py 重建 IVF) 之后，让 KnowledgeStore 的指纹发生变化、热加载新索引
+    """
+    path = os.path.join(index_dir, HEADER_FILE)
+    header = read_header(index_dir)
+    header.update(fields, updated_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return header
+
+
+class IndexWriter:
+    """
+    流式写入器：切片逐条追加，向量 / 文本直接落盘，不在内存里攒整个知识库
+    先写到临时目录，close() 时整体替换旧索引，读者不会看到写了一半的文件
+    lexical=True 时同时构建 BM25 倒排索引 (词表在内存中累积，close() 时写出)
+    ann_lists 不为 None 时在 close() 中基于写好的向量训练 IVF 索引 (0 表示按切片数自动选择桶数)
+    dtype 为 float16 / int8 时默认另存一份 float32 原始向量用于精确重排 (keep_exact=False 不保留)；
+    int8 的逐维缩放系数需要看过全部向量才能确定，所以先写原始向量，close() 时再分块量化
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, dim=384, dtype="float32", model="", lexical=True,
+                 ann_lists=None, keep_exact=True):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        self.index_dir = index_dir
+        self.dim = dim
+        self.dtype = dtype
+        self.model = model
+        self.count = 0
+        self.ann_lists = ann_lists
+        self.ann = None
+        self.keep_exact = keep_exact and dtype != "float32"
+
+        self._tmp_dir = index_dir.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._vectors = open(os.path.join(self._tmp_dir, VECTORS_FILE), "wb") if dtype != "int8" else None
+        self._exact = None
+        if self.keep_exact or dtype == "int8":
+            self._exact = open(os.path.join(self._tmp_dir, EXACT_VECTORS_FILE), "wb")
+        self._texts = open(os.path.join(self._tmp_dir, TEXTS_FILE), "wb")
+        self._meta = open(os.path.join(self._tmp_dir, META_FILE), "w", encoding="utf-8")
+        self._offsets = [0]
+        self._lexical = lexical_index.LexicalIndexBuilder() if lexical else None
+
+    def add(self, chunk_id, content, vector, source="", page=None):
+        self.add_batch([chunk_id], [content], [vector], [source], [page])
+
+    def add_batch(self, chunk_ids, contents, vectors, sources, pages=None):
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(chunk_ids), self.dim))
+        if self._vectors is not None:
+            self._vectors.write(matrix.astype(self.dtype).tobytes())
+        if self._exact is not None:
+            self._exact.write(matrix.tobytes())
+        pages = pages or [None] * len(chunk_ids)
+        for chunk_id, content, source, page in zip(chunk_ids, contents, sources, pages):
+            data = content.encode("utf-8")
+            self._texts.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            meta = {"id": chunk_id, "source": source, "page": page}
+            self._meta.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            if self._lexical is not None:
+                self._lexical.add(content)
+        self.count += len(chunk_ids)
+
+    def _close_files(self):
+        for f in (self._vectors, self._exact, self._texts, self._meta):
+            if f is not None:
+                f.close()
+
+    def _quantize_int8(self):
+        """按原始向量计算逐维缩放系数，再分块量化写出 vectors.bin"""
+        exact = np.zeros((0, self.dim), dtype=np.float32)
+        if self.count:
+            exact = np.memmap(os.path.join(self._tmp_dir, EXACT_VECTORS_FILE), dtype=np.float32, mode="r",
+                              shape=(self.count, self.dim))
+        scales = quantize.int8_scales(exact)
+        with open(os.path.join(self._tmp_dir, VECTORS_FILE), "wb") as f:
+            for start in range(0, self.count, quantize.SCORE_BLOCK_ROWS):
+                f.write(quantize.quantize_int8(exact[start:start + quantize.SCORE_BLOCK_ROWS], scales).tobytes())
+        np.save(os.path.join(self._tmp_dir, SCALES_FILE), scales)
+        del exact
+
+    def close(self):
+        self._close_files()
+        if self.dtype == "int8":
+            self._quantize_int8()
+        np.save(os.path.join(self._tmp_dir, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        if self._lexical is not None:
+            self._lexical.write(self._tmp_dir)
+        has_exact = self._exact is not None
+        if self.ann_lists is not None and self.count:
+            # 质心在全精度向量上训练
+            name, dtype = (EXACT_VECTORS_FILE, "float32") if has_exact else (VECTORS_FILE, self.dtype)
+            vectors = np.memmap(os.path.join(self._tmp_dir, name), dtype=dtype, mode="r",
+                                shape=(self.count, self.dim))
+            self.ann = ann_index.IvfIndex.build(vectors, self.ann_lists or None)
+            self.ann.write(self._tmp_dir)
+            del vectors
+        if has_exact and not self.keep_exact:
+            os.remove(os.path.join(self._tmp_dir, EXACT_VECTORS_FILE))
+            has_exact = False
+        # header 最后写：它存在即代表索引完整
+        with open(os.path.join(self._tmp_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump(_make_header(self.count, self.dim, self.dtype, self.model, has_exact, self.ann_lists), f,
+                      ensure_ascii=False)
+
+        old_dir = self.index_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.index_dir):
+            os.rename(self.index_dir, old_dir)
+        os.rename(self._tmp_dir, self.index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_files()
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def convert_json_index(json_path, index_dir=DEFAULT_INDEX_DIR, dtype="float32", batch_size=1024):
+    """
+    把旧版 knowledge_index.json 转换为二进制索引，返回切片数
+    新版 vectorize.py 输出的 JSON 只含文本 (给前端做关键词检索)，没有向量可转换，此时抛出 ValueError
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    missing = sum(1 for r in records if not r.get("vector"))
+    if missing == len(records) and records:
+        raise ValueError(f"{json_path} 不含向量 (新版 vectorize.py 输出的纯文本 JSON)，"
+                         f"无需转换：二进制索引请直接运行 vectorize.py 构建")
+    if missing:
+        raise ValueError(f"{json_path} 中有 {missing} / {len(records)} 个切片缺少向量，请重新运行 vectorize.py")
+    dim = len(records[0]["vector"]) if records else 384
+    with IndexWriter(index_dir, dim=dim, dtype=dtype) as writer:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            writer.add_batch([r["id"] for r in batch],
+                             [r["content"] for r in batch],
+                             [r["vector"] for r in batch],
+                             [r.get("source", "") for r in batch],
+                             [r.get("page") for r in batch])
+    return len(records)
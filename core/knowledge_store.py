@@ -0,0 +1,116 @@
+"""
+共享知识库 (每个服务进程一个，所有 Streamlit 会话共享)
+
+- 当前版本的 索引 + 检索器 打包成一个不可变快照，页面每次运行取一次快照，整轮都用它
+- 磁盘上的索引被 vectorize.py / build_ann.py 重建后 (header.json / 旧版 JSON 的 mtime 变化)，
+  在后台线程加载新快照，加载完成后原子替换引用：
+  正在进行的查询继续使用旧快照，不会被阻塞，也不会读到一半新一半旧的数据
+- 旧快照没有会话再引用时由 GC 回收 (mmap 随之释放)
+- 查询缓存 (query 向量 / top-k 结果) 跨快照共享，换上新快照时清空结果缓存；query 向量只依赖 Embedding 模型，保留
+"""
+import json
+import os
+import threading
+import time
+
+from core import index_store, query_cache, retrieval
+
+DEFAULT_JSON_PATH = os.path.join("public", "knowledge_index.json")
+# 两次检查磁盘索引是否变化的最短间隔 (秒)
+CHECK_INTERVAL = 5
+
+
+class KnowledgeSnapshot:
+    __slots__ = ("index", "retriever", "version", "loaded_at")
+
+    def __init__(self, index, retriever, version, loaded_at):
+        self.index = index
+        self.retriever = retriever
+        self.version = version
+        self.loaded_at = loaded_at
+
+
+def load_index(index_dir=index_store.DEFAULT_INDEX_DIR, json_path=DEFAULT_JSON_PATH):
+    """优先打开二进制 mmap 索引，没有时兼容旧版 JSON"""
+    if index_store.index_exists(index_dir):
+        return index_store.KnowledgeIndex.open(index_dir)
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            return index_store.KnowledgeIndex.from_records(json.load(f))
+    return index_store.KnowledgeIndex.from_records([])
+
+
+class KnowledgeStore:
+    def __init__(self, embedder, index_dir=index_store.DEFAULT_INDEX_DIR, json_path=DEFAULT_JSON_PATH,
+                 check_interval=CHECK_INTERVAL):
+        self.embedder = embedder
+        self.index_dir = index_dir
+        self.json_path = json_path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.last_error = None
+        self.query_cache = query_cache.QueryCache()
+        self._lock = threading.Lock()
+        self._loading = False
+        self._checked_at = time.monotonic()
+        self._fingerprint = self._disk_fingerprint()
+        self._snapshot = self._load(self._fingerprint)
+        self.query_cache.reset(self._snapshot.version, self.embedder_model)
+
+    @property
+    def embedder_model(self):
+        """query 向量缓存的归属：同一个 Embedding 模型算出的 query 向量在索引重建前后通用"""
+        return getattr(self.embedder, "model_name", None)
+
+    def _disk_fingerprint(self):
+        """索引来源文件的 (路径, mtime, 大小)；IndexWriter 最后写 header.json，它变了即代表新索引完整"""
+        for path in (os.path.join(self.index_dir, index_store.HEADER_FILE), self.json_path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return path, st.st_mtime_ns, st.st_size
+        return None
+
+    def _load(self, fingerprint):
+        index = load_index(self.index_dir, self.json_path)
+        version = f"{index.header.get('created_at', '')}#{fingerprint[1] if fingerprint else 0}"
+        retriever = retrieval.VectorRetriever(index, self.embedder, query_cache=self.query_cache, version=version)
+        return KnowledgeSnapshot(index, retriever, version, time.time())
+
+    def current(self):
+        """返回当前快照；距上次检查超过 check_interval 时顺带看一眼磁盘，变了就在后台重新加载"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            fingerprint = self._disk_fingerprint()
+            if fingerprint != self._fingerprint:
+                self.reload(fingerprint)
+        return self._snapshot
+
+    def reload(self, fingerprint=None, wait=False):
+        """后台加载新快照；已有加载在进行时直接返回。wait=True 时在当前线程同步加载"""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        fingerprint = fingerprint or self._disk_fingerprint()
+        if wait:
+            self._reload(fingerprint)
+        else:
+            threading.Thread(target=self._reload, args=(fingerprint,), name="kb-reload", daemon=True).start()
+
+    def _reload(self, fingerprint):
+        try:
+            snapshot = self._load(fingerprint)
+            self._snapshot = snapshot  # 单次引用赋值，读者要么拿到旧快照，要么拿到新快照
+            self.query_cache.reset(snapshot.version, self.embedder_model)
+            self.reloads += 1
+            self.last_error = None
+        except Exception as e:
+            # 索引正在被写 / 已损坏：保留旧快照，等文件再次变化时重试
+            self.last_error = str(e)
+        finally:
+            self._fingerprint = fingerprint
+            with self._lock:
+                self._loading = False
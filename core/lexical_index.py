@@ -0,0 +1,194 @@
+"""
+BM25 倒排索引 (关键词检索路径)
+
+交易码 (loan_approval_01)、错误码、类名 (InterestCalcUtil) 这类查询靠 Embedding 很难命中，需要精确的字面匹配。
+- 分词：中日韩文字按相邻二元组 (bigram) 切分，单字成段时保留单字；拉丁字母 / 数字 / 下划线按整词切分，
+  并额外拆出 snake_case / camelCase 的子词，查 "InterestCalc" 或 "approval" 也能命中
+- 由 vectorize.py 在构建向量索引时一并生成，与向量放在同一个索引目录，随目录一起原子替换
+- 查询：先对各词的倒排表求交集 (从最短的表开始)，交集不足 top_k 时退化为并集，再按 BM25 打分取 top-k
+
+目录内的文件：
+    lexical.json          元信息：切片数、平均长度、BM25 参数
+    lex_terms.txt         词表，每行一个词，行号即词 ID
+    lex_offsets.npy       int64[V+1]，第 t 个词的倒排表在 postings / tfs 中的区间
+    lex_postings.npy      int32，倒排表 (切片行号，升序)
+    lex_tfs.npy           uint16，对应的词频
+    lex_doclen.npy        int32[N]，每个切片的词数
+"""
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+LEXICAL_META_FILE = "lexical.json"
+TERMS_FILE = "lex_terms.txt"
+OFFSETS_FILE = "lex_offsets.npy"
+POSTINGS_FILE = "lex_postings.npy"
+TFS_FILE = "lex_tfs.npy"
+DOCLEN_FILE = "lex_doclen.npy"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 平假名 / 片假名、CJK 扩展 A、CJK 统一汉字、兼容汉字
+_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_PATTERN = re.compile(f"[{_CJK_CHARS}]+|[A-Za-z0-9_]+")
+_CJK_PATTERN = re.compile(f"[{_CJK_CHARS}]")
+_SUBWORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+        tokens.append(run.lower())
+        parts = [p.lower() for piece in run.split("_") for p in _SUBWORD_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def lexical_index_exists(index_dir):
+    return os.path.exists(os.path.join(index_dir, LEXICAL_META_FILE))
+
+
+class LexicalIndexBuilder:
+    """按切片行号顺序追加文本，最后一次性写出倒排表"""
+
+    def __init__(self):
+        self._postings = {}  # term -> (array 行号, array 词频)
+        self._doclen = array("i")
+
+    def add(self, text):
+        row = len(self._doclen)
+        counts = Counter(tokenize(text))
+        self._doclen.append(sum(counts.values()))
+        for term, tf in counts.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = self._postings[term] = (array("i"), array("H"))
+            entry[0].append(row)
+            entry[1].append(min(tf, 65535))
+
+    def build(self):
+        """在内存中生成 LexicalIndex (兼容旧版 JSON 知识库时使用)"""
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self._postings[term][0])
+        postings = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(terms):
+            rows, freqs = self._postings[term]
+            postings[offsets[i]:offsets[i + 1]] = np.frombuffer(rows, dtype=np.int32)
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(freqs, dtype=np.uint16)
+        doclen = np.frombuffer(self._doclen, dtype=np.int32).copy()
+        return LexicalIndex(terms, offsets, postings, tfs, doclen)
+
+    def write(self, index_dir):
+        index = self.build()
+        with open(os.path.join(index_dir, TERMS_FILE), "w", encoding="utf-8") as f:
+            f.writelines(term + "\n" for term in index.terms)
+        np.save(os.path.join(index_dir, OFFSETS_FILE), index.offsets)
+        np.save(os.path.join(index_dir, POSTINGS_FILE), index.postings)
+        np.save(os.path.join(index_dir, TFS_FILE), index.tfs)
+        np.save(os.path.join(index_dir, DOCLEN_FILE), index.doclen)
+        with open(os.path.join(index_dir, LEXICAL_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": len(index.doclen), "terms": len(index.terms), "avg_len": index.avg_len,
+                       "k1": BM25_K1, "b": BM25_B}, f)
+
+
+class LexicalIndex:
+    def __init__(self, terms, offsets, postings, tfs, doclen, k1=BM25_K1, b=BM25_B):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doclen = doclen
+        self.k1 = k1
+        self.b = b
+        self.avg_len = float(doclen.mean()) if len(doclen) else 0.0
+        # BM25 长度归一化项 k1 * (1 - b + b * dl / avgdl)，查询时直接按行号取
+        self._norm = (k1 * (1 - b + b * doclen / max(self.avg_len, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def open(cls, index_dir):
+        with open(os.path.join(index_dir, LEXICAL_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(index_dir, TERMS_FILE), "r", encoding="utf-8") as f:
+            terms = f.read().split("\n")[:meta["terms"]]
+        return cls(terms,
+                   np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(index_dir, POSTINGS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(index_dir, TFS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(index_dir, DOCLEN_FILE)),
+                   meta.get("k1", BM25_K1), meta.get("b", BM25_B))
+
+    @classmethod
+    def from_texts(cls, texts):
+        builder = LexicalIndexBuilder()
+        for text in texts:
+            builder.add(text)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.doclen)
+
+    def _posting(self, term_id):
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        return self.postings[start:end], self.tfs[start:end]
+
+    def search(self, query, top_k=3):
+        """返回 [(行号, BM25 得分), ...]，按得分降序"""
+        term_ids = sorted({self.term_ids[t] for t in tokenize(query) if t in self.term_ids},
+                          key=lambda t: self.offsets[t + 1] - self.offsets[t])
+        if not term_ids or top_k <= 0:
+            return []
+        n = len(self.doclen)
+
+        # 交集：从最短的倒排表开始逐个求交，候选很快收缩
+        candidates = np.asarray(self._posting(term_ids[0])[0])
+        for t in term_ids[1:]:
+            if len(candidates) < top_k:
+                break
+            candidates = np.intersect1d(candidates, self._posting(t)[0], assume_unique=True)
+        conjunctive = len(candidates) >= top_k
+
+        if conjunctive:
+            # 每个词都按候选行对齐，得分直接逐元素相加
+            rows, totals = candidates, np.zeros(len(candidates), dtype=np.float32)
+        else:
+            # 并集：在稠密的 N 维数组上累加 (同一个词的倒排表内行号不重复)
+            rows, totals = None, np.zeros(n, dtype=np.float32)
+        for t in term_ids:
+            posting_rows, tfs = self._posting(t)
+            if conjunctive:
+                tfs = tfs[np.searchsorted(posting_rows, candidates)]
+                posting_rows = candidates
+            df = int(self.offsets[t + 1] - self.offsets[t])
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tfs = np.asarray(tfs, dtype=np.float32)
+            contrib = idf * tfs * (self.k1 + 1) / (tfs + self._norm[posting_rows])
+            if conjunctive:
+                totals += contrib
+            else:
+                totals[posting_rows] += contrib
+
+        k = min(top_k, int(np.count_nonzero(totals)))
+        if k == 0:
+            return []
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top])]
+        if rows is not None:
+            return [(int(rows[i]), float(totals[i])) for i in top]
+        return [(int(i), float(totals[i])) for i in top]
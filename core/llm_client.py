@@ -0,0 +1,127 @@
+"""
+Ollama 客户端 (每个服务进程共享一个实例)
+
+- requests.Session + 连接池：keep-alive 复用 TCP 连接，每轮对话不再重新握手
+- 健康状态由后台线程按 TTL 定期探测并缓存，调用时不再每次先做一次阻塞的 GET
+- 地址与模型列表可通过环境变量配置：
+    OLLAMA_HOST    默认 http://localhost:11434
+    OLLAMA_MODELS  逗号分隔，默认 qwen3-vl:8b,deepseek-r1:8b,qwen2.5,llama3
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HOST = "http://localhost:11434"
+DEFAULT_MODELS = ["qwen3-vl:8b", "deepseek-r1:8b", "qwen2.5", "llama3"]
+# 健康状态缓存时间 (秒)，后台线程按这个间隔探测
+HEALTH_TTL = 10
+# 缓存为 "离线" 时，调用方触发的重探最少间隔 (秒)；其余时候直接返回缓存，不阻塞页面渲染
+OFFLINE_REPROBE_SECONDS = 3
+# (连接超时, 两次读取之间的超时)：CPU 推理的 prefill 可能较久，读超时要放宽
+REQUEST_TIMEOUT = (3, 120)
+POOL_SIZE = 16
+
+
+def configured_host():
+    return os.environ.get("OLLAMA_HOST", DEFAULT_HOST).rstrip("/")
+
+
+def configured_models():
+    models = os.environ.get("OLLAMA_MODELS", "")
+    return [m.strip() for m in models.split(",") if m.strip()] or list(DEFAULT_MODELS)
+
+
+class OllamaClient:
+    def __init__(self, host=None, health_ttl=HEALTH_TTL, pool_size=POOL_SIZE):
+        self.host = (host or configured_host()).rstrip("/")
+        self.health_ttl = health_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._healthy = None
+        self._checked_at = 0.0
+        self._probe_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe()
+        threading.Thread(target=self._health_loop, name="ollama-health", daemon=True).start()
+
+    def _probe(self):
+        try:
+            ok = self.session.get(f"{self.host}/api/version", timeout=1).status_code == 200
+        except requests.RequestException:
+            ok = False
+        self._healthy, self._checked_at = ok, time.time()
+        return ok
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_ttl):
+            self._probe()
+
+    def is_healthy(self):
+        """
+        返回缓存的健康状态 (由后台线程刷新)
+        缓存为 "离线" 时，距上次探测超过 OFFLINE_REPROBE_SECONDS 才重探一次 (服务刚启动的情况能较快恢复)；
+        同一时刻只有一个调用方去探测，其余的直接返回缓存
+        """
+        if self._healthy or time.time() - self._checked_at < OFFLINE_REPROBE_SECONDS:
+            return bool(self._healthy)
+        if not self._probe_lock.acquire(blocking=False):
+            return bool(self._healthy)
+        try:
+            if time.time() - self._checked_at < OFFLINE_REPROBE_SECONDS:
+                return bool(self._healthy)
+            return self._probe()
+        finally:
+            self._probe_lock.release()
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
+
+    def chat_stream(self, model, messages, metrics=None):
+        """
+        流式对话，逐段 yield 模型输出；出错时 yield 一条 ❌ 开头的提示
+        metrics 传入 dict 时写入 ttft_ms (首 token 延迟) / total_ms / chunks
+        """
+        if metrics is not None:
+            metrics.update(ttft_ms=None, total_ms=None, chunks=0)
+        if not self.is_healthy():
+            yield f"❌ 连接失败: 本地 Ollama 服务未启动！请在终端运行 `ollama serve` ({self.host})"
+            return
+
+        payload = {"model": model, "messages": messages, "stream": True}
+        start = time.perf_counter()
+        try:
+            with self.session.post(f"{self.host}/api/chat", json=payload, stream=True,
+                                   timeout=REQUEST_TIMEOUT) as response:
+                if response.status_code != 200:
+                    yield f"❌ 模型服务报错: {response.status_code} (请检查模型名称是否正确)"
+                    return
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    body = json.loads(line)
+                    if "error" in body:
+                        yield f"❌ 模型服务报错: {body['error']}"
+                        return
+                    if "message" in body:
+                        content = body["message"]["content"]
+                        if metrics is not None:
+                            if metrics["ttft_ms"] is None:
+                                metrics["ttft_ms"] = (time.perf_counter() - start) * 1000
+                            metrics["chunks"] += 1
+                        yield content
+        except requests.ConnectionError as e:
+            self._healthy = False
+            yield f"❌ 推理中断: {str(e)}"
+        except Exception as e:
+            yield f"❌ 推理中断: {str(e)}"
+        finally:
+            if metrics is not None:
+                metrics["total_ms"] = (time.perf_counter() - start) * 1000
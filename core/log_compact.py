@@ -0,0 +1,207 @@
+"""
+日志压缩：在把日志塞进诊断 Prompt 之前去掉噪音
+
+CPU 上的 prefill 耗时与输入 token 数成正比，心跳、连接池统计、重复堆栈这类行只会拖慢首 token。
+处理步骤：
+1. 模板挖掘 (Drain 风格)：按 来源 + 级别 + 类名 + 词数 分组 (时间线中的命中行单独分组，不会被上下文行吞掉)，组内逐词比较相似度，
+   相似的行合并为同一模板，不同的词替换为 <*>；命中行只合并常量词完全相同的行 (只有数字 / 编号不同)，不同事件绝不折叠
+2. 重复模板折叠：同一模板出现多次时在首次出现处输出模板 (可变部分为 <*>)，并标注次数与首末时间
+3. 堆栈截断：保留异常首行、Caused by 和前几帧 / 业务包帧，框架帧折叠为一行计数；完全相同的堆栈只保留一次
+4. token 预算：超出时优先丢弃 INFO 级别的上下文行，最后硬截断
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+
+# 行格式 (兼容时间线文本的 ">> [来源] " 前缀)：时间戳 [LEVEL] [G..] [T..] 类名 - 消息
+LINE_PATTERN = re.compile(
+    r"^(?P<mark>>>|  )?\s*(?:\[(?P<source>[^\]]+)\]\s+)?"
+    r"(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)\s+\[(?P<level>\w+)\s*\]\s+"
+    r"(?:\[[^\]]*\]\s+)*(?P<cls>\S+)\s+-\s+(?P<msg>.*)$"
+)
+STACK_FRAME_PATTERN = re.compile(r"^\s*(?:>>|  )?\s*(?:\[[^\]]+\]\s+)?\s*at\s+\S+")
+STACK_OMITTED_PATTERN = re.compile(r"^\s*(?:>>|  )?\s*(?:\[[^\]]+\]\s+)?\s*\.\.\. \d+ more")
+# 框架 / JDK 包前缀，这些帧对定位业务根因帮助很小
+FRAMEWORK_PREFIXES = ("java.", "javax.", "jdk.", "sun.", "org.springframework.", "org.apache.",
+                      "com.sun.", "io.netty.", "feign.", "com.zaxxer.", "org.hibernate.")
+SIMILARITY_THRESHOLD = 0.8
+STACK_KEEP_TOP = 3
+STACK_KEEP_BUSINESS = 5
+DEFAULT_TOKEN_BUDGET = 3000
+WILDCARD = "<*>"
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _mask(token):
+    return WILDCARD if any(ch.isdigit() for ch in token) else token
+
+
+@dataclass
+class _Template:
+    tokens: list
+    count: int
+    first_index: int
+    first_ts: str
+    last_ts: str
+
+
+class TemplateMiner:
+    """简化版 Drain：固定深度的分组 + 组内按词相似度合并"""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.groups = {}  # (source, level, cls, 是否命中行, 词数) -> [_Template]
+
+    def add(self, index, source, level, cls, msg, ts, is_hit=False):
+        tokens = [_mask(t) for t in msg.split()]
+        group = self.groups.setdefault((source, level, cls, is_hit, len(tokens)), [])
+        for tpl in group:
+            same = sum(1 for a, b in zip(tpl.tokens, tokens) if a == b)
+            # 命中行是诊断的主体：常量词有任何不同 (如 "准备加锁" / "释放锁") 都视为不同事件
+            threshold = 1.0 if is_hit else self.threshold
+            if not tokens or same / len(tokens) >= threshold:
+                tpl.tokens = [a if a == b else WILDCARD for a, b in zip(tpl.tokens, tokens)]
+                tpl.count += 1
+                tpl.last_ts = ts
+                return tpl
+        tpl = _Template(tokens, 1, index, ts, ts)
+        group.append(tpl)
+        return tpl
+
+    @property
+    def template_count(self):
+        return sum(len(g) for g in self.groups.values())
+
+
+@dataclass
+class CompactionResult:
+    text: str
+    raw_tokens: int
+    compact_tokens: int
+    raw_lines: int
+    compact_lines: int
+    templates: int
+
+    @property
+    def ratio(self):
+        return self.compact_tokens / self.raw_tokens if self.raw_tokens else 1.0
+
+
+def _is_hit(m):
+    return m.group("mark") == ">>"
+
+
+def _frame_target(line):
+    m = re.search(r"at\s+(\S+)", line)
+    return m.group(1) if m else ""
+
+
+def _compact_stack(frames):
+    """截断一段连续的堆栈帧：保留前几帧 + 业务帧，其余折叠计数"""
+    kept, omitted, business = [], 0, 0
+    for i, line in enumerate(frames):
+        if STACK_OMITTED_PATTERN.match(line):
+            continue
+        is_business = not _frame_target(line).startswith(FRAMEWORK_PREFIXES)
+        if i < STACK_KEEP_TOP or (is_business and business < STACK_KEEP_BUSINESS):
+            kept.append(line)
+            business += is_business
+        else:
+            omitted += 1
+    if omitted:
+        kept.append(f"\t... 已省略 {omitted} 行框架堆栈")
+    return kept
+
+
+def compact(text, token_budget=DEFAULT_TOKEN_BUDGET):
+    lines = text.splitlines()
+    raw_tokens = estimate_tokens(text)
+
+    # 1. 先把连续堆栈帧截断，并对完全相同的堆栈去重
+    staged = []  # (line, parsed_match or None, priority)
+    seen_stacks = set()
+    i = 0
+    while i < len(lines):
+        if STACK_FRAME_PATTERN.match(lines[i]) or STACK_OMITTED_PATTERN.match(lines[i]):
+            j = i
+            while j < len(lines) and (STACK_FRAME_PATTERN.match(lines[j]) or STACK_OMITTED_PATTERN.match(lines[j])):
+                j += 1
+            block = lines[i:j]
+            digest = hashlib.sha1("\n".join(_frame_target(l) for l in block).encode("utf-8")).hexdigest()
+            if digest in seen_stacks:
+                staged.append(("\t... (与上方相同的堆栈，已省略)", None, 1))
+            else:
+                seen_stacks.add(digest)
+                staged.extend((line, None, 2) for line in _compact_stack(block))
+            i = j
+            continue
+        staged.append((lines[i], LINE_PATTERN.match(lines[i]), None))
+        i += 1
+
+    # 2. 模板挖掘
+    miner = TemplateMiner()
+    line_templates = []
+    for index, (line, m, _) in enumerate(staged):
+        if m is None:
+            line_templates.append(None)
+            continue
+        tpl = miner.add(index, m.group("source") or "", m.group("level"), m.group("cls"), m.group("msg"),
+                        m.group("ts"), _is_hit(m))
+        line_templates.append(tpl)
+
+    # 3. 折叠重复模板：只在首次出现处输出一次
+    out = []  # (line, priority)
+    for index, (line, m, priority) in enumerate(staged):
+        tpl = line_templates[index]
+        if tpl is None:
+            out.append((line, priority if priority is not None else 2))
+            continue
+        if tpl.first_index != index:
+            continue
+        level = m.group("level").upper()
+        prio = 3 if level in ("ERROR", "FATAL", "WARN") else (2 if _is_hit(m) else 0)
+        if tpl.count > 1:
+            # 输出模板而不是首行原文，避免被合并的行看起来像首行的重复
+            line = (f"{line[:m.start('msg')]}{' '.join(tpl.tokens)}"
+                    f"  〔同类日志 ×{tpl.count}，{tpl.first_ts} ~ {tpl.last_ts}〕")
+        out.append((line, prio))
+
+    # 4. token 预算：按优先级从低到高丢弃，同优先级先丢早期的行
+    total = sum(estimate_tokens(line) + 1 for line, _ in out)
+    if total > token_budget:
+        order = sorted(range(len(out)), key=lambda k: (out[k][1], k))
+        dropped = set()
+        for k in order:
+            if total <= token_budget or out[k][1] >= 2:
+                break
+            dropped.add(k)
+            total -= estimate_tokens(out[k][0]) + 1
+        if dropped:
+            kept = [line for k, (line, _) in enumerate(out) if k not in dropped]
+            kept.insert(0, f"〔已按 token 预算省略 {len(dropped)} 行低优先级上下文〕")
+        else:
+            kept = [line for line, _ in out]
+    else:
+        kept = [line for line, _ in out]
+
+    result_text = "\n".join(kept)
+    if estimate_tokens(result_text) > token_budget:
+        # 高优先级内容仍然超预算：硬截断
+        used, cut = 0, []
+        for line in kept:
+            cost = estimate_tokens(line) + 1
+            if used + cost > token_budget:
+                cut.append("〔已达 token 预算上限，后续日志被截断〕")
+                break
+            cut.append(line)
+            used += cost
+        kept = cut
+        result_text = "\n".join(kept)
+
+    return CompactionResult(result_text, raw_tokens, estimate_tokens(result_text), len(lines), len(kept),
+                            miner.template_count)
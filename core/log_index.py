@@ -0,0 +1,210 @@
+"""
+日志 Trace-ID 倒排索引
+
+日志行格式: `时间戳 [LEVEL] [G全局流水号] [T线程流水号] 类名 - 消息`
+把每行中的 [G...] / [T...] 编号映射到 (文件, 字节偏移)，持久化在 SQLite 里。
+查询时直接 seek 到命中行，不再逐行扫描整个 logs 目录。
+
+索引按文件增量维护：
+- 文件变长：只解析上次索引位置之后新增的完整行；末尾没有换行的行视为还在写，
+  但轮转归档 (*.log.N) 或超过 TAIL_SETTLE_SECONDS 没有修改的文件已经写完，最后一行照常索引
+- 文件被轮转 / 截断 (头部指纹变化或变短)：丢弃该文件旧的倒排，重新从头索引
+- 文件被删除：丢弃该文件的倒排
+
+只索引可随机访问的普通文件 (*.log / *.log.N)，gzip 归档由 core.log_scan 流式扫描
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from core import log_scan
+
+LOG_DIR = "logs"
+DEFAULT_DB_PATH = os.path.join(".cache", "log_index.sqlite")
+
+# 行内的全局流水号 / 线程流水号，如 [G889820260131003] [T889820260131103]
+TRACE_ID_PATTERN = re.compile(rb"\[([GT][0-9A-Za-z]{6,})\]")
+# 用户输入的查询能否直接走索引 (G / T 加数字的完整编号；"TaskUtils" 之类的普通单词走全量扫描)
+TRACE_QUERY_PATTERN = re.compile(r"[GT]\d{6,}")
+# 用文件头部这么多字节的哈希识别 "是不是同一个文件"
+FINGERPRINT_BYTES = 4096
+# 每次读取的块大小
+READ_BLOCK_BYTES = 8 * 1024 * 1024
+# 文件超过这么久 (秒) 没有修改，末尾没有换行的最后一行也当作完整行索引
+TAIL_SETTLE_SECONDS = 60
+
+
+def is_trace_id(query):
+    return bool(TRACE_QUERY_PATTERN.fullmatch(query.strip()))
+
+
+def _fingerprint(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+def _is_settled(name, path):
+    """文件是否已经写完：轮转归档不会再写，当前文件则看最近是否修改过"""
+    return not name.endswith(".log") or time.time() - os.path.getmtime(path) > TAIL_SETTLE_SECONDS
+
+
+class LogIndex:
+    """
+    可在多个 Streamlit 会话之间共享：SQLite 连接加锁后串行使用
+    """
+
+    def __init__(self, log_dir=LOG_DIR, db_path=DEFAULT_DB_PATH):
+        self.log_dir = log_dir
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                fingerprint TEXT NOT NULL,
+                fingerprint_len INTEGER NOT NULL,
+                indexed_bytes INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                trace_id TEXT NOT NULL,
+                file_id INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                PRIMARY KEY (trace_id, file_id, offset)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_file ON postings (file_id);
+        """)
+        self._conn.commit()
+
+    def list_log_files(self):
+        return log_scan.list_log_files(self.log_dir, include_gz=False)
+
+    def refresh(self):
+        """增量更新索引，返回本次新解析的字节数"""
+        with self._lock:
+            names = self.list_log_files()
+            known = {row[1]: row for row in self._conn.execute(
+                "SELECT file_id, name, fingerprint, fingerprint_len, indexed_bytes FROM files")}
+
+            # 已删除的文件
+            for name in set(known) - set(names):
+                self._drop_file(known[name][0])
+
+            new_bytes = 0
+            for name in names:
+                path = os.path.join(self.log_dir, name)
+                size = os.path.getsize(path)
+                row = known.get(name)
+                if row is not None:
+                    file_id, _, fingerprint, fp_len, indexed = row
+                    if size < indexed or _fingerprint(path, fp_len) != fingerprint:
+                        # 轮转 / 截断：当作新文件重建
+                        self._drop_file(file_id)
+                        row = None
+                    elif size == indexed:
+                        continue
+                if row is None:
+                    fp_len = min(size, FINGERPRINT_BYTES)
+                    cur = self._conn.execute(
+                        "INSERT INTO files (name, fingerprint, fingerprint_len, indexed_bytes) VALUES (?, ?, ?, 0)",
+                        (name, _fingerprint(path, fp_len), fp_len))
+                    file_id, indexed = cur.lastrowid, 0
+                new_bytes += self._index_file(file_id, path, indexed, _is_settled(name, path))
+            self._conn.commit()
+            return new_bytes
+
+    def _drop_file(self, file_id):
+        self._conn.execute("DELETE FROM postings WHERE file_id = ?", (file_id,))
+        self._conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+    def _index_file(self, file_id, path, start, settled=False):
+        """从 start 偏移开始解析完整行，写入倒排，返回解析的字节数；settled 时末尾没有换行的行也算完整行"""
+        offset = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            tail = b""
+            while True:
+                block = f.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                data = tail + block
+                last_nl = data.rfind(b"\n")
+                if last_nl < 0:
+                    tail = data
+                    continue
+                tail = data[last_nl + 1:]
+                offset += self._add_lines(file_id, data[:last_nl + 1], offset)
+        if settled and tail:
+            offset += self._add_lines(file_id, tail, offset)
+        # 否则末尾不完整的行 (还在写) 留到下次
+        self._conn.execute("UPDATE files SET indexed_bytes = ? WHERE file_id = ?", (offset, file_id))
+        return offset - start
+
+    def _add_lines(self, file_id, data, offset):
+        """把 data (从文件 offset 处开始的若干整行) 中的编号写入倒排，返回 data 的长度"""
+        postings = []
+        line_start = 0
+        for line in data.splitlines(keepends=True):
+            for trace_id in set(TRACE_ID_PATTERN.findall(line)):
+                postings.append((trace_id.decode("ascii"), file_id, offset + line_start))
+            line_start += len(line)
+        self._conn.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?, ?)", postings)
+        return line_start
+
+    def lookup(self, trace_id):
+        """返回 [(文件名, 字节偏移), ...]，按文件名、偏移排序"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT f.name, p.offset FROM postings p JOIN files f ON f.file_id = p.file_id "
+                "WHERE p.trace_id = ? ORDER BY f.name, p.offset", (trace_id.strip(),)).fetchall()
+
+    def has_postings(self, trace_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM postings WHERE trace_id = ? LIMIT 1",
+                                      (trace_id.strip(),)).fetchone() is not None
+
+    def read_hits(self, trace_id, start=None, end=None):
+        """
+        按倒排 seek 读取命中行，返回 {文件名: [(偏移, 行), ...]}
+        start / end 为可选的时间范围 (str，格式同行首时间戳，可只写到分钟)
+        """
+        start_b = start.encode("ascii") if start else None
+        end_b = end.encode("ascii") if end else None
+        hits = {}
+        for name, offset in self.lookup(trace_id):
+            hits.setdefault(name, []).append(offset)
+        result = {}
+        for name, offsets in hits.items():
+            with open(os.path.join(self.log_dir, name), "rb") as f:
+                lines = []
+                for offset in offsets:
+                    f.seek(offset)
+                    line = f.readline()
+                    if log_scan.in_time_range(log_scan.line_timestamp(line), start_b, end_b):
+                        lines.append((offset, line.decode("utf-8", errors="replace").strip()))
+            if lines:
+                result[name] = lines
+        return result
+
+
+def search_hits(index, log_dir, query, start=None, end=None):
+    """
+    在日志目录中查找包含 query 的行，返回 {文件名: [(偏移, 行), ...]}
+    完整编号且索引中有倒排时：倒排 seek 普通文件 + 流式扫描 gzip 归档；
+    否则 (普通关键字、编号前缀、索引里没有的编号) 退回 mmap 子串扫描，结果与不建索引时一致
+    """
+    query = query.strip()
+    if is_trace_id(query):
+        index.refresh()
+        if index.has_postings(query):
+            hits = index.read_hits(query, start, end)
+            gz_files = [n for n in log_scan.list_log_files(log_dir) if n.endswith(".gz")]
+            hits.update(log_scan.scan_logs(log_dir, query, start, end, files=gz_files))
+            return hits
+    return log_scan.scan_logs(log_dir, query, start, end)
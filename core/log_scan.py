@@ -0,0 +1,203 @@
+"""
+日志全量扫描引擎 (没有倒排索引可用时的兜底路径)
+
+- 普通文件 (*.log / *.log.1 ...)：mmap 后直接在字节层面 find，不逐行解码
+- 压缩归档 (*.log.gz / *.log.1.gz)：流式解压，分块查找
+- 文件较多 / 较大时在进程池上按文件并行
+- 可选时间范围：利用每行开头的时间戳，整文件跳过 + 二分定位起点 + 越过终点提前结束
+"""
+import gzip
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# 匹配 xxx.log / xxx.log.1 / xxx.log.gz / xxx.log.1.gz
+LOG_FILE_PATTERN = re.compile(r"\.log(\.\d+)?(\.gz)?$")
+# 行首时间戳，如 2026-01-31 10:00:00.005 (定长格式，可直接按字节序比较)
+TIMESTAMP_PATTERN = re.compile(rb"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(\.\d+)?")
+TIMESTAMP_LEN = 23
+# 总量超过该字节数才启用进程池，小目录串行更快
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+GZIP_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def list_log_files(log_dir, include_gz=True):
+    """列出日志目录下的当前文件与轮转归档，按文件名排序"""
+    if not os.path.isdir(log_dir):
+        return []
+    names = []
+    for name in os.listdir(log_dir):
+        m = LOG_FILE_PATTERN.search(name)
+        if m and (include_gz or not m.group(2)):
+            names.append(name)
+    return sorted(names)
+
+
+def line_timestamp(line):
+    """取行首时间戳 (bytes)，续行 (如堆栈) 没有时间戳时返回 None"""
+    m = TIMESTAMP_PATTERN.match(line)
+    return m.group(0) if m else None
+
+
+def in_time_range(ts, start=None, end=None):
+    """
+    ts / start / end 均为 bytes；start、end 可以只写到分钟或小时 (如 b"2026-01-31 10:05")，
+    按前缀比较，因此 end 包含该分钟内的所有行
+    """
+    if ts is None:
+        return True
+    if start and ts[:len(start)] < start:
+        return False
+    if end and ts[:len(end)] > end:
+        return False
+    return True
+
+
+def _next_timestamped_line(mm, pos, limit):
+    """从 pos 所在行开始向后找第一条带时间戳的行，返回 (行首偏移, 时间戳)"""
+    while pos < limit:
+        line_end = mm.find(b"\n", pos, limit)
+        line_end = limit if line_end < 0 else line_end
+        ts = line_timestamp(mm[pos:pos + TIMESTAMP_LEN])
+        if ts is not None:
+            return pos, ts
+        pos = line_end + 1
+    return limit, None
+
+
+def _seek_time(mm, start):
+    """二分查找第一条时间戳 >= start 的行首偏移 (日志按时间追加写入，整体有序)"""
+    lo, hi = 0, len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line_start = mm.rfind(b"\n", 0, mid) + 1
+        pos, ts = _next_timestamped_line(mm, line_start, len(mm))
+        if ts is None or ts[:len(start)] >= start:
+            hi = line_start
+        else:
+            nl = mm.find(b"\n", pos)
+            lo = min(hi, len(mm) if nl < 0 else nl + 1)
+    return lo
+
+
+def _scan_plain(path, needle, start, end):
+    hits = []
+    if os.path.getsize(path) == 0:
+        return hits
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = _seek_time(mm, start) if start else 0
+        while True:
+            pos = mm.find(needle, pos)
+            if pos < 0:
+                break
+            line_start = mm.rfind(b"\n", 0, pos) + 1
+            line_end = mm.find(b"\n", pos)
+            line_end = len(mm) if line_end < 0 else line_end
+            line = mm[line_start:line_end]
+            ts = line_timestamp(line)
+            if end and ts is not None and ts[:len(end)] > end:
+                break
+            if in_time_range(ts, start, end):
+                hits.append((line_start, line.decode("utf-8", errors="replace").strip()))
+            pos = line_end + 1
+    return hits
+
+
+def _scan_gzip(path, needle, start, end):
+    """流式解压：按块查找，块尾不完整的行留到下一块；偏移为解压后的字节偏移"""
+    hits = []
+    offset = 0
+    tail = b""
+    with gzip.open(path, "rb") as f:
+        while True:
+            block = f.read(GZIP_BLOCK_BYTES)
+            if not block:
+                data, tail = tail, b""
+                if not data:
+                    break
+            else:
+                data = tail + block
+                last_nl = data.rfind(b"\n")
+                if last_nl < 0:
+                    tail = data
+                    continue
+                data, tail = data[:last_nl + 1], data[last_nl + 1:]
+
+            pos = 0
+            while True:
+                pos = data.find(needle, pos)
+                if pos < 0:
+                    break
+                line_start = data.rfind(b"\n", 0, pos) + 1
+                line_end = data.find(b"\n", pos)
+                line_end = len(data) if line_end < 0 else line_end
+                line = data[line_start:line_end]
+                ts = line_timestamp(line)
+                if end and ts is not None and ts[:len(end)] > end:
+                    return hits
+                if in_time_range(ts, start, end):
+                    hits.append((offset + line_start, line.decode("utf-8", errors="replace").strip()))
+                pos = line_end + 1
+            offset += len(data)
+            if not block:
+                break
+    return hits
+
+
+def _file_time_span(path):
+    """普通文件取首 / 尾行时间戳，用于整文件跳过；gzip 只取首行"""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return line_timestamp(f.readline()), None
+    with open(path, "rb") as f:
+        first = line_timestamp(f.readline())
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - 64 * 1024))
+        last = None
+        for line in f.read().splitlines():
+            last = line_timestamp(line) or last
+    return first, last
+
+
+def scan_file(path, query, start=None, end=None):
+    """
+    扫描单个文件，返回 [(字节偏移, 行文本), ...]
+    query / start / end 为 str，进程池任务入口
+    """
+    needle = query.encode("utf-8")
+    start_b = start.encode("ascii") if start else None
+    end_b = end.encode("ascii") if end else None
+
+    if start_b or end_b:
+        first, last = _file_time_span(path)
+        if end_b and first is not None and first[:len(end_b)] > end_b:
+            return []
+        if start_b and last is not None and last[:len(start_b)] < start_b:
+            return []
+
+    if path.endswith(".gz"):
+        return _scan_gzip(path, needle, start_b, end_b)
+    return _scan_plain(path, needle, start_b, end_b)
+
+
+def _scan_task(args):
+    return scan_file(*args)
+
+
+def scan_logs(log_dir, query, start=None, end=None, files=None, workers=None):
+    """
+    扫描日志目录 (或指定的 files 子集)，返回 {文件名: [(偏移, 行), ...]}，只包含有命中的文件
+    """
+    names = list_log_files(log_dir) if files is None else list(files)
+    paths = [os.path.join(log_dir, name) for name in names]
+    tasks = [(path, query, start, end) for path in paths]
+
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    if len(paths) > 1 and total_bytes >= PARALLEL_MIN_BYTES and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_scan_task, tasks))
+    else:
+        results = [_scan_task(task) for task in tasks]
+
+    return {name: hits for name, hits in zip(names, results) if hits}
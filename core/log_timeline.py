@@ -0,0 +1,181 @@
+"""
+跨服务调用时间线
+
+一笔交易 (如放款) 会同时落在 loan-service.log 和 deposit-service.log 里。
+每个命中行连同它在原文件中的前后 N 行上下文组成一组，各文件按偏移顺序流式产出这些组，
+再以命中行的行首时间戳为键做 k 路堆归并 (heapq.merge)，得到一条跨服务、按时间排序的时间线，
+供诊断页展示并发送给大模型。内存里只有每个文件当前的一组，不会先把所有组读出来再整体排序。
+(归并键只看命中行：上下文行早于 / 晚于命中行都不影响顺序；同一文件内的命中行保持写入顺序)
+
+普通文件的上下文通过命中行的字节偏移 seek 读取；gzip 归档不能随机访问，按顺序解压读一遍。
+"""
+import gzip
+import heapq
+import os
+from collections import deque
+from dataclasses import dataclass, field
+
+from core.log_scan import line_timestamp
+
+# 向前读取上下文时最多回看的字节数 (足够覆盖几十行普通日志)
+CONTEXT_BACK_BYTES = 64 * 1024
+
+
+@dataclass
+class TimelineEntry:
+    ts: str  # 行首时间戳；续行 (如堆栈) 继承上一行的时间戳
+    source: str  # 来源文件名
+    offset: int  # 行首字节偏移
+    line: str
+    is_hit: bool  # True 为命中行，False 为上下文行
+
+
+@dataclass
+class Timeline:
+    trace_id: str
+    entries: list = field(default_factory=list)
+
+    @property
+    def sources(self):
+        return sorted({e.source for e in self.entries})
+
+    @property
+    def hit_count(self):
+        return sum(1 for e in self.entries if e.is_hit)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def to_text(self):
+        """给大模型 / 代码框展示的纯文本：按时间排序，标注来源服务，命中行前加 >>"""
+        width = max((len(s) for s in self.sources), default=0)
+        lines = [f"=== 跨服务时间线: {self.trace_id} | 来源 {len(self.sources)} 个文件 | 命中 {self.hit_count} 行 ==="]
+        for e in self.entries:
+            mark = ">>" if e.is_hit else "  "
+            lines.append(f"{mark} [{e.source:<{width}}] {e.line}")
+        return "\n".join(lines)
+
+    def to_records(self):
+        """给 st.dataframe 展示的表格行"""
+        return [{"时间": e.ts, "服务": e.source, "命中": "●" if e.is_hit else "", "日志": e.line}
+                for e in self.entries]
+
+
+def _open(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _lines_around(f, offset, before, after):
+    """读取 offset 所在行及其前 before 行、后 after 行，返回 [(行首偏移, 原始字节行), ...]"""
+    result = []
+    if before > 0 and offset > 0:
+        start = max(0, offset - CONTEXT_BACK_BYTES)
+        f.seek(start)
+        data = f.read(offset - start)
+        pieces = data.split(b"\n")[:-1]  # offset 是行首，data 以换行结尾
+        if start > 0:
+            pieces = pieces[1:]  # 第一段可能是被截断的半行
+        pos = offset
+        for raw in reversed(pieces[-before:]):
+            pos -= len(raw) + 1
+            result.append((pos, raw + b"\n"))
+        result.reverse()
+
+    f.seek(offset)
+    pos = offset
+    for _ in range(1 + after):
+        raw = f.readline()
+        if not raw:
+            break
+        result.append((pos, raw))
+        pos += len(raw)
+    return result
+
+
+def _groups_by_seek(f, offsets, before, after):
+    """普通文件：逐个命中 seek 读取窗口；重叠部分只归属前一个命中，其它命中行不作为上下文"""
+    hit_set = set(offsets)
+    emitted_until = -1
+    for offset in offsets:
+        group = []
+        for line_offset, raw in _lines_around(f, offset, before, after):
+            if line_offset != offset and line_offset in hit_set:
+                if line_offset > offset:
+                    break  # 之后的行归下一个命中
+                continue
+            if line_offset < emitted_until:
+                continue
+            group.append((line_offset, raw))
+            emitted_until = line_offset + len(raw)
+        yield offset, group
+
+
+def _groups_forward(f, offsets, before, after):
+    """gzip 归档：顺序读一遍 (读到最后一个命中的下文为止)，用长度为 before 的滑动窗口保留上文；每组读完即产出"""
+    hit_set = set(offsets)
+    last = offsets[-1]
+    previous = deque(maxlen=before) if before else None
+    current, group, remaining = None, None, 0
+    pos = 0
+    for raw in f:
+        if pos in hit_set:
+            if group is not None:
+                yield current, group
+            group = list(previous) if previous else []
+            if previous:
+                previous.clear()
+            group.append((pos, raw))
+            current, remaining = pos, after
+        elif remaining > 0:
+            group.append((pos, raw))
+            remaining -= 1
+        else:
+            if group is not None:
+                yield current, group
+                group = None
+            if pos > last:
+                break
+            if previous is not None:
+                previous.append((pos, raw))
+        pos += len(raw)
+    if group is not None:
+        yield current, group
+
+
+def _file_groups(log_dir, name, hits, before, after):
+    """单个文件：按偏移顺序逐个产出 (命中时间戳, 文件名, 偏移, [条目, ...])，每个命中行一组 (上文 + 命中行 + 下文)"""
+    offsets = sorted({offset for offset, _ in hits})
+    if not offsets:
+        return
+    path = os.path.join(log_dir, name)
+    with _open(path) as f:
+        reader = _groups_forward if path.endswith(".gz") else _groups_by_seek
+        for offset, lines in reader(f, offsets, before, after):
+            if not lines:
+                continue
+            entries, last_ts, hit_ts = [], "", None
+            for line_offset, raw in lines:
+                ts = line_timestamp(raw)
+                last_ts = ts.decode("ascii") if ts else last_ts
+                if line_offset == offset:
+                    hit_ts = last_ts
+                entries.append(TimelineEntry(last_ts, name, line_offset,
+                                             raw.decode("utf-8", errors="replace").rstrip(), line_offset == offset))
+            if hit_ts is None:
+                continue  # 文件在检索之后被改写，偏移处已不是命中行
+            # 窗口开头的续行 (如堆栈) 没有时间戳，沿用命中行的
+            for e in entries:
+                if e.ts:
+                    break
+                e.ts = hit_ts
+            yield hit_ts, name, offset, entries
+
+
+def build_timeline(trace_id, log_dir, hits, before=0, after=0):
+    """
+    hits: {文件名: [(偏移, 行), ...]} (来自 LogIndex.read_hits / log_scan.scan_logs)
+    各文件的组按 (命中时间戳, 文件名, 偏移) k 路归并，每个命中行连同它自己的前后文作为一组输出
+    """
+    streams = [_file_groups(log_dir, name, file_hits, before, after) for name, file_hits in sorted(hits.items())]
+    merged = heapq.merge(*streams, key=lambda g: g[:3])
+    return Timeline(trace_id, [e for *_, entries in merged for e in entries])
@@ -0,0 +1,172 @@
+"""
+请求分阶段耗时埋点 (每个服务进程一个记录器，所有会话共享)
+
+用户反馈 "诊断很慢" 时，需要知道时间花在了哪一段：
+    retrieval        知识库检索
+    log_aggregation  日志检索 + 跨服务时间线合并
+    prompt_build     拼 Prompt (含日志压缩)
+    queue            调度器排队
+    ttft             首 token 延迟 (从发起推理算起，含排队 / prefill)
+    generation       首 token 之后的生成耗时
+    render           页面渲染 (流式刷新期间花在解析 / markdown 上的时间)
+    total            整个请求
+- 每个阶段一条 JSON 记录，追加写入 .cache/perf_spans.jsonl，便于事后用 pandas / jq 分析
+- 内存中按阶段保留最近 window 条耗时、按模型保留最近 window 次生成速度，供侧边栏展示滚动 p50 / p95
+- 启动时从 JSONL 尾部回填滚动窗口，重启服务后面板不会清零
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_PATH = os.path.join(".cache", "perf_spans.jsonl")
+DEFAULT_WINDOW = 500
+# 启动回填时最多读取文件尾部的字节数
+WARM_TAIL_BYTES = 2 * 1024 * 1024
+STAGES = ("retrieval", "log_aggregation", "prompt_build", "queue", "ttft", "generation", "render", "total")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Span:
+    __slots__ = ("stage", "ms")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.ms = None
+
+
+class RequestTrace:
+    """一次页面请求；各阶段耗时写入所属的 SpanRecorder"""
+
+    def __init__(self, recorder, page, model=None):
+        self.recorder = recorder
+        self.page = page
+        self.model = model
+        self.request_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        sp = Span(stage)
+        t0 = time.perf_counter()
+        try:
+            yield sp
+        finally:
+            sp.ms = (time.perf_counter() - t0) * 1000
+            self.add(stage, sp.ms, **attrs)
+
+    def add(self, stage, ms, **attrs):
+        if ms is not None:
+            self.recorder.record(self.request_id, self.page, stage, ms, self.model, **attrs)
+
+    def llm(self, metrics, tokens=None):
+        """按 call_ollama_stream 写入的 metrics 记录 queue / ttft / generation，并统计该模型的生成速度"""
+        cached = bool(metrics.get("cached"))
+        ttft, total = metrics.get("ttft_ms"), metrics.get("total_ms")
+        self.add("queue", metrics.get("queue_ms"), cached=cached)
+        self.add("ttft", ttft, cached=cached)
+        if ttft is None or total is None:
+            return
+        gen_ms = total - ttft
+        tokens = metrics.get("chunks") if tokens is None else tokens
+        tps = tokens / (gen_ms / 1000) if tokens and gen_ms > 0 else None
+        self.add("generation", gen_ms, cached=cached, tokens=tokens, tokens_per_sec=tps)
+        # 缓存回放的速度没有意义，不计入模型生成速度
+        if tps is not None and not cached and self.model:
+            self.recorder.add_throughput(self.model, tps)
+
+    def finish(self, **attrs):
+        self.add("total", (time.perf_counter() - self.started) * 1000, **attrs)
+
+
+class SpanRecorder:
+    def __init__(self, path=DEFAULT_PATH, window=DEFAULT_WINDOW):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}  # stage -> deque[ms]
+        self._throughput = {}  # model -> deque[tokens/s]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._warm_up()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _warm_up(self):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                start = max(0, size - WARM_TAIL_BYTES)
+                f.seek(start)
+                tail = f.read().splitlines()
+        except OSError:
+            return
+        if start:
+            tail = tail[1:]  # 从中间截断的第一行
+        for line in tail:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            self._remember(rec.get("stage"), rec.get("ms"))
+            if rec.get("stage") == "generation" and rec.get("tokens_per_sec") and not rec.get("cached"):
+                self._window(self._throughput, rec.get("model")).append(rec["tokens_per_sec"])
+
+    def _window(self, table, key):
+        values = table.get(key)
+        if values is None:
+            values = table[key] = deque(maxlen=self.window)
+        return values
+
+    def _remember(self, stage, ms):
+        if stage and ms is not None:
+            self._window(self._stages, stage).append(ms)
+
+    def trace(self, page, model=None):
+        return RequestTrace(self, page, model)
+
+    def record(self, request_id, page, stage, ms, model=None, **attrs):
+        rec = {"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "request_id": request_id, "page": page, "stage": stage,
+               "ms": round(ms, 2)}
+        if model:
+            rec["model"] = model
+        rec.update({k: v for k, v in attrs.items() if v is not None})
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._remember(stage, ms)
+            self._file.write(line)
+            self._file.flush()
+
+    def add_throughput(self, model, tokens_per_sec):
+        with self._lock:
+            self._window(self._throughput, model).append(tokens_per_sec)
+
+    def stage_stats(self):
+        """[{"stage", "n", "p50_ms", "p95_ms"}]，按 STAGES 顺序"""
+        with self._lock:
+            snapshot = {stage: list(values) for stage, values in self._stages.items()}
+        order = list(STAGES) + sorted(set(snapshot) - set(STAGES))
+        return [{"stage": stage, "n": len(snapshot[stage]), "p50_ms": percentile(snapshot[stage], 50),
+                 "p95_ms": percentile(snapshot[stage], 95)} for stage in order if snapshot.get(stage)]
+
+    def model_stats(self):
+        """[{"model", "n", "p50_tps", "p5_tps"}]；p5 即最慢的 5% 请求的速度"""
+        with self._lock:
+            snapshot = {model: list(values) for model, values in self._throughput.items()}
+        return [{"model": model, "n": len(values), "p50_tps": percentile(values, 50), "p5_tps": percentile(values, 5)}
+                for model, values in sorted(snapshot.items())]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
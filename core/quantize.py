@@ -0,0 +1,98 @@
+"""
+向量量化存储 (float16 / 按维缩放的 int8)
+
+- float16：直接降精度，内存减半
+- int8：每一维一个缩放系数 scale[d] = max|x[:, d]| / 127，x ≈ q * scale，内存为 float32 的 1/4
+  打分时把缩放系数折算进 query：x · v ≈ q · (v * scale)，矩阵本身不用反量化
+- 紧凑表示按块转换为 float32 参与矩阵乘，不会一次性展开整个矩阵
+- 量化索引同时在磁盘上保留一份 float32 原始向量 (vectors_exact.bin，mmap 打开，不常驻内存)，
+  近似得分的前几百个候选再用原始向量精确重排
+"""
+import time
+
+import numpy as np
+
+# 分块打分时每块的行数
+SCORE_BLOCK_ROWS = 65536
+INT8_MAX = 127
+
+
+def int8_scales(matrix, block_rows=SCORE_BLOCK_ROWS):
+    """逐维最大绝对值 / 127 (分块扫描，适用于 mmap 上的大矩阵)"""
+    max_abs = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, len(matrix), block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+    max_abs[max_abs == 0] = 1.0
+    return max_abs / INT8_MAX
+
+
+def quantize_int8(block, scales):
+    return np.clip(np.rint(np.asarray(block, dtype=np.float32) / scales), -INT8_MAX, INT8_MAX).astype(np.int8)
+
+
+def compact_scores(matrix, query_vecs, scales=None, rows=None, block_rows=SCORE_BLOCK_ROWS):
+    """
+    query_vecs (Q, D) 与 matrix 中各行 (或 rows 指定的行) 的近似点积，返回 (Q, N) float32
+    matrix 可以是 float32 / float16 / int8 (int8 需要传入 scales)
+    """
+    query_vecs = np.asarray(query_vecs, dtype=np.float32)
+    if scales is not None:
+        query_vecs = query_vecs * scales
+    if rows is not None:
+        matrix = matrix[rows]
+    if matrix.dtype == np.float32:
+        return query_vecs @ matrix.T
+    out = np.empty((len(query_vecs), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        out[:, start:start + len(block)] = query_vecs @ block.T
+    return out
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def recall_report(exact, compact, scales=None, top_k=10, reranks=(0, 50, 100, 200, 500), n_queries=200,
+                  noise=0.05, seed=0):
+    """
+    以 float32 精确检索为基准评估量化检索的 recall@k
+    rerank=0 表示只用紧凑表示打分；否则取近似得分前 rerank 个候选用原始向量重排
+    返回 {"compact_bytes", "exact_bytes", "rows": [{"rerank", "recall", "avg_ms"}]}
+    """
+    rng = np.random.default_rng(seed)
+    n = len(exact)
+    picks = np.sort(rng.choice(n, min(n_queries, n), replace=False))
+    queries = np.asarray(exact[picks], dtype=np.float32)
+    queries = queries + rng.normal(0, noise, queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    truth = [set(_top_k(row, top_k).tolist()) for row in compact_scores(exact, queries)]
+    rows = []
+    for rerank in reranks:
+        hit, t0 = 0, time.perf_counter()
+        for q, expected in zip(queries, truth):
+            scores = compact_scores(compact, q[None, :], scales)[0]
+            if rerank:
+                cand = _top_k(scores, max(rerank, top_k))
+                exact_scores = np.asarray(exact[np.sort(cand)], dtype=np.float32) @ q
+                found = np.sort(cand)[_top_k(exact_scores, top_k)]
+            else:
+                found = _top_k(scores, top_k)
+            hit += len(expected.intersection(found.tolist()))
+        rows.append({"rerank": rerank, "recall": hit / sum(len(t) for t in truth),
+                     "avg_ms": (time.perf_counter() - t0) * 1000 / len(queries)})
+    return {"compact_bytes": int(compact.nbytes), "exact_bytes": int(n * exact.shape[1] * 4), "rows": rows}
+
+
+def print_recall_report(report, dtype, top_k=10):
+    ratio = report["exact_bytes"] / max(report["compact_bytes"], 1)
+    print(f"📐 {dtype} 量化: 常驻向量 {report['compact_bytes'] / 2**20:.1f} MB "
+          f"(float32 为 {report['exact_bytes'] / 2**20:.1f} MB，缩小 {ratio:.1f}x)，recall@{top_k}:")
+    print("    重排候选   recall   平均耗时")
+    for r in report["rows"]:
+        label = "不重排" if not r["rerank"] else str(r["rerank"])
+        print(f"    {label:>6}   {r['recall']:6.1%}   {r['avg_ms']:7.2f} ms")
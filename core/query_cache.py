@@ -0,0 +1,118 @@
+"""
+检索查询缓存 (每个服务进程一个，所有会话共享)
+
+新人反复问 "怎么配置开发环境"、"VPN 怎么连" 这类问题，每次都重新 embed 一遍 query、再扫一遍全库没有必要：
+- 向量缓存：规范化后的 query -> query 向量 (LRU)
+- 结果缓存：(索引版本, 规范化后的 query, top_k, 检索参数) -> [(切片行号, 得分)] (LRU)
+- 知识库热加载出新版本时由 KnowledgeStore 调用 reset()：结果缓存作废；
+  query 向量只取决于 Embedding 模型、与索引版本无关，模型没换就继续保留
+- 统计命中率，并按未命中时的平均耗时估算累计节省的时间
+"""
+import re
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_VECTORS = 4096
+DEFAULT_MAX_RESULTS = 4096
+# 未命中耗时的指数滑动平均系数
+EMA_ALPHA = 0.2
+
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = "?？!！。.,，;；~～ "
+
+
+def normalize_query(query):
+    """去掉首尾空白和句末标点、合并连续空白、英文转小写"""
+    return _SPACES.sub(" ", query.strip()).rstrip(_TRAILING_PUNCT).lower()
+
+
+class _Lru:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class QueryCache:
+    def __init__(self, max_vectors=DEFAULT_MAX_VECTORS, max_results=DEFAULT_MAX_RESULTS):
+        self._lock = threading.Lock()
+        self._vectors = _Lru(max_vectors)
+        self._results = _Lru(max_results)
+        self.version = None
+        self.model = None
+        self.saved_ms = 0.0
+        self._embed_ms = None  # 每条 query embed 的平均耗时
+        self._search_ms = None  # 每条 query 检索 (含 embed) 的平均耗时
+
+    def reset(self, version, model=None):
+        """索引版本变化：清空结果缓存；Embedding 模型变化时才清空向量缓存 (统计数据保留)"""
+        with self._lock:
+            if version != self.version:
+                self._results.data.clear()
+            if model != self.model:
+                self._vectors.data.clear()
+            self.version = version
+            self.model = model
+
+    @staticmethod
+    def _ema(old, new):
+        return new if old is None else old + EMA_ALPHA * (new - old)
+
+    def get_vector(self, query):
+        with self._lock:
+            vec = self._vectors.get(normalize_query(query))
+            if vec is not None and self._embed_ms is not None:
+                self.saved_ms += self._embed_ms
+            return vec
+
+    def put_vectors(self, queries, vectors, elapsed_ms):
+        with self._lock:
+            for query, vec in zip(queries, vectors):
+                self._vectors.put(normalize_query(query), vec)
+            if queries:
+                self._embed_ms = self._ema(self._embed_ms, elapsed_ms / len(queries))
+
+    def result_key(self, version, query, top_k, params=()):
+        return version, normalize_query(query), top_k, params
+
+    def get_result(self, key):
+        with self._lock:
+            rows = self._results.get(key)
+            if rows is not None and self._search_ms is not None:
+                self.saved_ms += self._search_ms
+            return rows
+
+    def put_results(self, keys, results, elapsed_ms):
+        with self._lock:
+            for key, rows in zip(keys, results):
+                self._results.put(key, rows)
+            if keys:
+                self._search_ms = self._ema(self._search_ms, elapsed_ms / len(keys))
+
+    def stats(self):
+        with self._lock:
+            return {"vector_hits": self._vectors.hits, "vector_misses": self._vectors.misses,
+                    "vector_hit_rate": self._vectors.hit_rate(), "vector_entries": len(self._vectors.data),
+                    "result_hits": self._results.hits, "result_misses": self._results.misses,
+                    "result_hit_rate": self._results.hit_rate(), "result_entries": len(self._results.data),
+                    "saved_ms": self.saved_ms}
@@ -0,0 +1,133 @@
+"""
+大模型回答缓存
+
+同一个 Trace ID 反复点 "启动智能根因分析"、新人反复问同样的入门问题时，直接复用上次的完整回答，
+不再让本地模型在 CPU 上重新推理一遍。
+
+- key = sha256(模型名 + 完整消息列表)，检索到的上下文 / 日志都在消息里，内容变了自然不会命中
+- 存在 SQLite 中，按 TTL 过期，再按最近使用时间 (LRU) 淘汰到容量上限以内
+- 命中时把缓存文本切成小段逐段 yield，页面的流式渲染逻辑不用区分是否命中
+- 只缓存完整、成功的回答：出错 (❌ 开头) 或中途被打断的流不写入
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = os.path.join(".cache", "llm_cache.sqlite")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 命中回放时每段的字符数
+REPLAY_CHUNK_CHARS = 24
+# 每写入多少条做一次淘汰
+EVICT_EVERY = 20
+
+
+class ResponseCache:
+    def __init__(self, db_path=DEFAULT_DB_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, text TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def key_of(model, messages):
+        raw = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, text):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text, len(text.encode("utf-8")), now, now))
+            self._conn.commit()
+            self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """先删过期条目，再按 LRU 淘汰到 max_bytes 以内"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                doomed = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries, "bytes": size}
+
+    def cached_stream(self, model, messages, stream_fn, bypass=False, metrics=None):
+        """
+        缓存包装：stream_fn(model, messages, metrics) 为真实的流式调用
+        bypass=True 时跳过读缓存 (仍会用新结果刷新缓存)
+        """
+        key = self.key_of(model, messages)
+        cached = None if bypass else self.get(key)
+        if cached is not None:
+            start = time.perf_counter()
+            if metrics is not None:
+                metrics.update(ttft_ms=None, total_ms=None, chunks=0, cached=True)
+            for i in range(0, len(cached), REPLAY_CHUNK_CHARS):
+                if metrics is not None:
+                    if metrics["ttft_ms"] is None:
+                        metrics["ttft_ms"] = (time.perf_counter() - start) * 1000
+                    metrics["chunks"] += 1
+                yield cached[i:i + REPLAY_CHUNK_CHARS]
+            if metrics is not None:
+                metrics["total_ms"] = (time.perf_counter() - start) * 1000
+            return
+
+        parts = []
+        failed = False
+        for chunk in stream_fn(model, messages, metrics):
+            if chunk.startswith("❌"):
+                failed = True
+            parts.append(chunk)
+            yield chunk
+        if metrics is not None:
+            metrics["cached"] = False
+        # 只有完整消费完且没有报错的流才会走到这里
+        if parts and not failed:
+            self.put(key, model, "".join(parts))
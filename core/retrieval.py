@@ -0,0 +1,237 @@
+"""
+知识库向量检索引擎
+
+vectorize.py 已经为每个切片算好了 384 维 MiniLM 向量，这里把它们一次性装进
+连续的 float32 矩阵 (按行 L2 归一化)，查询时只需一次矩阵-向量乘 + argpartition
+即可拿到 top-k，不再逐切片、逐字符地扫描。
+索引带 BM25 倒排表时做混合检索：向量得分 + 归一化后的 BM25 得分，交易码 / 类名这类字面查询也能排到前面。
+索引带 IVF 近似最近邻索引时，只对 nprobe 个桶内的切片 (以及 BM25 候选) 打分。
+"""
+import time
+
+import numpy as np
+
+from core import ann_index, quantize
+
+# 必须与 scripts/vectorize.py 中使用的模型保持一致，否则向量空间对不上
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# 混合检索：BM25 得分按本次查询的最高分归一化到 0~1 后乘以该权重，加到余弦相似度上
+LEXICAL_WEIGHT = 0.3
+# 每个查询参与混合打分的 BM25 候选数
+LEXICAL_CANDIDATES = 50
+# 量化索引：近似得分前多少个候选用原始向量精确重排
+RERANK_CANDIDATES = 200
+
+
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME):
+    """加载 Query 侧的 Embedding 模型 (较慢，调用方应全局只加载一次)"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def normalize_rows(matrix):
+    """按行做 L2 归一化，归一化后点积即余弦相似度"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, top_k):
+    """
+    从一维得分数组中取 top-k 下标 (按得分降序)
+    argpartition 是 O(N) 的，只对最后的 k 个候选做排序
+    """
+    n = scores.shape[0]
+    if n == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= n:
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def keyword_search(items, query, top_k=3):
+    """
+    关键词加权检索 (兜底方案)
+    Embedding 模型不可用、或者知识库里没有向量时使用
+    """
+    scored_results = []
+    for item in items:
+        content = item["content"]
+        score = 0
+        if query in content:
+            score += 10
+        else:
+            for char in query:
+                if char in content: score += 0.5
+        if score > 1: scored_results.append((item, score))
+    scored_results.sort(key=lambda x: x[1], reverse=True)
+    return scored_results[:top_k]
+
+
+class VectorRetriever:
+    """
+    向量检索器：持有归一化后的切片向量矩阵 + 共享的 Embedding 模型
+    index 为 core.index_store.KnowledgeIndex，构建完成后只读，可在多个 Streamlit 会话之间共享
+
+    float16 / int8 量化索引直接在紧凑表示上分块打分 (不展开成 float32 常驻内存)，
+    索引带原始向量副本时，近似得分前 RERANK_CANDIDATES 个候选再用原始向量精确重排
+    传入 query_cache (core.query_cache.QueryCache) 时复用 query 向量和 top-k 结果，version 为索引版本
+    use_lexical=False 时不叠加 BM25 加分 (纯向量检索，基准测试用它衡量量化 / IVF 的召回)
+    """
+
+    def __init__(self, index, embedder, nprobe=ann_index.DEFAULT_NPROBE, query_cache=None, version=None,
+                 use_lexical=True):
+        self.index = index
+        self.embedder = embedder
+        self.use_lexical = use_lexical
+        self.nprobe = nprobe
+        self.query_cache = query_cache
+        self.version = version
+        self.scales = None
+        self.exact = None
+
+        if len(index) and index.has_vectors:
+            vectors = index.vectors
+            if index.header.get("normalized") and vectors.dtype in (np.float32, np.float16, np.int8):
+                # 已归一化的 mmap 直接参与计算，不复制
+                self.matrix = vectors
+                self.scales = getattr(index, "scales", None)
+                self.exact = getattr(index, "exact_vectors", None)
+            else:
+                self.matrix = np.ascontiguousarray(normalize_rows(vectors))
+        else:
+            self.matrix = None
+
+    @property
+    def enabled(self):
+        """是否可以走向量检索 (模型已加载 且 知识库带向量)"""
+        return self.embedder is not None and self.matrix is not None
+
+    @property
+    def quantized(self):
+        return self.matrix is not None and self.matrix.dtype != np.float32
+
+    @property
+    def lexical(self):
+        return getattr(self.index, "lexical", None) if self.use_lexical else None
+
+    @property
+    def mode(self):
+        lexical = self.lexical is not None
+        if self.enabled:
+            return "混合检索 (向量 + BM25)" if lexical else "向量检索"
+        return "BM25 检索" if lexical else "关键词检索"
+
+    @property
+    def ann(self):
+        return getattr(self.index, "ann", None)
+
+
+    def search(self, query, top_k=3, nprobe=None):
+        """单条查询，返回 [(item, score), ...]"""
+        return self.search_batch([query], top_k, nprobe)[0]
+
+    def search_batch(self, queries, top_k=3, nprobe=None):
+        """
+        批量查询：一次 embed 所有 query，一次矩阵乘得到全部得分
+        返回与 queries 等长的列表，每个元素为 [(item, score), ...]
+        nprobe 为 IVF 查询的桶数 (默认 self.nprobe)；索引没有 IVF 或 nprobe 覆盖全部桶时走暴力检索
+        """
+        if not queries:
+            return []
+        nprobe = self.nprobe if nprobe is None else nprobe
+        cache = self.query_cache
+        if cache is None:
+            hits = self._search_rows(queries, top_k, nprobe)
+        else:
+            keys = [cache.result_key(self.version, q, top_k, (self.mode, nprobe)) for q in queries]
+            hits = [cache.get_result(key) for key in keys]
+            misses = [i for i, rows in enumerate(hits) if rows is None]
+            if misses:
+                t0 = time.perf_counter()
+                found = self._search_rows([queries[i] for i in misses], top_k, nprobe)
+                cache.put_results([keys[i] for i in misses], found, (time.perf_counter() - t0) * 1000)
+                for i, rows in zip(misses, found):
+                    hits[i] = rows
+        return [[(self.index[row], score) for row, score in rows] for rows in hits]
+
+    def _embed(self, queries):
+        """query 向量 (已归一化)；有缓存时只 embed 未命中的 query"""
+        cache = self.query_cache
+        if cache is None:
+            return normalize_rows(self.embedder.embed_documents(list(queries)))
+        vecs = [cache.get_vector(q) for q in queries]
+        misses = [i for i, v in enumerate(vecs) if v is None]
+        if misses:
+            t0 = time.perf_counter()
+            fresh = normalize_rows(self.embedder.embed_documents([queries[i] for i in misses]))
+            cache.put_vectors([queries[i] for i in misses], fresh, (time.perf_counter() - t0) * 1000)
+            for i, vec in zip(misses, fresh):
+                vecs[i] = vec
+        return np.stack(vecs)
+
+    def _search_rows(self, queries, top_k, nprobe):
+        """检索主流程，返回与 queries 等长的 [[(切片行号, 得分), ...], ...]"""
+        lexical = self.lexical
+        if not self.enabled:
+            if lexical is not None:
+                return [lexical.search(q, top_k) for q in queries]
+            rows = [{"row": i, "content": self.index.content(i)} for i in range(len(self.index))]
+            return [[(item["row"], score) for item, score in keyword_search(rows, q, top_k)] for q in queries]
+
+        query_vecs = self._embed(queries)
+        use_ann = self.ann is not None and nprobe < self.ann.n_lists
+        # 暴力检索：(Q, D) x (D, N) -> (Q, N) 一次算完
+        full_scores = None if use_ann else quantize.compact_scores(self.matrix, query_vecs, self.scales)
+
+        results = []
+        for qi, (query, vec) in enumerate(zip(queries, query_vecs)):
+            boost = self._lexical_boost(lexical, query)
+            if use_ann:
+                # IVF 候选 ∪ BM25 候选，只对这些行打分
+                rows = self.ann.candidates(vec, nprobe)
+                if boost:
+                    rows = np.union1d(rows, np.fromiter(boost, dtype=np.int64, count=len(boost)))
+                scores = quantize.compact_scores(self.matrix, vec[None, :], self.scales, rows)[0]
+            else:
+                rows, scores = None, full_scores[qi]
+            self._apply_boost(scores, rows, boost)
+
+            if self.quantized and self.exact is not None:
+                idx = top_k_indices(scores, max(top_k, RERANK_CANDIDATES))
+                cand = np.sort(idx if rows is None else rows[idx])
+                exact_scores = np.asarray(self.exact[cand], dtype=np.float32) @ vec
+                self._apply_boost(exact_scores, cand, boost)
+                rows, scores = cand, exact_scores
+
+            idx = top_k_indices(scores, top_k)
+            hit_rows = idx if rows is None else rows[idx]
+            results.append([(int(r), float(scores[i])) for r, i in zip(hit_rows, idx)])
+        return results
+
+    @staticmethod
+    def _lexical_boost(lexical, query):
+        """{行号: 加分}，BM25 得分按本次查询的最高分归一化后乘以 LEXICAL_WEIGHT"""
+        if lexical is None:
+            return {}
+        hits = lexical.search(query, LEXICAL_CANDIDATES)
+        if not hits:
+            return {}
+        best = hits[0][1]
+        return {row: LEXICAL_WEIGHT * score / best for row, score in hits}
+
+    @staticmethod
+    def _apply_boost(scores, rows, boost):
+        """把 BM25 加分加到 scores 上；rows 为 scores 对应的行号 (升序)，None 表示全部行"""
+        if not boost:
+            return
+        lex_rows = np.fromiter(boost, dtype=np.int64, count=len(boost))
+        bonus = np.fromiter(boost.values(), dtype=np.float32, count=len(boost))
+        if rows is None:
+            scores[lex_rows] += bonus
+            return
+        pos = np.searchsorted(rows, lex_rows)
+        found = (pos < len(rows)) & (rows[np.minimum(pos, len(rows) - 1)] == lex_rows)
+        scores[pos[found]] += bonus[found]
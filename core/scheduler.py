@@ -0,0 +1,190 @@
+"""
+推理调度器 (每个服务进程一个，所有 Streamlit 会话共享)
+
+故障期间十个人同时点 "启动智能根因分析"，如果各自直接打到同一个本地 Ollama，所有人的延迟一起崩掉。
+这里把推理请求统一排队：
+- 每个模型同时运行的生成数有上限，其余请求按先来后到排队，调用方可以看到自己的排队位置
+- 完全相同的请求 (模型 + 消息列表) 正在排队或生成时，后来者直接挂到同一个任务上共享输出流
+- 订阅者取消 (点 "重置" 或页面重跑) 后从任务上摘除；任务没有订阅者时，排队的直接移除，生成中的立即停止
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 每个模型同时运行的生成数上限，可用环境变量覆盖
+DEFAULT_MAX_CONCURRENT = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "2"))
+# 所有模型合计的工作线程数
+MAX_WORKERS = 16
+# 排队时回调 on_wait 的间隔 (秒)
+WAIT_POLL_SECONDS = 0.5
+
+
+class InferenceJob:
+    def __init__(self, key, model, messages):
+        self.key = key
+        self.model = model
+        self.messages = messages
+        self.status = "queued"  # queued -> running -> done / cancelled
+        self.chunks = []
+        self.subscribers = set()
+        self.submitted_at = time.perf_counter()
+        self.started_at = None  # 工作线程开始推理的时刻 (排队耗时到此为止，之后是 prefill / 生成)
+        self.cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "cancelled")
+
+
+class InferenceScheduler:
+    def __init__(self, stream_fn, max_concurrent=DEFAULT_MAX_CONCURRENT, max_workers=MAX_WORKERS):
+        """stream_fn(model, messages, metrics) 为真实的流式推理调用 (如 OllamaClient.chat_stream)"""
+        self.stream_fn = stream_fn
+        self.max_concurrent = max_concurrent
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._queues = {}  # model -> deque[InferenceJob]
+        self._running = {}  # model -> 正在生成的任务数
+        self._inflight = {}  # key -> InferenceJob (排队中或生成中)
+        self._tickets = {}  # ticket -> InferenceJob
+        self._next_ticket = 0
+        self.deduplicated = 0
+
+    @staticmethod
+    def key_of(model, messages):
+        raw = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def submit(self, model, messages):
+        """提交请求，返回 ticket (用于读取输出流 / 查询排队位置 / 取消)"""
+        key = self.key_of(model, messages)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is None:
+                job = InferenceJob(key, model, messages)
+                self._inflight[key] = job
+                self._queues.setdefault(model, deque()).append(job)
+            else:
+                self.deduplicated += 1
+            self._next_ticket += 1
+            ticket = self._next_ticket
+            self._tickets[ticket] = job
+            job.subscribers.add(ticket)
+            self._dispatch_locked(model)
+        return ticket
+
+    def _dispatch_locked(self, model):
+        queue = self._queues.get(model)
+        while queue and self._running.get(model, 0) < self.max_concurrent:
+            job = queue.popleft()
+            job.status = "running"
+            self._running[model] = self._running.get(model, 0) + 1
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        with job.cond:
+            job.started_at = time.perf_counter()
+            job.cond.notify_all()  # 唤醒等待中的订阅者，排队耗时不混入 prefill
+        try:
+            for chunk in self.stream_fn(job.model, job.messages, None):
+                if job.status == "cancelled":
+                    break  # 关闭生成器 -> 关闭 HTTP 流，Ollama 停止生成
+                with job.cond:
+                    job.chunks.append(chunk)
+                    job.cond.notify_all()
+        except Exception as e:
+            with job.cond:
+                job.chunks.append(f"❌ 推理中断: {str(e)}")
+        finally:
+            with self._lock:
+                self._running[job.model] -= 1
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                self._dispatch_locked(job.model)
+            with job.cond:
+                if job.status != "cancelled":
+                    job.status = "done"
+                job.cond.notify_all()
+
+    def queue_position(self, ticket):
+        """排队位置 (从 1 开始)；已开始生成或已结束返回 0"""
+        with self._lock:
+            job = self._tickets.get(ticket)
+            if job is None or job.status != "queued":
+                return 0
+            queue = self._queues.get(job.model, ())
+            for i, queued in enumerate(queue):
+                if queued is job:
+                    return i + 1
+        return 0
+
+    def cancel(self, ticket):
+        """订阅者离开；任务没有订阅者时停止 (排队中直接移出队列)"""
+        with self._lock:
+            job = self._tickets.pop(ticket, None)
+            if job is None:
+                return
+            job.subscribers.discard(ticket)
+            if job.subscribers or job.finished:
+                return
+            if job.status == "queued":
+                self._queues[job.model].remove(job)
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+        with job.cond:
+            job.status = "cancelled"
+            job.cond.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {"running": dict(self._running),
+                    "queued": {m: len(q) for m, q in self._queues.items()},
+                    "deduplicated": self.deduplicated}
+
+    def stream(self, ticket, metrics=None, on_wait=None):
+        """
+        读取 ticket 对应任务的输出流 (与任务共享，后加入的订阅者会先收到已生成的部分)
+        排队期间每隔 WAIT_POLL_SECONDS 调用一次 on_wait(排队位置)
+        生成器被关闭 (页面重跑 / 中途退出) 时自动 cancel
+        """
+        job = self._tickets[ticket]
+        start = time.perf_counter()
+        if metrics is not None:
+            metrics.update(ttft_ms=None, total_ms=None, queue_ms=None, chunks=0)
+        idx = 0
+        try:
+            while True:
+                with job.cond:
+                    if idx >= len(job.chunks) and not job.finished:
+                        job.cond.wait(WAIT_POLL_SECONDS)
+                    new_chunks = job.chunks[idx:]
+                    status = job.status
+                    started_at = job.started_at
+                idx += len(new_chunks)
+
+                if status == "queued" or (status == "running" and started_at is None):
+                    if status == "queued" and on_wait is not None:
+                        on_wait(self.queue_position(ticket))
+                    continue
+                if metrics is not None and metrics["queue_ms"] is None:
+                    # 后加入的订阅者 (合并到已在生成的任务) 没有排队
+                    metrics["queue_ms"] = max(0.0, ((started_at or time.perf_counter()) - start) * 1000)
+                for chunk in new_chunks:
+                    if metrics is not None:
+                        if metrics["ttft_ms"] is None:
+                            metrics["ttft_ms"] = (time.perf_counter() - start) * 1000
+                        metrics["chunks"] += 1
+                    yield chunk
+                if status == "cancelled":
+                    yield "❌ 推理已取消"
+                    return
+                if status == "done" and idx >= len(job.chunks):
+                    return
+        finally:
+            if metrics is not None:
+                metrics["total_ms"] = (time.perf_counter() - start) * 1000
+            self.cancel(ticket)
@@ -0,0 +1,116 @@
+"""
+流式输出的增量处理
+
+- ThinkStreamParser：状态机，边收边把 DeepSeek-R1 的 <think>...</think> 思考内容与正文分开，
+  标签被拆在两个 chunk 之间也能正确识别；每个字符只处理一次，不再对累计全文反复 split / re.sub
+- RenderThrottle：把界面刷新合并到固定帧率 / token 数预算，并统计 tokens/s
+"""
+import time
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class ThinkStreamParser:
+    def __init__(self):
+        self.in_think = False
+        self.saw_think = False  # 是否出现过思考段
+        self.think_closed = False  # 思考段是否已经结束
+        self._pending = ""  # 可能是半个标签的尾巴，等下一个 chunk 再判断
+        self._think_parts = []
+        self._answer_parts = []
+
+    def feed(self, chunk):
+        buf = self._pending + chunk
+        self._pending = ""
+        while buf:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            idx = buf.find(tag)
+            if idx >= 0:
+                self._emit(buf[:idx])
+                buf = buf[idx + len(tag):]
+                if self.in_think:
+                    self.in_think, self.think_closed = False, True
+                else:
+                    self.in_think, self.saw_think = True, True
+                continue
+            # 末尾如果是标签的前缀 (如 "</thi")，先扣下来
+            keep = _partial_tag_len(buf, tag)
+            self._emit(buf[:len(buf) - keep])
+            self._pending = buf[len(buf) - keep:]
+            break
+
+    def finish(self):
+        """流结束：把扣下的尾巴按当前状态输出"""
+        self._emit(self._pending)
+        self._pending = ""
+
+    def _emit(self, text):
+        if text:
+            (self._think_parts if self.in_think else self._answer_parts).append(text)
+
+    @property
+    def answer_text(self):
+        return "".join(self._answer_parts)
+
+    @property
+    def think_text(self):
+        return "".join(self._think_parts)
+
+    def think_tail(self, n=100):
+        """最近 n 个思考字符 (只拼接末尾几段，不拼全文)"""
+        tail, size = [], 0
+        for part in reversed(self._think_parts):
+            tail.append(part)
+            size += len(part)
+            if size >= n:
+                break
+        return "".join(reversed(tail))[-n:]
+
+
+def _partial_tag_len(buf, tag):
+    """buf 末尾与 tag 前缀重合的最大长度 (不含完整 tag)"""
+    for k in range(min(len(tag) - 1, len(buf)), 0, -1):
+        if buf.endswith(tag[:k]):
+            return k
+    return 0
+
+
+class RenderThrottle:
+    """
+    每收到一个 chunk 调用 tick()，返回 True 时才需要刷新界面：
+    距上次刷新超过 1/fps 秒，或攒够 token_budget 个 chunk
+    """
+
+    def __init__(self, fps=8, token_budget=48):
+        self.interval = 1.0 / fps
+        self.token_budget = token_budget
+        self.tokens = 0
+        self.renders = 0
+        self._start = time.perf_counter()
+        self._first_token_at = None
+        self._last_render = 0.0
+        self._since_render = 0
+
+    def tick(self, n=1):
+        now = time.perf_counter()
+        if self._first_token_at is None:
+            self._first_token_at = now
+        self.tokens += n
+        self._since_render += n
+        if now - self._last_render >= self.interval or self._since_render >= self.token_budget:
+            self._last_render = now
+            self._since_render = 0
+            self.renders += 1
+            return True
+        return False
+
+    def tokens_per_sec(self):
+        """生成速度：从首个 token 到现在 (不含 prefill 等待)"""
+        if self._first_token_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._first_token_at
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return f"{self.tokens} tokens · {self.tokens_per_sec():.1f} tokens/s · 刷新 {self.renders} 次"
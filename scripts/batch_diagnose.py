@@ -0,0 +1,349 @@
+"""
+离线批量故障诊断 (无界面)
+
+夜间跑批 (如 JOB_BATCH_05) 之后日志里往往有几十笔 WARN / ERROR 交易，逐个在诊断页里点太慢：
+1. 用 mmap 扫描日志目录，找出出现在 WARN / ERROR 行里的全局流水号 [G...] (可限定时间范围)
+2. 每个流水号按诊断页相同的方式聚合：倒排索引 seek + gzip 归档扫描 -> 跨服务时间线 -> 日志压缩
+3. 通过推理调度器 (每个模型限制并发) 把诊断 Prompt 发给 Ollama，工作线程数有上限；回答缓存与 app.py 共用
+4. 每完成一笔写一次检查点，进程崩溃 / 被中断后重新运行同一命令会跳过已完成的流水号
+5. 每笔输出 Markdown + JSON 报告；汇总报告按 "根因签名" 分组
+   (最早一条 ERROR 行、没有 ERROR 时取最早一条 WARN 行的 类名 + 消息模板，数字和方括号内的值替换为 <*>)
+
+用法 (在 scripts 目录下运行)：
+    python batch_diagnose.py                                           # 诊断 ../logs 中所有失败交易
+    python batch_diagnose.py --start "2026-01-31 02:00" --end "2026-01-31 06:00" --concurrency 2
+    python batch_diagnose.py --run JOB_BATCH_05 --model deepseek-r1:8b  # 中断后用同一个 --run 续跑
+    python batch_diagnose.py --trace-ids G889820260131003,G889820260131555 --levels ERROR
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import (diagnosis, llm_client, log_compact, log_index, log_scan,  # noqa: E402
+                  response_cache, scheduler, stream_parser)
+
+LOG_DIR = "../logs"
+LOG_DB = "../.cache/log_index.sqlite"
+LLM_CACHE_DB = "../.cache/llm_cache.sqlite"
+OUTPUT_DIR = "../.cache/batch_diagnosis"
+CHECKPOINT_FILE = "checkpoint.json"
+SUMMARY_FILE = "summary.md"
+
+GLOBAL_ID_PATTERN = re.compile(r"\[(G[0-9A-Za-z]{6,})\]")
+# 签名中需要抹掉的可变部分：方括号内的值、数字
+BRACKET_VALUE_PATTERN = re.compile(r"\[[^\]]*\]")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# 从诊断报告中摘取 "根因" 小节的第一句话
+ROOT_CAUSE_HEADING = re.compile(r"根因")
+
+
+def find_failing_traces(log_dir, levels, start=None, end=None):
+    """返回 [(流水号, 级别集合, 首次出现时间)]，按首次出现时间排序"""
+    found = {}
+    for level in levels:
+        needle = "[WARN" if level == "WARN" else f"[{level}"  # WARN 在日志里对齐成 "[WARN ]"
+        for hits in log_scan.scan_logs(log_dir, needle, start, end).values():
+            for _, line in hits:
+                m = GLOBAL_ID_PATTERN.search(line)
+                if m is None:
+                    continue
+                ts = line[:23]
+                entry = found.setdefault(m.group(1), [set(), ts])
+                entry[0].add(level)
+                entry[1] = min(entry[1], ts)
+    return sorted(((tid, lv, ts) for tid, (lv, ts) in found.items()), key=lambda x: x[2])
+
+
+def root_cause_signature(timeline):
+    """最早的 ERROR 行 (没有则最早的 WARN 行) 的 类名 + 消息模板"""
+    for wanted in ("ERROR", "WARN"):
+        for e in timeline.entries:
+            if not e.is_hit:
+                continue
+            m = log_compact.LINE_PATTERN.match(e.line)
+            if m is None or m.group("level") != wanted:
+                continue
+            msg = BRACKET_VALUE_PATTERN.sub(f"[{log_compact.WILDCARD}]", m.group("msg"))
+            msg = NUMBER_PATTERN.sub(log_compact.WILDCARD, msg)
+            return f"{wanted} {m.group('cls')} - {msg}", e.line
+    return "未识别 (无 WARN / ERROR 行)", ""
+
+
+def extract_root_cause(report):
+    """报告中 "根因" 标题之后的第一段非空文本 (截断到 120 字)；找不到返回空串"""
+    lines = report.splitlines()
+    for i, line in enumerate(lines):
+        if not ROOT_CAUSE_HEADING.search(line):
+            continue
+        # "2. 根因分析：xxx" 同一行带内容时直接取冒号后面的部分
+        inline = re.split(r"[：:]", line, 1)[1].strip(" #*") if re.search(r"[：:]", line) else ""
+        if inline:
+            return inline[:120]
+        for follow in lines[i + 1:]:
+            text = follow.strip(" #*->")
+            if text:
+                return text[:120]
+    return ""
+
+
+class Checkpoint:
+    """{流水号: 结果摘要}；每次更新后原子写盘 (先写临时文件再 os.replace)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def done(self, trace_id):
+        return self.data.get(trace_id, {}).get("status") == "done"
+
+    def update(self, trace_id, record):
+        with self._lock:
+            self.data[trace_id] = record
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+
+class BatchDiagnoser:
+    def __init__(self, args, out_dir):
+        self.args = args
+        self.out_dir = out_dir
+        self.trace_dir = os.path.join(out_dir, "traces")
+        os.makedirs(self.trace_dir, exist_ok=True)
+        self.client = llm_client.OllamaClient(args.host)
+        self.scheduler = scheduler.InferenceScheduler(self.client.chat_stream, args.concurrency)
+        self.cache = response_cache.ResponseCache(LLM_CACHE_DB)
+        self.index = log_index.LogIndex(args.logs, LOG_DB)
+        self.checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_FILE))
+        self._print_lock = threading.Lock()
+        self._tickets = set()  # 正在排队 / 生成的调度器 ticket，中断时统一取消
+        self._tickets_lock = threading.Lock()
+        self._stopping = False
+
+    def _generate(self, prompt, metrics):
+        """经回答缓存 + 调度器推理 (与 app.py 的 call_ollama_stream 相同)，返回 (思考, 正文, 是否出错)"""
+        def scheduled_stream(model, messages, metrics):
+            with self._tickets_lock:
+                # 中断之后还在做日志聚合的线程不再提交新的推理
+                ticket = None if self._stopping else self.scheduler.submit(model, messages)
+                if ticket is not None:
+                    self._tickets.add(ticket)
+            if ticket is None:
+                yield "❌ 批量诊断已中断"
+                return
+            try:
+                yield from self.scheduler.stream(ticket, metrics)
+            finally:
+                with self._tickets_lock:
+                    self._tickets.discard(ticket)
+
+        parser = stream_parser.ThinkStreamParser()
+        failed = False
+        for chunk in self.cache.cached_stream(self.args.model, [{"role": "user", "content": prompt}],
+                                              scheduled_stream, bypass=self.args.no_cache, metrics=metrics):
+            failed = failed or chunk.startswith("❌")
+            parser.feed(chunk)
+        parser.finish()
+        return parser.think_text, parser.answer_text, failed
+
+    def diagnose(self, trace_id, levels):
+        t0 = time.perf_counter()
+        timeline = diagnosis.aggregate_logs(self.index, self.args.logs, trace_id, self.args.start, self.args.end,
+                                            self.args.context)
+        if not timeline:
+            return {"status": "skipped", "trace_id": trace_id, "reason": "未找到日志"}
+        raw_text = timeline.to_text()
+        compacted = log_compact.compact(raw_text, self.args.token_budget)
+        signature, first_line = root_cause_signature(timeline)
+        prompt = diagnosis.build_prompt(compacted.text)
+        prep_ms = (time.perf_counter() - t0) * 1000
+
+        metrics = {}
+        think, report, failed = self._generate(prompt, metrics)
+        record = {
+            "status": "failed" if failed or not report.strip() else "done",
+            "trace_id": trace_id, "levels": sorted(levels), "sources": timeline.sources,
+            "first_ts": timeline.entries[0].ts, "last_ts": timeline.entries[-1].ts, "hit_lines": timeline.hit_count,
+            "signature": signature, "first_error_line": first_line, "root_cause": extract_root_cause(report),
+            "model": self.args.model, "cached": bool(metrics.get("cached")),
+            "prompt_tokens": compacted.compact_tokens, "raw_tokens": compacted.raw_tokens,
+            "prep_ms": round(prep_ms, 1), "ttft_ms": metrics.get("ttft_ms"), "total_ms": metrics.get("total_ms"),
+        }
+        base = os.path.join(self.trace_dir, trace_id)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(dict(record, report=report, think=think, log=compacted.text), f, ensure_ascii=False, indent=2)
+        with open(base + ".md", "w", encoding="utf-8") as f:
+            f.write(render_trace_markdown(record, report, compacted.text))
+        record["report_file"] = os.path.relpath(base + ".md", self.out_dir)
+        return record
+
+    def run(self, traces):
+        pending = [(tid, lv) for tid, lv, _ in traces if not self.checkpoint.done(tid)]
+        skipped = len(traces) - len(pending)
+        print(f"🩺 共 {len(traces)} 笔失败交易，已完成 {skipped} 笔，待诊断 {len(pending)} 笔 "
+              f"(模型 {self.args.model}，并发 {self.args.concurrency})")
+        self.index.refresh()
+        t0 = time.perf_counter()
+        # 工作线程数 = 调度器并发数 + 1：多出的一个线程提前做日志聚合，模型不空等
+        pool = ThreadPoolExecutor(max_workers=self.args.concurrency + 1, thread_name_prefix="diagnose")
+        futures = {pool.submit(self.diagnose, tid, lv): tid for tid, lv in pending}
+        recorded = set()
+        try:
+            for n, future in enumerate(as_completed(futures), 1):
+                self._record(futures[future], future, f"{n}/{len(pending)}")
+                recorded.add(future)
+        except KeyboardInterrupt:
+            # 不等排队中的诊断：撤掉未开始的任务，取消正在推理的请求，已完成的结果先写进检查点
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.cancel_inflight()
+            for future, tid in futures.items():
+                if future not in recorded and future.done() and not future.cancelled():
+                    self._record(tid, future, "中断前完成")
+            raise
+        finally:
+            pool.shutdown(wait=False)
+            print(f"⏱️  用时 {time.perf_counter() - t0:.1f}s")
+        self.client.close()
+
+    def _record(self, tid, future, progress):
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {"status": "failed", "trace_id": tid, "reason": str(e)}
+        self.checkpoint.update(tid, record)
+        with self._print_lock:
+            icon = {"done": "✅", "skipped": "⏭️ "}.get(record["status"], "❌")
+            detail = record.get("root_cause") or record.get("reason") or record.get("signature", "")
+            print(f"  [{progress}] {icon} {tid} {detail[:60]}")
+
+    def cancel_inflight(self):
+        """停止提交新推理，并取消正在排队 / 生成的请求 (失败的诊断不算完成，下次运行会重试)"""
+        with self._tickets_lock:
+            self._stopping = True
+            tickets = list(self._tickets)
+        for ticket in tickets:
+            self.scheduler.cancel(ticket)
+
+
+def render_trace_markdown(record, report, log_text):
+    cache_text = " · 缓存命中" if record["cached"] else ""
+    return (f"# 故障诊断：{record['trace_id']}\n\n"
+            f"- 级别：{' / '.join(record['levels'])}\n"
+            f"- 涉及服务：{' / '.join(record['sources'])}\n"
+            f"- 时间：{record['first_ts']} ~ {record['last_ts']} · 命中 {record['hit_lines']} 行\n"
+            f"- 根因签名：`{record['signature']}`\n"
+            f"- 模型：{record['model']} · Prompt 约 {record['prompt_tokens']} tokens"
+            f" (压缩前 {record['raw_tokens']}){cache_text}\n\n"
+            f"## 诊断报告\n\n{report.strip()}\n\n"
+            f"## 送入模型的日志\n\n```log\n{log_text}\n```\n")
+
+
+def write_summary(out_dir, checkpoint, traces):
+    """按根因签名分组的汇总 (Markdown + JSON)"""
+    order = {tid: i for i, (tid, _, _) in enumerate(traces)}
+    records = [r for tid, r in checkpoint.data.items() if tid in order]
+    groups = {}
+    for r in records:
+        if r.get("status") == "done":
+            groups.setdefault(r["signature"], []).append(r)
+    ranked = sorted(groups.items(), key=lambda kv: (-len(kv[1]), kv[0]))
+    failed = [r for r in records if r.get("status") == "failed"]
+    skipped = [r for r in records if r.get("status") == "skipped"]
+
+    lines = ["# 批量故障诊断汇总", "",
+             f"- 生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}",
+             f"- 失败交易 {len(traces)} 笔：已诊断 {sum(len(g) for g in groups.values())} · "
+             f"诊断失败 {len(failed)} · 无日志 {len(skipped)}",
+             f"- 根因分组 {len(groups)} 个", ""]
+    for i, (signature, rows) in enumerate(ranked, 1):
+        rows.sort(key=lambda r: order[r["trace_id"]])
+        services = sorted({s for r in rows for s in r["sources"]})
+        lines += [f"## {i}. {signature}", "",
+                  f"- 交易数：{len(rows)} · 涉及服务：{' / '.join(services)}",
+                  f"- 时间：{rows[0]['first_ts']} ~ {max(r['last_ts'] for r in rows)}",
+                  f"- 样例日志：`{rows[0]['first_error_line']}`", ""]
+        causes = []
+        for r in rows:
+            if r.get("root_cause") and r["root_cause"] not in causes:
+                causes.append(r["root_cause"])
+        if causes:
+            lines += ["模型给出的根因："] + [f"> {c}" for c in causes[:3]] + [""]
+        lines += ["| 流水号 | 首次出现 | 级别 | 报告 |", "| --- | --- | --- | --- |"]
+        lines += [f"| {r['trace_id']} | {r['first_ts']} | {'/'.join(r['levels'])} | [{r['report_file']}]({r['report_file']}) |"
+                  for r in rows]
+        lines.append("")
+    if failed:
+        lines += ["## 诊断失败 (重新运行同一命令会重试)", ""]
+        lines += [f"- {r['trace_id']}: {r.get('reason') or r.get('signature', '')}" for r in failed]
+        lines.append("")
+
+    with open(os.path.join(out_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    summary = [{"signature": sig, "count": len(rows), "trace_ids": [r["trace_id"] for r in rows],
+                "root_causes": list(dict.fromkeys(r["root_cause"] for r in rows if r.get("root_cause")))}
+               for sig, rows in ranked]
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"groups": summary, "failed": [r["trace_id"] for r in failed],
+                   "skipped": [r["trace_id"] for r in skipped]}, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量故障诊断")
+    parser.add_argument("--logs", default=LOG_DIR, help="日志目录")
+    parser.add_argument("--start", default=None, help="开始时间，如 2026-01-31 02:00")
+    parser.add_argument("--end", default=None, help="结束时间，如 2026-01-31 06:00")
+    parser.add_argument("--levels", default="ERROR,WARN", help="视为失败的日志级别，逗号分隔")
+    parser.add_argument("--trace-ids", default=None, help="只诊断这些流水号 (逗号分隔，不扫描日志)")
+    parser.add_argument("--limit", type=int, default=0, help="最多诊断的交易数 (0 不限)")
+    parser.add_argument("--model", default=llm_client.configured_models()[0], help="推理模型")
+    parser.add_argument("--host", default=None, help="Ollama 地址 (默认 OLLAMA_HOST)")
+    parser.add_argument("--concurrency", type=int, default=scheduler.DEFAULT_MAX_CONCURRENT, help="同时推理的请求数")
+    parser.add_argument("--context", type=int, default=2, help="命中行前后附带的上下文行数")
+    parser.add_argument("--token-budget", type=int, default=log_compact.DEFAULT_TOKEN_BUDGET, help="日志压缩 token 预算")
+    parser.add_argument("--no-cache", action="store_true", help="不复用缓存回答")
+    parser.add_argument("--run", default=None, help="运行名 (输出子目录，默认当天日期)；同名运行会从检查点续跑")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="输出根目录")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.logs):
+        print(f"⚠️  未找到日志目录: {args.logs}")
+        return
+    levels = [lv.strip().upper() for lv in args.levels.split(",") if lv.strip()]
+    if args.trace_ids:
+        traces = [(tid.strip(), set(), "") for tid in args.trace_ids.split(",") if tid.strip()]
+    else:
+        traces = find_failing_traces(args.logs, levels, args.start, args.end)
+    if args.limit:
+        traces = traces[:args.limit]
+    if not traces:
+        print("🎉 指定范围内没有 WARN / ERROR 交易")
+        return
+
+    out_dir = os.path.join(args.output, args.run or time.strftime("%Y%m%d"))
+    diagnoser = BatchDiagnoser(args, out_dir)
+    if not diagnoser.client.is_healthy():
+        print(f"⚠️  无法连接 Ollama: {diagnoser.client.host} (请先运行 `ollama serve`)")
+        return
+    try:
+        diagnoser.run(traces)
+    except KeyboardInterrupt:
+        print("\n⏸️  已中断，重新运行同一命令会从检查点继续")
+    finally:
+        write_summary(out_dir, diagnoser.checkpoint, traces)
+        print(f"📄 汇总报告: {os.path.join(out_dir, SUMMARY_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
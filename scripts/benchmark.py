@@ -0,0 +1,431 @@
+"""
+检索 / 日志检索性能基准 (合成数据，结果写成 JSON 便于前后对比)
+
+知识库：按 knowledge_index.json 的结构 (id / content / vector / source / page) 生成 1k / 100k / 1M 切片，
+    写成二进制索引 (切片数不超过 --json-max 时同时写旧版 JSON，用来测旧加载路径)。
+    向量围绕若干主题质心分布，文本由主题词 + 交易码 / 类名 / 错误码组成，BM25 与向量检索都有意义。
+    查询取自某个切片 (主题词 + 该切片独有的代码词，向量 = 切片向量 + 噪声)：
+        recall@k   结果与 float32 暴力检索 top-k 的重合率；vector / ivf_nprobe_* 关掉 BM25 加分测纯向量召回，
+                   量化精度和 nprobe 的退化都体现在这里。vector+bm25 的重合率本来就低 (BM25 会改变排序)，只作参考
+        hit@k      来源切片是否出现在 top-k 中
+日志：按 logs/ 中的格式 `时间戳 [LEVEL] [G...] [T...] 类名 - 消息` 生成多个服务、总计 --log-mb 的日志，
+    并按日志规模等间隔埋入目标流水号 (每个服务每个目标至少 LOG_HITS_PER_TARGET 行)，
+    测倒排索引构建 / 查询、mmap 全量扫描和时间线合并。
+
+每个场景在独立子进程中运行，峰值 RSS 互不干扰。
+
+用法 (在 scripts 目录下运行，与 vectorize.py 一致)：
+    python benchmark.py                                  # 1k,100k 切片 + 256 MB 日志
+    python benchmark.py --sizes 1k,100k,1m --log-mb 4096 --ann
+    python benchmark.py --compare ../.cache/bench/results-20260131-101500.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import index_store, log_index, log_scan, log_timeline, retrieval  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = "../.cache/bench"
+DIM = 384
+N_TOPICS = 256
+TOPIC_NOISE = 0.35
+QUERY_NOISE = 0.05
+TOP_K = 10
+GEN_BATCH = 20000
+
+TOPIC_WORDS = ["贷款审批", "额度管理", "风控模型", "存款入账", "利息计算", "批量任务", "开发环境", "VPN 接入",
+               "数据库连接池", "日志规范", "放款流程", "对账文件", "账户冻结", "反洗钱", "征信查询", "还款计划",
+               "逾期催收", "核心记账", "清算轧差", "灰度发布", "配置中心", "消息队列", "分布式事务", "接口鉴权"]
+FILLER = ["系统", "需要", "配置", "参数", "调用", "返回", "校验", "失败", "成功", "处理", "说明", "注意", "步骤",
+          "服务", "字段", "交易", "用户", "金额", "超时", "重试", "版本", "上线", "文档", "负责人"]
+CLASS_PARTS = ["Loan", "Quota", "Risk", "Deposit", "Interest", "Calc", "Batch", "Account", "Repay", "Credit"]
+CLASS_SUFFIX = ["Service", "Controller", "Mapper", "Util", "Client", "Job", "Handler"]
+
+LOG_SERVICES = [("loan-service", "c.f.l"), ("deposit-service", "c.f.d"), ("risk-service", "c.f.r")]
+LOG_LEVELS = ["INFO ", "INFO ", "INFO ", "INFO ", "DEBUG", "WARN ", "ERROR"]
+LOG_MESSAGES = ["收到放款申请请求: 用户[{u}], 金额[{a}], 申请单号[APP{n}]",
+                "[{u}] 风控准入校验通过: Score[{s}], Level[LOW_RISK]",
+                "[{u}] 账务变动完成: Credit[{a}], Seq[DEP{n}]",
+                "HikariPool-1 - Pool stats (total=20, active={s}, idle=10, waiting=0)",
+                "任务调度器心跳检查正常...",
+                "远程调用失败，原因：下游服务返回异常. Status[500], Body[{{\"code\":\"500\"}}]"]
+LOG_TARGETS = 20
+LOG_HITS_PER_TARGET = 5
+# 估算每个文件行数用的平均行长 (字节)，只影响目标流水号的间隔
+LOG_LINE_BYTES = 160
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {"p50_ms": float(np.percentile(arr, 50)), "p99_ms": float(np.percentile(arr, 99)),
+            "mean_ms": float(arr.mean()), "n": len(arr)}
+
+
+def run_isolated(fn, *args):
+    """在新的子进程里运行 fn(*args)，返回其结果 (峰值 RSS 只统计该场景)"""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(fn, args)
+
+
+# ==========================================
+# 合成知识库
+# ==========================================
+def _unique_code(i):
+    rng = random.Random(i)
+    cls = rng.choice(CLASS_PARTS) + rng.choice(CLASS_PARTS) + rng.choice(CLASS_SUFFIX)
+    return f"{cls} txn_{i:07d} E{i % 9973:04d}"
+
+
+def _chunk_text(i, topic, rng):
+    words = [TOPIC_WORDS[topic % len(TOPIC_WORDS)], TOPIC_WORDS[(topic * 7) % len(TOPIC_WORDS)]]
+    words += rng.choices(FILLER, k=24)
+    rng.shuffle(words)
+    return "，".join(words) + "。相关代码：" + _unique_code(i)
+
+
+def generate_knowledge_base(out_dir, count, json_max, dtype, ann, seed=0):
+    """生成合成切片，返回查询集 {"texts", "vectors", "source_rows"} 的保存路径"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    text_rng = random.Random(seed)
+    centroids = retrieval.normalize_rows(rng.normal(size=(N_TOPICS, DIM)))
+
+    json_path = os.path.join(out_dir, "knowledge_index.json")
+    json_out = open(json_path, "w", encoding="utf-8") if count <= json_max else None
+    if json_out is not None:
+        json_out.write("[")
+    n_queries = min(500, count)
+    query_rows = set(rng.choice(count, n_queries, replace=False).tolist())
+    queries = {"texts": [], "vectors": [], "source_rows": []}
+
+    index_dir = os.path.join(out_dir, "knowledge_index")
+    with index_store.IndexWriter(index_dir, dim=DIM, dtype=dtype, ann_lists=0 if ann else None) as writer:
+        for start in range(0, count, GEN_BATCH):
+            n = min(GEN_BATCH, count - start)
+            topics = rng.integers(0, N_TOPICS, n)
+            vectors = retrieval.normalize_rows(centroids[topics] + TOPIC_NOISE * rng.normal(size=(n, DIM)))
+            ids = list(range(start, start + n))
+            texts = [_chunk_text(i, int(t), text_rng) for i, t in zip(ids, topics)]
+            sources = [f"docs/topic_{int(t):03d}.pdf" for t in topics]
+            pages = [i % 50 + 1 for i in ids]
+            writer.add_batch(ids, texts, vectors, sources, pages)
+
+            for j, i in enumerate(ids):
+                if json_out is not None:
+                    rec = {"id": i, "content": texts[j], "vector": np.round(vectors[j], 6).tolist(),
+                           "source": sources[j], "page": pages[j]}
+                    json_out.write(("," if i else "") + json.dumps(rec, ensure_ascii=False))
+                if i in query_rows:
+                    topic = int(topics[j])
+                    code = _unique_code(i).split()[1]
+                    queries["texts"].append(f"{TOPIC_WORDS[topic % len(TOPIC_WORDS)]} {code} 怎么处理")
+                    noisy = vectors[j] + QUERY_NOISE * rng.normal(size=DIM)
+                    queries["vectors"].append(retrieval.normalize_rows(noisy[None, :])[0])
+                    queries["source_rows"].append(i)
+    if json_out is not None:
+        json_out.write("]")
+        json_out.close()
+
+    query_path = os.path.join(out_dir, "queries.npz")
+    np.savez(query_path, texts=np.asarray(queries["texts"]), vectors=np.asarray(queries["vectors"], dtype=np.float32),
+             source_rows=np.asarray(queries["source_rows"], dtype=np.int64))
+    return query_path
+
+
+class _SyntheticEmbedder:
+    """查询文本 -> 预先生成的查询向量 (基准测试不加载真实模型，只测检索本身)"""
+
+    def __init__(self, texts, vectors):
+        self._vectors = dict(zip(texts, vectors))
+
+    def embed_documents(self, texts):
+        return [self._vectors[t] for t in texts]
+
+
+def bench_json_load(json_path):
+    """
+    子进程：旧版 JSON 索引的加载耗时 / 峰值 RSS
+    必须与二进制索引分开测：ru_maxrss 是整个进程的峰值，放在同一进程里二进制索引的数字永远不低于 JSON 的
+    """
+    t0 = time.perf_counter()
+    with open(json_path, "r", encoding="utf-8") as f:
+        legacy = index_store.KnowledgeIndex.from_records(json.load(f))
+    result = {"json_load_s": time.perf_counter() - t0, "json_load_rss_mb": peak_rss_mb(), "json_chunks": len(legacy)}
+    return result
+
+
+def bench_knowledge_base(out_dir, query_path, nprobes):
+    """子进程：二进制索引的打开耗时 / 峰值 RSS / 各检索模式的延迟与召回"""
+    result = {}
+    index_dir = os.path.join(out_dir, "knowledge_index")
+
+    t0 = time.perf_counter()
+    index = index_store.KnowledgeIndex.open(index_dir)
+    result["binary_open_s"] = time.perf_counter() - t0
+    q = np.load(query_path)
+    texts, qvecs, source_rows = [str(t) for t in q["texts"]], q["vectors"], q["source_rows"]
+    embedder = _SyntheticEmbedder(texts, qvecs)
+    t0 = time.perf_counter()
+    retriever = retrieval.VectorRetriever(index, embedder)
+    result["retriever_init_s"] = time.perf_counter() - t0
+    result["open_rss_mb"] = peak_rss_mb()
+
+    # 基准答案：float32 暴力检索
+    exact = index.exact_vectors if index.exact_vectors is not None else index.vectors
+    truth = []
+    for vec in qvecs:
+        scores = np.asarray(exact @ vec, dtype=np.float32)
+        truth.append(set(retrieval.top_k_indices(scores, TOP_K).tolist()))
+
+    # 向量模式不叠加 BM25 加分，否则 recall 衡量的是混合排序与纯向量排序的差异，量化 / nprobe 的退化看不出来
+    vector_only = retrieval.VectorRetriever(index, embedder, use_lexical=False)
+    modes = [("vector", vector_only, index.ann.n_lists if index.ann is not None else None)]
+    if index.ann is not None:
+        modes += [(f"ivf_nprobe_{n}", vector_only, n) for n in nprobes if n < index.ann.n_lists]
+    modes.append(("vector+bm25", retriever, None))
+    modes.append(("bm25_only", retrieval.VectorRetriever(index, None), None))
+
+    result["queries"] = {}
+    for name, r, nprobe in modes:
+        latencies, recall_hits, source_hits = [], 0, 0
+        for text, expected, src in zip(texts, truth, source_rows):
+            t0 = time.perf_counter()
+            hits = r.search(text, TOP_K, nprobe)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            rows = {item["id"] for item, _ in hits}  # 合成切片的 id 即行号
+            recall_hits += len(expected & rows)
+            source_hits += int(src in rows)
+        stats = percentiles(latencies)
+        stats["recall_at_k"] = recall_hits / (TOP_K * len(texts))
+        stats["hit_at_k"] = source_hits / len(texts)
+        result["queries"][name] = stats
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["chunks"] = len(index)
+    return result
+
+
+# ==========================================
+# 合成日志
+# ==========================================
+def _log_line(ts, level, gid, tid, cls, msg):
+    return f"{ts} [{level}] [{gid}] [{tid}] {cls} - {msg}\n"
+
+
+def generate_logs(log_dir, total_mb, seed=0):
+    """按 logs/ 的格式生成多个服务的日志，返回埋入的目标流水号列表"""
+    shutil.rmtree(log_dir, ignore_errors=True)
+    os.makedirs(log_dir)
+    rng = random.Random(seed)
+    per_file = total_mb * 1024 * 1024 // len(LOG_SERVICES)
+    # 按预计行数等间隔埋点，日志再小每个目标也有命中，不会拿空结果集的耗时当真实延迟
+    interval = max(1, per_file // LOG_LINE_BYTES // (LOG_TARGETS * LOG_HITS_PER_TARGET))
+    targets = [f"G8898{20260131000000 + i * 7919:014d}" for i in range(LOG_TARGETS)]
+    base = time.mktime(time.strptime("2026-01-31 00:00:00", "%Y-%m-%d %H:%M:%S"))
+
+    for name, pkg in LOG_SERVICES:
+        written, seq, buf = 0, 0, []
+        with open(os.path.join(log_dir, f"{name}.log"), "w", encoding="utf-8") as f:
+            while written < per_file:
+                seq += 1
+                t = base + seq * 0.004
+                ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + f".{int(t * 1000) % 1000:03d}"
+                # 目标流水号均匀地埋在文件各处，每个服务都有
+                if seq % interval == 0:
+                    gid = targets[(seq // interval) % LOG_TARGETS]
+                    level = "ERROR"
+                else:
+                    gid = f"G8898{rng.randrange(10 ** 13):014d}"
+                    level = rng.choice(LOG_LEVELS)
+                tid = "T" + gid[1:]
+                cls = f"{pkg}.s.{rng.choice(CLASS_PARTS)}{rng.choice(CLASS_SUFFIX)}"
+                msg = rng.choice(LOG_MESSAGES).format(u=rng.choice(["ZhangSan", "LiSi", "WangWu"]),
+                                                      a=f"{rng.randrange(100, 99999)}.00", n=seq,
+                                                      s=rng.randrange(100))
+                line = _log_line(ts, level, gid, tid, cls, msg)
+                buf.append(line)
+                written += len(line.encode("utf-8"))
+                if len(buf) >= 10000:
+                    f.write("".join(buf))
+                    buf = []
+            f.write("".join(buf))
+    return targets
+
+
+def bench_logs(log_dir, db_path, targets):
+    """子进程：倒排索引冷构建 / 查询、mmap 全量扫描、时间线合并"""
+    result = {"log_bytes": sum(os.path.getsize(os.path.join(log_dir, n)) for n in os.listdir(log_dir))}
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    index = log_index.LogIndex(log_dir, db_path)
+    t0 = time.perf_counter()
+    index.refresh()
+    result["index_build_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.refresh()
+    result["index_refresh_noop_ms"] = (time.perf_counter() - t0) * 1000
+
+    lookup, timeline = [], []
+    for trace_id in targets:
+        t0 = time.perf_counter()
+        hits = index.read_hits(trace_id)
+        elapsed = (time.perf_counter() - t0) * 1000
+        if not any(hits.values()):
+            raise RuntimeError(f"目标流水号 {trace_id} 在合成日志中没有命中，查询耗时没有意义 (请重新生成日志)")
+        lookup.append(elapsed)
+        t0 = time.perf_counter()
+        log_timeline.build_timeline(trace_id, log_dir, hits, 2, 2)
+        timeline.append((time.perf_counter() - t0) * 1000)
+    result["index_lookup"] = percentiles(lookup)
+    result["timeline_build"] = percentiles(timeline)
+
+    scan = []
+    for trace_id in targets[:5]:
+        t0 = time.perf_counter()
+        log_scan.scan_logs(log_dir, trace_id)
+        scan.append((time.perf_counter() - t0) * 1000)
+    result["full_scan"] = percentiles(scan)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# ==========================================
+# 结果输出 / 对比
+# ==========================================
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "commit": commit, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def _flatten(obj, prefix=""):
+    out = {}
+    for key, value in obj.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(baseline_path, current):
+    """打印与基线结果的差异 (耗时 / 内存变大 >10% 标记为退化，召回下降标记为退化)"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = _flatten(json.load(f)["results"])
+    now = _flatten(current["results"])
+    print(f"📊 对比基线 {baseline_path}:")
+    for key in sorted(set(baseline) & set(now)):
+        old, new = baseline[key], now[key]
+        if not old:
+            continue
+        change = (new - old) / abs(old)
+        higher_is_better = key.endswith(("recall_at_k", "hit_at_k"))
+        worse = change < -0.01 if higher_is_better else change > 0.10
+        flag = "⚠️ " if worse else "   "
+        print(f"  {flag}{key:60s} {old:12.3f} -> {new:12.3f} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索 / 日志检索性能基准")
+    parser.add_argument("--sizes", default="1k,100k", help="合成知识库切片数，逗号分隔 (支持 k / m 后缀)")
+    parser.add_argument("--json-max", default="100k", help="切片数不超过该值时同时生成旧版 JSON 并测加载")
+    parser.add_argument("--dtype", default="float32", choices=index_store.SUPPORTED_DTYPES, help="向量存储精度")
+    parser.add_argument("--ann", action="store_true", help="同时构建 IVF 索引并测不同 nprobe")
+    parser.add_argument("--nprobe", default="8,32", help="要测的 nprobe，逗号分隔")
+    parser.add_argument("--log-mb", type=int, default=256, help="合成日志总大小 (MB)，0 跳过日志基准")
+    parser.add_argument("--data-dir", default=BENCH_DIR, help="合成数据目录 (可复用)")
+    parser.add_argument("--reuse", action="store_true", help="数据目录已有同规模数据时不重新生成")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径 (默认 数据目录/results-时间戳.json)")
+    parser.add_argument("--compare", default=None, help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    nprobes = [int(x) for x in args.nprobe.split(",") if x.strip()]
+    json_max = parse_size(args.json_max)
+    report = {"env": environment(), "config": vars(args), "results": {}}
+
+    for size_text in args.sizes.split(","):
+        count = parse_size(size_text)
+        out_dir = os.path.join(args.data_dir, f"kb_{count}")
+        query_path = os.path.join(out_dir, "queries.npz")
+        if not (args.reuse and os.path.exists(query_path)):
+            print(f"🧪 生成 {count} 个合成切片 -> {out_dir}")
+            t0 = time.perf_counter()
+            query_path = run_isolated(generate_knowledge_base, out_dir, count, json_max, args.dtype, args.ann)
+            print(f"    用时 {time.perf_counter() - t0:.1f}s")
+        print(f"⏱️  知识库基准: {count} 个切片")
+        res = run_isolated(bench_knowledge_base, out_dir, query_path, nprobes)
+        json_path = os.path.join(out_dir, "knowledge_index.json")
+        if os.path.exists(json_path):
+            res.update(run_isolated(bench_json_load, json_path))
+        report["results"][f"kb_{count}"] = res
+        for name, q in res["queries"].items():
+            print(f"    {name:16s} p50 {q['p50_ms']:7.2f} ms  p99 {q['p99_ms']:7.2f} ms  "
+                  f"recall@{TOP_K} {q['recall_at_k']:.1%}  hit@{TOP_K} {q['hit_at_k']:.1%}")
+        print(f"    打开索引 {res['binary_open_s']:.2f}s · 峰值 RSS {res['peak_rss_mb'] or 0:.0f} MB")
+        if "json_load_s" in res:
+            print(f"    旧版 JSON 加载 {res['json_load_s']:.2f}s · 峰值 RSS {res['json_load_rss_mb'] or 0:.0f} MB"
+                  f" (打开后 RSS: 二进制 {res['open_rss_mb'] or 0:.0f} MB)")
+
+    if args.log_mb:
+        log_dir = os.path.join(args.data_dir, "logs")
+        targets_path = os.path.join(args.data_dir, "log_targets.json")
+        if args.reuse and os.path.exists(targets_path):
+            with open(targets_path, "r", encoding="utf-8") as f:
+                targets = json.load(f)
+        else:
+            print(f"🧪 生成 {args.log_mb} MB 合成日志 -> {log_dir}")
+            targets = generate_logs(log_dir, args.log_mb)
+            with open(targets_path, "w", encoding="utf-8") as f:
+                json.dump(targets, f)
+        print("⏱️  日志检索基准")
+        res = run_isolated(bench_logs, log_dir, os.path.join(args.data_dir, "log_index.sqlite"), targets)
+        report["results"]["logs"] = res
+        print(f"    倒排索引冷构建 {res['index_build_s']:.1f}s · 查询 p50 {res['index_lookup']['p50_ms']:.2f} ms"
+              f" · 全量扫描 p50 {res['full_scan']['p50_ms']:.0f} ms · 时间线 p50 {res['timeline_build']['p50_ms']:.2f} ms")
+
+    output = args.output or os.path.join(args.data_dir, time.strftime("results-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 结果已写入 {output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+为已有的二进制索引构建 IVF 近似最近邻索引，并输出 recall@k 报告 (用来挑 nprobe)
+
+用法 (在 scripts 目录下运行，与 vectorize.py 一致)：
+    python build_ann.py                          # 按切片数自动选择桶数，构建并评估
+    python build_ann.py --lists 1024 --nprobe 4,8,16,32 --k 10
+    python build_ann.py --report-only            # 只评估现有的 IVF 索引
+选定的 nprobe 通过环境变量 KB_ANN_NPROBE 传给 app.py，或在知识库管理页调整
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import ann_index, index_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建 IVF 索引并评估召回率")
+    parser.add_argument("--index", default="../public/knowledge_index", help="二进制索引目录")
+    parser.add_argument("--lists", type=int, default=0, help="IVF 桶数 (0 = 约 4 * sqrt(切片数))")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64", help="要评估的 nprobe，逗号分隔")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--queries", type=int, default=200, help="评估用的查询数")
+    parser.add_argument("--report-only", action="store_true", help="不重建，只评估现有 IVF 索引")
+    args = parser.parse_args()
+
+    if not index_store.index_exists(args.index):
+        print(f"⚠️  未找到二进制索引: {args.index} (先运行 vectorize.py 或 convert_index.py)")
+        return
+    index = index_store.KnowledgeIndex.open(args.index)
+    if not len(index) or not index.has_vectors:
+        print("⚠️  索引中没有向量")
+        return
+
+    # 量化索引用 float32 原始向量副本训练和评估
+    vectors = index.exact_vectors if index.exact_vectors is not None else index.vectors
+    if args.report_only:
+        ivf = index.ann
+        if ivf is None:
+            print("⚠️  索引目录中没有可用的 IVF 索引 (不存在或已过期)")
+            return
+    else:
+        t0 = time.time()
+        ivf = ann_index.IvfIndex.build(vectors, args.lists or None)
+        ivf.write(args.index)
+        # IVF 文件不在 KnowledgeStore 的指纹里：更新 header.json，运行中的 app.py 才会热加载新索引
+        index_store.update_header(args.index, ann_lists=ivf.n_lists)
+        print(f"🎉 IVF 构建完成: {len(index)} 个切片 -> {ivf.n_lists} 个桶 (用时 {time.time() - t0:.1f}s)")
+
+    nprobes = [int(x) for x in args.nprobe.split(",") if x.strip()]
+    report = ann_index.recall_report(vectors, ivf, nprobes, args.k, args.queries)
+    ann_index.print_recall_report(report, args.k)
+
+
+if __name__ == "__main__":
+    main()
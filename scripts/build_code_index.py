@@ -0,0 +1,49 @@
+"""
+预先构建 / 增量更新 Java 工程代码索引 (存量功能交接页使用同一个索引库)
+
+用法 (在 scripts 目录下运行，与 vectorize.py 一致)：
+    python build_code_index.py                          # 索引 ../code (或环境变量 CODE_PROJECT_DIR)
+    python build_code_index.py --project /data/loan-core --workers 8
+    python build_code_index.py --lookup loan_approval_01 # 更新后查询交易码的调用链
+首次全量解析大工程较慢，建议在部署时先跑一遍；之后页面查询只会解析变更过的文件
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import code_index  # noqa: E402
+
+
+def main():
+    default_project = os.environ.get("CODE_PROJECT_DIR") or os.path.join("..", code_index.DEFAULT_PROJECT_DIR)
+    parser = argparse.ArgumentParser(description="构建 Java 工程代码索引")
+    parser.add_argument("--project", default=default_project, help="Java 工程根目录")
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数 (默认 CPU 核数)")
+    parser.add_argument("--lookup", default="", help="更新后查询的交易码 / 路径 / 方法名")
+    parser.add_argument("--depth", type=int, default=code_index.CHAIN_MAX_DEPTH, help="调用链展开深度")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.project):
+        print(f"⚠️  工程目录不存在: {args.project}")
+        return
+    index = code_index.CodeIndex(args.project, db_path=code_index.default_db_path(args.project, "../.cache"),
+                                 workers=args.workers)
+    stats = index.refresh()
+    counts = index.stats()
+    print(f"🎉 索引更新完成: {stats['files']} 个文件，解析 {stats['parsed']} 个，未变 {stats['unchanged']} 个，"
+          f"移除 {stats['removed']} 个 (用时 {stats['elapsed_ms'] / 1000:.1f}s)")
+    print(f"   {counts['classes']} 个类 · {counts['methods']} 个方法 · {counts['calls']} 条调用 · "
+          f"{counts['statements']} 条 MyBatis 语句 -> {index.db_path}")
+
+    if args.lookup:
+        results, ms = index.lookup(args.lookup, args.depth)
+        print(f"\n🔍 {args.lookup}: {len(results)} 个入口 ({ms:.1f} ms)")
+        for entry, chain in results:
+            print(f"\n[{entry['reason']}] {entry['fqcn']}.{entry['method']}()")
+            print(code_index.render_chain(chain, entry["method_id"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+把旧版 knowledge_index.json 转换为二进制 mmap 索引
+
+用法 (在 scripts 目录下运行，与 vectorize.py 一致)：
+    python convert_index.py
+    python convert_index.py --input ../public/knowledge_index.json --output ../public/knowledge_index --dtype float16
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import index_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 知识库 -> 二进制 mmap 索引")
+    parser.add_argument("--input", default="../public/knowledge_index.json", help="旧版 JSON 索引路径")
+    parser.add_argument("--output", default="../public/knowledge_index", help="二进制索引输出目录")
+    parser.add_argument("--dtype", default="float32", choices=index_store.SUPPORTED_DTYPES, help="向量存储精度")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"⚠️  未找到 JSON 索引: {args.input}")
+        return
+
+    t0 = time.time()
+    try:
+        count = index_store.convert_json_index(args.input, args.output, dtype=args.dtype)
+    except ValueError as e:
+        print(f"⚠️  {e}")
+        return
+    print(f"🎉 转换完成: {count} 个切片 -> {args.output} ({args.dtype}, 用时 {time.time() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
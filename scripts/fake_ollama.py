@@ -0,0 +1,275 @@
+"""
+本地模拟 Ollama 服务 (只用标准库，不需要 GPU / 模型)
+
+按 Ollama 的协议返回 NDJSON 流式 /api/chat，用来在没有真实模型的机器上压测对话 / 诊断流程：
+    GET  /api/version   健康检查
+    GET  /api/tags      模型列表
+    POST /api/chat      每行一个 {"model", "created_at", "message": {"role", "content"}, "done": false}，
+                        最后一行 done=true 并带上 eval_count / eval_duration 等统计
+可配置：
+    首 token 延迟 (含抖动)、生成速度 (tokens/s)、输出 token 数、<think> 思考段 (R1 类模型默认开启)、
+    同时生成数上限 (模拟 OLLAMA_NUM_PARALLEL，超出的请求在服务端排队)、
+    错误注入：HTTP 500、流内 {"error": ...}、生成中途断开连接
+
+用法 (在 scripts 目录下运行)：
+    python fake_ollama.py                                   # 监听 127.0.0.1:11435
+    python fake_ollama.py --ttft-ms 800 --tps 12 --parallel 2 --error-rate 0.05
+    OLLAMA_HOST=http://127.0.0.1:11435 streamlit run app.py  # 让 app.py 连到模拟服务
+也可以在进程内启动 (loadtest.py --fake)：
+    server = FakeOllamaServer(FakeOllamaConfig(tps=50)).start()
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 11435
+VERSION = "0.0.0-fake"
+
+THINK_WORDS = ["先", "看一下", "日志", "里", "的", "报错", "，", "风控", "服务", "返回", "500", "，",
+               "可能", "是", "下游", "超时", "导致", "的", "。", "再", "确认", "一下", "连接池", "状态", "。"]
+ANSWER_WORDS = ["## ", "根因", "分析", "\n\n", "1. ", "链路", "：", "loan-service", " -> ", "risk-service",
+                "\n", "2. ", "根因", "：", "风控", "服务", "响应", "超时", "，", "放款", "流程", "中断", "。",
+                "\n", "3. ", "建议", "：", "检查", "HikariPool", "连接池", "配置", "并", "增加", "重试", "。", "\n"]
+
+
+@dataclass
+class FakeOllamaConfig:
+    ttft_ms: float = 300.0  # 首 token 延迟 (模拟 prefill)
+    ttft_per_kchar_ms: float = 0.0  # 每千字符 prompt 额外增加的首 token 延迟
+    jitter: float = 0.2  # 延迟的随机抖动比例
+    tps: float = 20.0  # 生成速度 (tokens/s)
+    tokens: int = 200  # 正文 token 数
+    think_tokens: int = 80  # 思考段 token 数 (0 = 不输出)
+    think_models: str = "r1"  # 模型名包含这些子串 (逗号分隔) 时输出思考段，"*" 表示所有模型
+    parallel: int = 0  # 同时生成数上限 (0 = 不限)
+    error_rate: float = 0.0  # 直接返回 HTTP 500 的比例
+    stream_error_rate: float = 0.0  # 生成中途返回 {"error": ...} 的比例
+    drop_rate: float = 0.0  # 生成中途断开连接的比例
+    models: str = "qwen3-vl:8b,deepseek-r1:8b,qwen2.5,llama3"
+    seed: int = None
+
+
+class FakeOllamaServer:
+    def __init__(self, config=None, host="127.0.0.1", port=DEFAULT_PORT):
+        self.config = config or FakeOllamaConfig()
+        self.rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.config.parallel) if self.config.parallel > 0 else None
+        self.stats = {"requests": 0, "errors": 0, "dropped": 0, "tokens": 0, "active": 0, "max_active": 0}
+        self._stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """后台线程启动，返回 self"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def random(self):
+        with self._rng_lock:
+            return self.rng.random()
+
+    def jittered(self, seconds):
+        j = self.config.jitter
+        return max(0.0, seconds * (1 + j * (2 * self.random() - 1)))
+
+    def count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+
+    def wants_think(self, model):
+        patterns = [p.strip() for p in self.config.think_models.split(",") if p.strip()]
+        return self.config.think_tokens > 0 and any(p == "*" or p in model for p in patterns)
+
+    def token_stream(self, model):
+        """(token, 是否思考段) 序列"""
+        if self.wants_think(model):
+            yield "<think>", True
+            for i in range(self.config.think_tokens):
+                yield THINK_WORDS[i % len(THINK_WORDS)], True
+            yield "</think>", True
+            yield "\n\n", False
+        for i in range(self.config.tokens):
+            yield ANSWER_WORDS[i % len(ANSWER_WORDS)], False
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive，与 OllamaClient 的连接池配合
+
+        def log_message(self, fmt, *args):  # 压测时不刷屏
+            pass
+
+        def _send_json(self, status, body):
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _write_chunk(self, body):
+            raw = (json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/version":
+                self._send_json(200, {"version": VERSION})
+            elif self.path == "/api/tags":
+                models = [m.strip() for m in server.config.models.split(",") if m.strip()]
+                self._send_json(200, {"models": [{"name": m, "model": m} for m in models]})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "invalid JSON body"})
+                return
+            server.count(requests=1)
+            if server.random() < server.config.error_rate:
+                server.count(errors=1)
+                self._send_json(500, {"error": "injected failure"})
+                return
+
+            if server._slots is not None:
+                server._slots.acquire()
+            server.count(active=1)
+            try:
+                self._stream_chat(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端取消
+            finally:
+                server.count(active=-1)
+                if server._slots is not None:
+                    server._slots.release()
+
+        def _stream_chat(self, payload):
+            cfg = server.config
+            model = payload.get("model", "")
+            prompt_chars = sum(len(m.get("content", "")) for m in payload.get("messages", []))
+            stream_error = server.random() < cfg.stream_error_rate
+            drop = server.random() < cfg.drop_rate
+            start = time.perf_counter()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            prefill = (cfg.ttft_ms + cfg.ttft_per_kchar_ms * prompt_chars / 1000) / 1000
+            time.sleep(server.jittered(prefill))
+            first_token_at = time.perf_counter()
+            interval = 1.0 / cfg.tps if cfg.tps > 0 else 0.0
+            tokens = list(server.token_stream(model))
+            fail_at = int(len(tokens) * server.random()) if (stream_error or drop) else -1
+            next_at = first_token_at
+
+            for i, (token, _) in enumerate(tokens):
+                if i == fail_at:
+                    if drop:
+                        server.count(dropped=1)
+                        self.close_connection = True
+                        self.wfile.flush()
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                        return
+                    server.count(errors=1)
+                    self._write_chunk({"error": "injected stream failure"})
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at += server.jittered(interval)
+                self._write_chunk({"model": model, "created_at": _now_iso(),
+                                   "message": {"role": "assistant", "content": token}, "done": False})
+                server.count(tokens=1)
+
+            end = time.perf_counter()
+            self._write_chunk({"model": model, "created_at": _now_iso(), "message": {"role": "assistant", "content": ""},
+                               "done": True, "done_reason": "stop",
+                               "total_duration": int((end - start) * 1e9),
+                               "prompt_eval_count": prompt_chars // 2,
+                               "prompt_eval_duration": int((first_token_at - start) * 1e9),
+                               "eval_count": len(tokens), "eval_duration": int((end - first_token_at) * 1e9)})
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def _now_iso():
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + "Z"
+
+
+def add_config_args(parser):
+    """把 FakeOllamaConfig 的参数加到 argparse (loadtest.py --fake 复用)"""
+    defaults = FakeOllamaConfig()
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="首 token 延迟 (ms)")
+    parser.add_argument("--ttft-per-kchar-ms", type=float, default=defaults.ttft_per_kchar_ms,
+                        help="每千字符 prompt 额外的首 token 延迟 (ms)")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="延迟抖动比例 (0~1)")
+    parser.add_argument("--tps", type=float, default=defaults.tps, help="生成速度 (tokens/s)")
+    parser.add_argument("--tokens", type=int, default=defaults.tokens, help="正文 token 数")
+    parser.add_argument("--think-tokens", type=int, default=defaults.think_tokens, help="思考段 token 数")
+    parser.add_argument("--think-models", default=defaults.think_models, help="输出思考段的模型名子串 (逗号分隔，* 为全部)")
+    parser.add_argument("--parallel", type=int, default=defaults.parallel, help="服务端同时生成数上限 (0 不限)")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="HTTP 500 比例")
+    parser.add_argument("--stream-error-rate", type=float, default=defaults.stream_error_rate, help="流内报错比例")
+    parser.add_argument("--drop-rate", type=float, default=defaults.drop_rate, help="中途断开连接比例")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def config_from_args(args):
+    return FakeOllamaConfig(ttft_ms=args.ttft_ms, ttft_per_kchar_ms=args.ttft_per_kchar_ms, jitter=args.jitter,
+                            tps=args.tps, tokens=args.tokens, think_tokens=args.think_tokens,
+                            think_models=args.think_models, parallel=args.parallel, error_rate=args.error_rate,
+                            stream_error_rate=args.stream_error_rate, drop_rate=args.drop_rate, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Ollama /api/chat 流式服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_config_args(parser)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(config_from_args(args), args.host, args.port)
+    print(f"🧪 模拟 Ollama 已启动: {server.url} (设置 OLLAMA_HOST={server.url} 让 app.py 连接)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"📊 {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
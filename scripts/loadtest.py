@@ -0,0 +1,300 @@
+"""
+对话 / 诊断流程并发压测
+
+模拟 N 个用户同时使用 app.py：
+    chat       新人助手：知识库检索 -> 拼 Prompt -> 流式生成 (RenderThrottle 按帧率合并刷新)
+    diagnosis  故障诊断：倒排索引查 Trace ID -> 跨服务时间线 -> 日志压缩 -> 流式生成 (ThinkStreamParser 拆思考段)
+推理调用与 app.py 的 call_ollama_stream 相同：ResponseCache.cached_stream -> InferenceScheduler -> OllamaClient.chat_stream
+(app.py 依赖 Streamlit 运行时，无法直接 import，这里按相同的组合方式复刻调用链)
+
+输出每类请求的 端到端耗时 / 首 token 延迟 / 排队耗时 / 生成速度 的分布，以及整体吞吐，可选写入 JSON。
+
+用法 (在 scripts 目录下运行)：
+    python loadtest.py --fake --users 10 --requests 5                 # 进程内启动 fake_ollama，不需要 GPU
+    python loadtest.py --fake --tps 8 --ttft-ms 1500 --parallel 1 --max-concurrent 2 --users 20
+    python loadtest.py --host http://10.0.0.5:11434 --model qwen2.5 --flow chat --users 4
+    python loadtest.py --fake --no-scheduler                          # 对比：每个用户直连 Ollama
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core import (diagnosis, knowledge_store, llm_client, log_compact, log_index,  # noqa: E402
+                  response_cache, retrieval, scheduler, stream_parser)
+import fake_ollama  # noqa: E402
+
+LOG_DIR = "../logs"
+LOG_DB = "../.cache/log_index.sqlite"
+INDEX_DIR = "../public/knowledge_index"
+JSON_PATH = "../public/knowledge_index.json"
+
+CHAT_QUESTIONS = ["我是新来的，请问怎么配置开发环境？", "VPN 怎么连？", "放款流程涉及哪些服务？",
+                  "风控准入校验失败怎么排查？", "数据库连接池参数在哪里配置？", "日志规范有哪些要求？",
+                  "批量任务失败了怎么重跑？", "存款入账的交易码是什么？"]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def distribution(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"n": len(values), "mean": sum(values) / len(values), "p50": percentile(values, 50),
+            "p90": percentile(values, 90), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "max": max(values)}
+
+
+class AppHarness:
+    """与 app.py 中 cache_resource 单例相同的共享对象 (整个压测进程一份)"""
+
+    def __init__(self, host, use_scheduler, max_concurrent, cache_db, use_cache, embed):
+        self.client = llm_client.OllamaClient(host)
+        self.scheduler = scheduler.InferenceScheduler(self.client.chat_stream, max_concurrent) if use_scheduler else None
+        self.cache = response_cache.ResponseCache(cache_db)
+        self.use_cache = use_cache
+        self.kb = knowledge_store.KnowledgeStore(retrieval.load_embedding_model() if embed else None,
+                                                 INDEX_DIR, JSON_PATH)
+        self.log_index = log_index.LogIndex(LOG_DIR, LOG_DB) if os.path.isdir(LOG_DIR) else None
+
+    def call_ollama_stream(self, model, messages, metrics=None):
+        """对应 app.py 的 call_ollama_stream"""
+        def scheduled_stream(model, messages, metrics):
+            if self.scheduler is None:
+                yield from self.client.chat_stream(model, messages, metrics)
+                return
+            ticket = self.scheduler.submit(model, messages)
+            yield from self.scheduler.stream(ticket, metrics)
+
+        yield from self.cache.cached_stream(model, messages, scheduled_stream, bypass=not self.use_cache,
+                                            metrics=metrics)
+
+    def trace_ids(self, limit=50):
+        """从日志倒排索引中挑出出现在 ERROR / WARN 行里的流水号 (诊断流程的查询)"""
+        if self.log_index is None:
+            return []
+        self.log_index.refresh()
+        found = []
+        for name in self.log_index.list_log_files():
+            with open(os.path.join(LOG_DIR, name), "rb") as f:
+                for line in f:
+                    if b"[ERROR]" not in line and b"[WARN" not in line:
+                        continue
+                    for m in log_index.TRACE_ID_PATTERN.finditer(line):
+                        tid = m.group(1).decode("ascii")
+                        if tid.startswith("G") and tid not in found:
+                            found.append(tid)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+def run_chat(app, model, question, record):
+    t0 = time.perf_counter()
+    docs = [item for item, _ in app.kb.current().retriever.search(question, 3)]
+    if docs:
+        context = "\n".join([f"- {d['content']}" for d in docs])
+        sys_prompt = f"你是一个友好的技术导师。请基于参考文档回答：\n{context}\n\n用户问题：{question}"
+    else:
+        sys_prompt = f"用户问：{question}。本地知识库没找到，请用通用知识回答并提示他查阅文档。"
+    record["prep_ms"] = (time.perf_counter() - t0) * 1000
+
+    throttle = stream_parser.RenderThrottle()
+    for chunk in app.call_ollama_stream(model, [{"role": "user", "content": sys_prompt}], record["llm"]):
+        record["error"] = record["error"] or chunk.startswith("❌")
+        throttle.tick()
+
+
+def run_diagnosis(app, model, trace_id, variant, record, token_budget):
+    t0 = time.perf_counter()
+    timeline = diagnosis.aggregate_logs(app.log_index, LOG_DIR, trace_id, context_lines=2)
+    log_content = log_compact.compact(timeline.to_text(), token_budget).text if timeline else trace_id
+    prompt = diagnosis.build_prompt(log_content) + variant
+    record["prep_ms"] = (time.perf_counter() - t0) * 1000
+    record["prompt_chars"] = len(prompt)
+
+    parser = stream_parser.ThinkStreamParser()
+    throttle = stream_parser.RenderThrottle()
+    for chunk in app.call_ollama_stream(model, [{"role": "user", "content": prompt}], record["llm"]):
+        record["error"] = record["error"] or chunk.startswith("❌")
+        parser.feed(chunk)
+        throttle.tick()
+    parser.finish()
+    record["think_chars"] = len(parser.think_text)
+
+
+def user_loop(app, args, user, queries, results, lock, start_barrier):
+    rng = random.Random(args.seed * 1000 + user if args.seed is not None else None)
+    start_barrier.wait()
+    if args.ramp_up:
+        time.sleep(args.ramp_up * user / max(args.users, 1))
+    for i in range(args.requests):
+        flow = args.flow if args.flow != "mixed" else rng.choice(["chat", "diagnosis"])
+        if flow == "diagnosis" and not queries["diagnosis"]:
+            flow = "chat"
+        pool = queries[flow]
+        # repeat_ratio 的请求从共享的小池子里挑 (多人问同一个问题 / 查同一个 Trace)，其余请求各不相同
+        if rng.random() < args.repeat_ratio:
+            query, variant = rng.choice(pool[:args.hot_pool]), ""
+        else:
+            query, variant = rng.choice(pool), f" (#{user}-{i})"
+        record = {"user": user, "seq": i, "flow": flow, "query": query + variant, "llm": {}, "error": False}
+        t0 = time.perf_counter()
+        try:
+            if flow == "chat":
+                run_chat(app, args.model, query + variant, record)
+            else:
+                # 同一个 Trace 的诊断 prompt 完全相同；variant 追加在 prompt 末尾，模拟不同的请求
+                run_diagnosis(app, args.model, query, variant, record, args.token_budget)
+        except Exception as e:
+            record["error"] = True
+            record["exception"] = str(e)
+        record["e2e_ms"] = (time.perf_counter() - t0) * 1000
+        llm = record["llm"]
+        if llm.get("ttft_ms") is not None:
+            record["ttft_ms"] = record.get("prep_ms", 0) + llm["ttft_ms"]
+        gen_ms = (llm.get("total_ms") or 0) - (llm.get("ttft_ms") or 0)
+        record["tokens_per_sec"] = llm["chunks"] / (gen_ms / 1000) if llm.get("chunks") and gen_ms > 0 else None
+        with lock:
+            results.append(record)
+        if args.think_time:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+
+def summarize(results, wall_s):
+    summary = {"wall_s": wall_s, "requests": len(results),
+               "errors": sum(1 for r in results if r.get("error")),
+               "cached": sum(1 for r in results if r["llm"].get("cached")),
+               "requests_per_sec": len(results) / wall_s if wall_s else None,
+               "tokens_per_sec": sum(r["llm"].get("chunks") or 0 for r in results) / wall_s if wall_s else None,
+               "flows": {}}
+    for flow in sorted({r["flow"] for r in results}):
+        rows = [r for r in results if r["flow"] == flow]
+        ok = [r for r in rows if not r.get("error")]
+        summary["flows"][flow] = {
+            "requests": len(rows), "errors": len(rows) - len(ok),
+            "cached": sum(1 for r in rows if r["llm"].get("cached")),
+            "e2e_ms": distribution([r["e2e_ms"] for r in ok]),
+            "ttft_ms": distribution([r.get("ttft_ms") for r in ok]),
+            "queue_ms": distribution([r["llm"].get("queue_ms") for r in ok]),
+            "prep_ms": distribution([r.get("prep_ms") for r in ok]),
+            "tokens_per_sec": distribution([r.get("tokens_per_sec") for r in ok if not r["llm"].get("cached")]),
+        }
+    return summary
+
+
+def print_summary(summary, extra):
+    print(f"\n📊 {summary['requests']} 个请求，用时 {summary['wall_s']:.1f}s · "
+          f"{summary['requests_per_sec']:.2f} req/s · 合计 {summary['tokens_per_sec']:.1f} tokens/s · "
+          f"错误 {summary['errors']} · 缓存命中 {summary['cached']}")
+    header = f"    {'':14s}{'n':>5s}{'mean':>10s}{'p50':>10s}{'p90':>10s}{'p95':>10s}{'p99':>10s}{'max':>10s}"
+    for flow, stats in summary["flows"].items():
+        print(f"\n  [{flow}] 请求 {stats['requests']} · 错误 {stats['errors']} · 缓存命中 {stats['cached']}")
+        print(header)
+        for name in ("e2e_ms", "ttft_ms", "queue_ms", "prep_ms", "tokens_per_sec"):
+            d = stats[name]
+            if d is None:
+                continue
+            print(f"    {name:14s}{d['n']:5d}" + "".join(f"{d[k]:10.1f}" for k in ("mean", "p50", "p90", "p95", "p99", "max")))
+    for name, value in extra.items():
+        print(f"  {name}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话 / 诊断流程并发压测")
+    parser.add_argument("--users", type=int, default=10, help="并发用户数")
+    parser.add_argument("--requests", type=int, default=5, help="每个用户发起的请求数")
+    parser.add_argument("--flow", default="mixed", choices=["chat", "diagnosis", "mixed"], help="压测的页面流程")
+    parser.add_argument("--model", default=llm_client.configured_models()[0], help="模型名")
+    parser.add_argument("--host", default=None, help="Ollama 地址 (默认 OLLAMA_HOST)")
+    parser.add_argument("--fake", action="store_true", help="在进程内启动 fake_ollama 并连接它")
+    parser.add_argument("--max-concurrent", type=int, default=scheduler.DEFAULT_MAX_CONCURRENT,
+                        help="调度器每个模型的同时生成数")
+    parser.add_argument("--no-scheduler", action="store_true", help="不经调度器排队，每个请求直连 Ollama")
+    parser.add_argument("--no-cache", action="store_true", help="不读回答缓存 (与页面上关闭缓存相同)")
+    parser.add_argument("--cache-db", default=None, help="回答缓存 SQLite 路径 (默认每次运行用临时文件)")
+    parser.add_argument("--embed", action="store_true", help="加载 Embedding 模型走向量检索 (默认只用 BM25)")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="重复热门问题 / Trace 的请求比例")
+    parser.add_argument("--hot-pool", type=int, default=3, help="热门问题 / Trace 的个数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="两次请求间的平均思考时间 (秒，指数分布)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="在这么多秒内逐个启动用户")
+    parser.add_argument("--token-budget", type=int, default=log_compact.DEFAULT_TOKEN_BUDGET, help="诊断日志压缩预算")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径 (含每个请求的明细)")
+    parser.add_argument("--fake-port", type=int, default=0, help="--fake 时的监听端口 (0 = 随机)")
+    fake_ollama.add_config_args(parser)
+    args = parser.parse_args()
+
+    fake = None
+    host = args.host
+    if args.fake:
+        fake = fake_ollama.FakeOllamaServer(fake_ollama.config_from_args(args), port=args.fake_port).start()
+        host = fake.url
+        print(f"🧪 模拟 Ollama: {host} (首 token {args.ttft_ms:.0f} ms, {args.tps:.0f} tokens/s)")
+
+    tmp_dir = None
+    cache_db = args.cache_db
+    if cache_db is None:
+        tmp_dir = tempfile.mkdtemp(prefix="loadtest_")
+        cache_db = os.path.join(tmp_dir, "llm_cache.sqlite")
+
+    app = AppHarness(host, not args.no_scheduler, args.max_concurrent, cache_db, not args.no_cache, args.embed)
+    if not app.client.is_healthy():
+        print(f"⚠️  无法连接 Ollama: {app.client.host}")
+        return
+    queries = {"chat": CHAT_QUESTIONS, "diagnosis": app.trace_ids()}
+    if args.flow != "chat" and not queries["diagnosis"]:
+        print(f"⚠️  {LOG_DIR} 中没有找到 WARN / ERROR 流水号，诊断流程改为对话流程")
+    print(f"🚀 {args.users} 个用户 x {args.requests} 个请求 · 流程 {args.flow} · 模型 {args.model} · "
+          f"{'直连' if args.no_scheduler else f'调度器并发 {args.max_concurrent}'} · 检索 {app.kb.current().retriever.mode}")
+
+    results, lock = [], threading.Lock()
+    barrier = threading.Barrier(args.users + 1)
+    threads = [threading.Thread(target=user_loop, args=(app, args, u, queries, results, lock, barrier),
+                                name=f"user-{u}", daemon=True) for u in range(args.users)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - t0
+
+    summary = summarize(results, wall_s)
+    extra = {"回答缓存": app.cache.stats()}
+    if app.scheduler is not None:
+        extra["调度器"] = app.scheduler.stats()
+    if fake is not None:
+        extra["模拟服务"] = fake.stats
+    print_summary(summary, extra)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "summary": summary, "extra": extra, "requests": results}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.output}")
+
+    app.client.close()
+    if fake is not None:
+        fake.stop()
+    if tmp_dir is not None:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+PDF 图片 OCR 结果缓存 (按图片字节内容寻址)
+
+企业文档里同一个 Logo / 页眉 / 架构图会在很多页、很多文档中重复出现，
+以图片字节的 sha256 为 key 缓存识别结果，相同图片只跑一次 RapidOCR。
+存储使用 SQLite (WAL 模式)，多个解析进程可以同时读写同一个缓存文件。
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+
+class OcrCache:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key_of(image_bytes):
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def get(self, key):
+        """命中返回识别文本 (可能是空串)，未命中返回 None"""
+        row = self._conn.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE ocr SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def put(self, key, text):
+        size = len(key) + len(text.encode("utf-8"))
+        self._conn.execute("INSERT OR REPLACE INTO ocr (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                           (key, text, size, time.time()))
+        self._conn.commit()
+
+    def total_size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr").fetchone()[0]
+
+    def evict(self, max_bytes):
+        """按最近使用时间淘汰，直到总大小不超过 max_bytes，返回淘汰条数"""
+        total = self.total_size()
+        if total <= max_bytes:
+            return 0
+        removed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM ocr ORDER BY last_used ASC"):
+            if total <= max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+            removed += 1
+        self._conn.executemany("DELETE FROM ocr WHERE key = ?", doomed)
+        self._conn.commit()
+        self._conn.execute("VACUUM")
+        return removed
+
+    def close(self):
+        self._conn.close()
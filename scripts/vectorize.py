@@ -1,136 +1,603 @@
+import argparse
+import hashlib
 import json
 import os
+import sys
 import glob
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 import docx2txt
 from rapidocr_onnxruntime import RapidOCR
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from core import ann_index, index_store, quantize  # noqa: E402
+from ocr_cache import OcrCache  # noqa: E402
+
 # === 配置区域 ===
 # 文档存放目录
 DOCS_DIR = "../documents"
-# 输出的向量库文件 (给前端用的伪数据库)
+# 输出的二进制向量索引 (app.py 通过 mmap 打开)
+INDEX_DIR = "../public/knowledge_index"
+# 输出的 JSON 文件 (只含文本，给 React 前端做关键词检索用)
 OUTPUT_FILE = "../public/knowledge_index.json"
+# 向量存储精度: float32 / float16 / int8 (量化时另存一份 float32 原始向量用于精确重排)，可用 --dtype 覆盖
+VECTOR_DTYPE = "float32"
+# Embedding 模型 (必须与 core/retrieval.py 中的 Query 模型一致)
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# 增量构建清单：记录每个源文件的哈希 / mtime / 产出的切片 ID
+MANIFEST_FILE = "../public/knowledge_manifest.json"
+
+# PDF 按页区间拆分成多个并行任务，每个任务最多包含的页数
+PAGES_PER_TASK = 16
+# 解析阶段每个工作进程最多挂起的任务数 (滑动窗口提交，已解析未消费的页面文本不会无限堆积)
+SUBMIT_WINDOW_PER_WORKER = 2
+# 切分 -> 向量化 之间的有界队列容量 (切片数)，队列满时解析自动暂停，内存占用保持平稳
+EMBED_QUEUE_SIZE = 4096
+# 按长度排序的窗口 = batch_size * SORT_WINDOW_BATCHES 个切片
+SORT_WINDOW_BATCHES = 8
+# OCR 结果缓存 (按图片内容哈希寻址)，超过上限时按最近使用时间淘汰
+OCR_CACHE_FILE = "../.cache/ocr_cache.sqlite"
+OCR_CACHE_MAX_MB = 512
+# 宽或高小于该像素数的图片基本都是图标，直接跳过 OCR
+OCR_MIN_SIDE = 48
+# 构建各阶段名称 (用于最终的耗时报告)
+STAGES = ("parse", "ocr", "chunk", "embed")
+# OCR 缓存计数：命中 / 未命中 / 小图跳过
+COUNTERS = ("ocr_hit", "ocr_miss", "ocr_skip")
 
-# 初始化 OCR 引擎
+# OCR 引擎与缓存连接：每个工作进程各自初始化一个 (RapidOCR / SQLite 连接都不能跨进程共享)
 # 首次运行会自动下载模型，稍微等一下
-ocr_engine = RapidOCR()
+ocr_engine = None
+ocr_cache = None
+ocr_min_side = OCR_MIN_SIDE
+# 在进程池之外直接解析 PDF 时使用的配置 (main 按命令行参数设置)
+ocr_cache_file = OCR_CACHE_FILE
+
+
+def new_stats():
+    stats = dict.fromkeys(STAGES, 0.0)
+    stats.update(dict.fromkeys(COUNTERS, 0))
+    return stats
+
+
+def configure_ocr(cache_file=OCR_CACHE_FILE, min_side=OCR_MIN_SIDE):
+    """设置当前进程的 OCR 配置 (cache_file 为空则不用缓存)，引擎在首次解析 PDF 时按该配置初始化"""
+    global ocr_cache_file, ocr_min_side
+    ocr_cache_file = cache_file
+    ocr_min_side = min_side
+
+
+def init_worker(cache_file=OCR_CACHE_FILE, min_side=OCR_MIN_SIDE):
+    """进程池初始化：为当前工作进程创建独立的 OCR 引擎和缓存连接 (cache_file 为空则不用缓存)"""
+    global ocr_engine, ocr_cache, ocr_min_side
+    if ocr_engine is None:
+        ocr_engine = RapidOCR()
+        ocr_cache = OcrCache(cache_file) if cache_file else None
+        ocr_min_side = min_side
+
+
+def ocr_image(base_image, stats):
+    """识别单张图片：小图跳过，先查缓存，未命中再跑 RapidOCR 并回写缓存"""
+    if min(base_image.get("width", ocr_min_side), base_image.get("height", ocr_min_side)) < ocr_min_side:
+        stats["ocr_skip"] += 1
+        return ""
+    image_bytes = base_image["image"]
+    key = OcrCache.key_of(image_bytes) if ocr_cache else None
+    if key:
+        cached = ocr_cache.get(key)
+        if cached is not None:
+            stats["ocr_hit"] += 1
+            return cached
+
+    stats["ocr_miss"] += 1
+    ocr_result, _ = ocr_engine(image_bytes)
+    # ocr_result 是列表，拼接所有识别出的文字
+    img_text = " ".join([res[1] for res in ocr_result]) if ocr_result else ""
+    if key:
+        ocr_cache.put(key, img_text)
+    return img_text
 
 
-def extract_pdf_content(pdf_path):
+def extract_pdf_content(pdf_path, start_page=0, end_page=None, stats=None):
     """
-    深度解析 PDF：
+    深度解析 PDF (可只解析 [start_page, end_page) 页区间)：
     1. 提取原生文本
     2. 提取图片并进行 OCR 识别 (专治架构图和报错截图)
+    返回 [(页码, 该页文本), ...]，页码从 1 开始
     """
+    if ocr_engine is None:
+        # 进程池外调用 (工作进程已由 initializer 初始化)：沿用 configure_ocr 设置的缓存路径和最小边长
+        init_worker(ocr_cache_file, ocr_min_side)
+    stats = stats if stats is not None else new_stats()
     doc = fitz.open(pdf_path)
-    full_text = ""
-    print(f"    ...正在深度解析 PDF (含OCR): {os.path.basename(pdf_path)}")
+    end_page = doc.page_count if end_page is None else min(end_page, doc.page_count)
+    filename = os.path.basename(pdf_path)
+    pages = []
 
-    for i, page in enumerate(doc):
+    for i in range(start_page, end_page):
+        page = doc[i]
         # 1. 提取页面原生文本
-        filename = os.path.basename(pdf_path)
-        text = f"【来源文档：{filename}】\n" + page.get_text()
-        full_text += text + "\n"
+        t0 = time.perf_counter()
+        page_parts = [f"【来源文档：{filename}】\n" + page.get_text() + "\n"]
 
         # 2. 提取页面内的图片并进行 OCR
         image_list = page.get_images(full=True)
+        stats["parse"] += time.perf_counter() - t0
         if image_list:
-            # print(f"      - 第 {i+1} 页发现 {len(image_list)} 张图片，正在识别...")
             for img_index, img in enumerate(image_list):
                 try:
+                    t0 = time.perf_counter()
                     xref = img[0]
                     base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-
-                    # 调用 RapidOCR 识别
-                    ocr_result, _ = ocr_engine(image_bytes)
-
-                    if ocr_result:
-                        # ocr_result 是列表，拼接所有识别出的文字
-                        img_text = " ".join([res[1] for res in ocr_result])
-                        if img_text.strip():
-                            # 给图片内容加个特殊的标记，方便调试和检索
-                            full_text += f"\n>>> [第{i + 1}页·架构图/截图识别]: {img_text}\n"
-                except Exception as e:
+
+                    # 调用 RapidOCR 识别 (带缓存)
+                    img_text = ocr_image(base_image, stats)
+                    if img_text.strip():
+                        # 给图片内容加个特殊的标记，方便调试和检索
+                        page_parts.append(f"\n>>> [第{i + 1}页·架构图/截图识别]: {img_text}\n")
+                except Exception:
                     pass  # 图片识别失败就不管了，继续
+                finally:
+                    stats["ocr"] += time.perf_counter() - t0
+        pages.append((i + 1, "".join(page_parts)))
 
-    return full_text
+    doc.close()
+    return pages
 
 
-def main():
-    print("🚀 开始构建多模态向量知识库...")
+def extract_task(task):
+    """
+    进程池任务：解析一个文件，或一个 PDF 的某个页区间
+    返回 (分段列表 [(页码, 文本), ...], 本任务统计)，非分页文档页码为 None，解析失败时分段列表为 None
+    """
+    path, start_page, end_page = task
+    stats = new_stats()
+    try:
+        if path.endswith(".pdf"):
+            segments = extract_pdf_content(path, start_page, end_page, stats)
+        else:
+            t0 = time.perf_counter()
+            segments = [(None, read_document(path))]
+            stats["parse"] += time.perf_counter() - t0
+    except Exception as e:
+        print(f"❌ 读取失败 {path} (第 {start_page + 1} 页起): {e}")
+        segments = None
+    return segments, stats
 
-    # 1. 扫描所有支持的文件类型
+
+def split_tasks(files):
+    """
+    把文件列表拆成任务列表：PDF 按 PAGES_PER_TASK 页一段，其余文件一个任务
+    返回 [(file_index, (path, start, end)), ...]，顺序即最终拼装顺序
+    """
+    tasks = []
+    for file_index, f in enumerate(files):
+        page_count = 0
+        if f.endswith(".pdf"):
+            try:
+                with fitz.open(f) as doc:
+                    page_count = doc.page_count
+            except Exception as e:
+                print(f"❌ 读取失败 {f}: {e}")
+                continue
+        for start in range(0, max(page_count, 1), PAGES_PER_TASK):
+            tasks.append((file_index, (f, start, start + PAGES_PER_TASK)))
+    return tasks
+
+
+def extract_documents(files, workers, stats, cache_file=OCR_CACHE_FILE, min_side=OCR_MIN_SIDE):
+    """
+    在进程池上并行解析文件，按文件顺序逐个产出 (path, segments)，任一页区间失败时 segments 为 None
+    结果按提交顺序取回，同一文件的多个页区间按页码顺序拼接，保证构建结果可复现
+    各任务的 parse / ocr 耗时 (单位：CPU 秒，跨进程求和) 和 OCR 缓存计数累加进 stats
+    """
+    tasks = split_tasks(files)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(cache_file, min_side)) as executor:
+        current, parts = None, []
+        for (file_index, _), (segments, task_stats) in zip(tasks, _ordered_results(executor, tasks, workers)):
+            for k, v in task_stats.items():
+                stats[k] += v
+            if file_index != current:
+                if current is not None:
+                    yield files[current], _join_parts(parts)
+                current, parts = file_index, []
+            parts.append(segments)
+        if current is not None:
+            yield files[current], _join_parts(parts)
+
+
+def _ordered_results(executor, tasks, workers):
+    """
+    滑动窗口提交：最多同时挂起 SUBMIT_WINDOW_PER_WORKER * workers 个任务，按提交顺序产出结果
+    (executor.map 会一次性提交全部任务，已完成任务的页面文本堆在 future 里，消费者再慢也无法限制内存)
+    """
+    pending = deque()
+    task_iter = iter(task for _, task in tasks)
+    window = max(1, workers) * SUBMIT_WINDOW_PER_WORKER
+    for task in task_iter:
+        pending.append(executor.submit(extract_task, task))
+        if len(pending) >= window:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for task in task_iter:
+            pending.append(executor.submit(extract_task, task))
+            break
+        yield result
+
+
+def _join_parts(parts):
+    if any(p is None for p in parts):
+        return None
+    return [segment for part in parts for segment in part]
+
+
+def scan_files():
+    """扫描所有支持的文件类型，按路径排序保证构建结果稳定"""
     files = glob.glob(os.path.join(DOCS_DIR, "*.md")) + \
             glob.glob(os.path.join(DOCS_DIR, "*.txt")) + \
             glob.glob(os.path.join(DOCS_DIR, "*.docx")) + \
             glob.glob(os.path.join(DOCS_DIR, "*.pdf"))
+    return sorted(files)
 
-    if not files:
-        print(f"⚠️  在 {DOCS_DIR} 没找到文档，请放入 .pdf, .docx, .md 或 .txt 文件")
-        return
 
-    all_text = ""
+def read_document(f):
+    """按文件类型读取全文"""
+    if f.endswith(".docx"):
+        return docx2txt.process(f)
+    elif f.endswith(".pdf"):
+        # 使用上面的 OCR 增强函数
+        return "".join(text for _, text in extract_pdf_content(f))
+    else:
+        # 普通文本
+        with open(f, 'r', encoding='utf-8') as file:
+            return file.read()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE) and index_store.index_exists(INDEX_DIR):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    # 没有清单 (或索引已丢失) 时等同于全量构建
+    return {"version": 1, "next_id": 0, "files": {}}
+
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+
+def index_settings(index_dir=INDEX_DIR):
+    """
+    现有索引的构建参数 (dtype, ann_lists)；没有索引时返回 (None, None)
+    旧版 header 没有记录 ann_lists 时按目录中是否有有效的 IVF 推断
+    """
+    if not index_store.index_exists(index_dir):
+        return None, None
+    header = index_store.read_header(index_dir)
+    ann_lists = header.get("ann_lists")
+    if "ann_lists" not in header:
+        meta_path = os.path.join(index_dir, ann_index.IVF_META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("count") == header.get("count"):
+                ann_lists = meta.get("lists")
+    return header.get("dtype", VECTOR_DTYPE), ann_lists
+
 
-    # 2. 逐个读取文件内容
+def plan_changes(files, manifest):
+    """
+    对比清单与当前文件，分为 新增 / 变更 / 删除 / 未变 四类
+    mtime 和 size 都没变的文件直接视为未变，不重新计算哈希
+    """
+    plan = {"added": [], "changed": [], "deleted": [], "unchanged": []}
+    digests = {}
     for f in files:
-        try:
-            print(f"📄 正在读取: {os.path.basename(f)}...")
+        key = os.path.relpath(f, DOCS_DIR)
+        st = os.stat(f)
+        entry = manifest["files"].get(key)
+        if entry is None:
+            plan["added"].append(f)
+        elif entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            plan["unchanged"].append(f)
+        else:
+            digest = file_sha256(f)
+            digests[key] = digest
+            plan["unchanged" if digest == entry["sha256"] else "changed"].append(f)
+    present = {os.path.relpath(f, DOCS_DIR) for f in files}
+    plan["deleted"] = sorted(k for k in manifest["files"] if k not in present)
+    return plan, digests
+
+
+def print_plan(plan):
+    print("📋 增量构建计划:")
+    print(f"    新增 {len(plan['added'])} | 变更 {len(plan['changed'])} | "
+          f"删除 {len(plan['deleted'])} | 未变 {len(plan['unchanged'])}")
+    for label, key in (("➕", "added"), ("✏️ ", "changed")):
+        for f in plan[key]:
+            print(f"    {label} {os.path.relpath(f, DOCS_DIR)}")
+    for k in plan["deleted"]:
+        print(f"    ➖ {k}")
 
-            if f.endswith(".docx"):
-                text = docx2txt.process(f)
-                all_text += text + "\n"
 
-            elif f.endswith(".pdf"):
-                # 使用上面的 OCR 增强函数
-                text = extract_pdf_content(f)
-                all_text += text + "\n"
+def iter_chunks(files, workers, text_splitter, stats, cache_file=OCR_CACHE_FILE, min_side=OCR_MIN_SIDE):
+    """
+    流式切分管线：逐个文件解析 -> 逐页切分 -> 产出切片，全程不拼接整个语料
+    产出 ("file", path) 标记一个文件解析成功 (先于它的切片)，
+    随后是该文件的 ("chunk", source, page, content)，切片不会跨文档、也不会跨页
+    """
+    for f, segments in extract_documents(files, workers, stats, cache_file, min_side):
+        if segments is None:
+            continue
+        key = os.path.relpath(f, DOCS_DIR)
+        yield "file", f
+        for page, text in segments:
+            t0 = time.perf_counter()
+            pieces = text_splitter.split_text(text)
+            stats["chunk"] += time.perf_counter() - t0
+            for content in pieces:
+                yield "chunk", key, page, content
+        print(f"✅ 已加载: {os.path.basename(f)}")
+
 
-            else:
-                # 普通文本
-                with open(f, 'r', encoding='utf-8') as file:
-                    all_text += file.read() + "\n"
+def produce_chunks(files, workers, text_splitter, chunk_queue, stats, cache_file, min_side):
+    """生产者线程：把 iter_chunks 的输出放入有界队列 (队列满时阻塞，解析自然被限速)；结束时放入 None"""
+    try:
+        extract_start = time.perf_counter()
+        for item in iter_chunks(files, workers, text_splitter, stats, cache_file, min_side):
+            chunk_queue.put(item)
+        stats["extract_wall"] = time.perf_counter() - extract_start
+    except Exception as e:
+        chunk_queue.put(("error", e))
+    finally:
+        chunk_queue.put(None)
 
-            print(f"✅ 已加载: {os.path.basename(f)}")
-        except Exception as e:
-            print(f"❌ 读取失败 {f}: {e}")
 
-    # 3. 文本切片 (Chunking)
-    print("✂️  正在切分文本...")
+def embed_window(embeddings_model, texts, batch_size, sort_by_length):
+    """
+    分批计算一个窗口内切片的向量，返回顺序与 texts 一致
+    sort_by_length 时先按长度排序再分批，同一批长度相近，padding 更少
+    """
+    order = list(range(len(texts)))
+    if sort_by_length:
+        order.sort(key=lambda i: len(texts[i]))
+    vectors = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        for i, vector in zip(batch, embeddings_model.embed_documents([texts[i] for i in batch])):
+            vectors[i] = vector
+    return vectors
+
+
+class JsonArrayWriter:
+    """流式写 JSON 数组：记录逐条写出，不在内存里攒整个列表"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._tmp_path = path + ".tmp"
+        self._f = open(self._tmp_path, "w", encoding="utf-8")
+        self._f.write("[")
+        self._first = True
+
+    def write(self, obj):
+        if not self._first:
+            self._f.write(", ")
+        self._first = False
+        self._f.write(json.dumps(obj, ensure_ascii=False))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f.write("]")
+        self._f.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建多模态向量知识库")
+    parser.add_argument("--full", action="store_true", help="忽略清单，全量重建 (切片 ID 从 0 重新编号)")
+    parser.add_argument("--dry-run", action="store_true", help="只打印将要发生的变更，不做任何处理")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="文档解析 / OCR 并行进程数")
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding 每批切片数")
+    parser.add_argument("--sort-by-length", action=argparse.BooleanOptionalAction, default=True,
+                        help="批内按文本长度排序以减少 padding")
+    parser.add_argument("--ocr-min-side", type=int, default=OCR_MIN_SIDE, help="宽或高小于该像素数的图片跳过 OCR")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="不读写 OCR 结果缓存")
+    parser.add_argument("--dtype", default=None, choices=index_store.SUPPORTED_DTYPES,
+                        help=f"向量存储精度 (float16 内存减半，int8 为 1/4)；不传则沿用现有索引，没有索引时为 {VECTOR_DTYPE}")
+    parser.add_argument("--ann-lists", type=int, default=None,
+                        help="同时构建 IVF 近似最近邻索引的桶数 (0 = 按切片数自动选择)；不传则沿用现有索引的设置")
+    parser.add_argument("--no-ann", action="store_true", help="不构建 IVF 索引 (已有的 IVF 随重建删除)")
+    args = parser.parse_args()
+    stats = new_stats()
+    build_start = time.perf_counter()
+    configure_ocr(None if args.no_ocr_cache else OCR_CACHE_FILE, args.ocr_min_side)
+
+    print("🚀 开始构建多模态向量知识库...")
+
+    # 1. 扫描所有支持的文件类型
+    files = scan_files()
+
+    if not files:
+        print(f"⚠️  在 {DOCS_DIR} 没找到文档，请放入 .pdf, .docx, .md 或 .txt 文件")
+        return
+
+    # 向量精度 / IVF 桶数：命令行没指定时沿用现有索引，避免一次普通的增量构建把量化索引改回 float32、丢掉 IVF
+    old_dtype, old_ann_lists = index_settings()
+    dtype = args.dtype or old_dtype or VECTOR_DTYPE
+    ann_lists = None if args.no_ann else (old_ann_lists if args.ann_lists is None else args.ann_lists)
+    settings_changed = old_dtype is not None and (dtype, ann_lists) != (old_dtype, old_ann_lists)
+
+    manifest = {"version": 1, "next_id": 0, "files": {}} if args.full else load_manifest()
+    plan, digests = plan_changes(files, manifest)
+    print_plan(plan)
+    if settings_changed:
+        print(f"⚙️  索引参数变化: dtype {old_dtype} -> {dtype} | IVF 桶数 {old_ann_lists} -> {ann_lists}，"
+              f"所有切片将按新参数重写 (未变文件复用已有向量，不重新计算)")
+    if args.dry_run:
+        return
+    if not (plan["added"] or plan["changed"] or plan["deleted"] or settings_changed):
+        print("✅ 知识库已是最新，无需重建")
+        return
+
+    # 2. 生产者线程：并行解析 新增 / 变更 的文件并切分，切片经有界队列送往向量化阶段
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=600,  # 每个片段的大小
         chunk_overlap=100,  # 重叠部分，防止切断上下文
         separators=["\n\n", "\n", "。", "！", "？", ">>>"]  # 把我们刚才加的图片标记也作为分隔符
     )
-    chunks = text_splitter.create_documents([all_text])
-    print(f"📊 共切分为 {len(chunks)} 个知识片段")
+    changed_files = plan["added"] + plan["changed"]
+    print(f"📄 正在并行解析 {len(changed_files)} 个文件 (进程数: {args.workers})...")
+    chunk_queue = queue.Queue(maxsize=EMBED_QUEUE_SIZE)
+    producer = threading.Thread(target=produce_chunks,
+                                args=(changed_files, args.workers, text_splitter, chunk_queue, stats,
+                                      None if args.no_ocr_cache else OCR_CACHE_FILE, args.ocr_min_side),
+                                daemon=True)
+    producer.start()
 
-    # 4. 向量化 (Embedding)
+    # 3. 向量化 (Embedding)：模型加载与文档解析同时进行
     print("🧠 正在计算向量 (加载模型可能需要几十秒)...")
     # 使用轻量级模型，不需要 GPU 也能跑
-    embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-    knowledge_base = []
-
-    for i, chunk in enumerate(chunks):
-        # 计算向量
-        vector = embeddings_model.embed_query(chunk.page_content)
-        knowledge_base.append({
-            "id": i,
-            "content": chunk.page_content,
-            "vector": vector,
-            "source": "Core_Knowledge_Base"
-        })
-
-    # 5. 保存为 JSON (充当向量数据库)
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(knowledge_base, f, ensure_ascii=False)
-
-    print(f"🎉 成功！知识库已生成至: {OUTPUT_FILE}")
+    # 只是索引参数变化、没有文件需要解析时不加载模型
+    embeddings_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL,
+                                             encode_kwargs={"batch_size": args.batch_size}) if changed_files else None
+
+    old_index = index_store.KnowledgeIndex.open(INDEX_DIR) if manifest["files"] else None
+    row_of = {rec["id"]: row for row, rec in enumerate(old_index.iter_meta())} if old_index else {}
+
+    files_meta = {}
+    next_id = manifest["next_id"]
+    new_count = 0
+    window_size = args.batch_size * SORT_WINDOW_BATCHES
+
+    with index_store.IndexWriter(INDEX_DIR, dim=384, dtype=dtype, model=EMBEDDING_MODEL,
+                                 ann_lists=ann_lists) as writer, \
+            JsonArrayWriter(OUTPUT_FILE) as json_out:
+        def copy_old_chunks(entry):
+            for chunk_id in entry["chunk_ids"]:
+                rec = old_index[row_of[chunk_id]]
+                writer.add(chunk_id, rec["content"], rec["vector"], source=rec["source"], page=rec.get("page"))
+                json_out.write({"id": chunk_id, "content": rec["content"], "source": rec["source"],
+                                "page": rec.get("page")})
+
+        # 3.1 未变文件：原样拷贝旧切片 (ID 和向量都保持不变)
+        for f in plan["unchanged"]:
+            key = os.path.relpath(f, DOCS_DIR)
+            entry = manifest["files"][key]
+            copy_old_chunks(entry)
+            st = os.stat(f)
+            files_meta[key] = dict(entry, mtime=st.st_mtime, size=st.st_size,
+                                   sha256=digests.get(key, entry["sha256"]))
+
+        # 3.2 新增 / 变更文件：从队列按窗口取切片，分批计算向量并立即写盘
+        #     (读取失败的文件不会出现在队列里，见 3.3)
+        window = []
+        while True:
+            item = chunk_queue.get()
+            if item is not None and item[0] == "error":
+                raise item[1]
+            if item is not None and item[0] == "file":
+                f = item[1]
+                key = os.path.relpath(f, DOCS_DIR)
+                st = os.stat(f)
+                files_meta[key] = {"sha256": digests.get(key) or file_sha256(f), "mtime": st.st_mtime,
+                                   "size": st.st_size, "chunk_ids": []}
+                continue
+            if item is not None:
+                window.append(item[1:])
+            if window and (item is None or len(window) >= window_size):
+                t0 = time.perf_counter()
+                vectors = embed_window(embeddings_model, [c for _, _, c in window], args.batch_size,
+                                       args.sort_by_length)
+                stats["embed"] += time.perf_counter() - t0
+                for (key, page, content), vector in zip(window, vectors):
+                    writer.add(next_id, content, vector, source=key, page=page)
+                    json_out.write({"id": next_id, "content": content, "source": key, "page": page})
+                    files_meta[key]["chunk_ids"].append(next_id)
+                    next_id += 1
+                new_count += len(window)
+                window = []
+            if item is None:
+                break
+        print(f"📊 新增 {new_count} 个知识片段")
+
+        # 3.3 读取失败的变更文件：保留旧切片和旧清单条目 (旧 sha256 与文件对不上，下次运行会重试)，
+        #     不能因为一次 PDF / OCR 读取失败就把这个文档已有的知识删掉；读取失败的新增文件不记入清单
+        failed = [f for f in plan["changed"] if os.path.relpath(f, DOCS_DIR) not in files_meta]
+        for f in failed:
+            key = os.path.relpath(f, DOCS_DIR)
+            copy_old_chunks(manifest["files"][key])
+            files_meta[key] = manifest["files"][key]
+        if failed:
+            print(f"⚠️  {len(failed)} 个变更文件读取失败，沿用上次的切片: "
+                  + ", ".join(os.path.relpath(f, DOCS_DIR) for f in failed[:5]))
+
+        if old_index is not None:
+            # 释放旧索引的 mmap，再由 writer 替换目录
+            old_index.close()
+
+    manifest = {"version": 1, "next_id": next_id, "files": files_meta}
+    save_manifest(manifest)
+
+    if not args.no_ocr_cache and os.path.exists(OCR_CACHE_FILE):
+        cache = OcrCache(OCR_CACHE_FILE)
+        evicted = cache.evict(OCR_CACHE_MAX_MB * 1024 * 1024)
+        cache.close()
+        if evicted:
+            print(f"🧹 OCR 缓存超过 {OCR_CACHE_MAX_MB} MB，已淘汰 {evicted} 条最久未用的记录")
+
+    print(f"🎉 成功！向量索引已生成至: {INDEX_DIR}，文本索引: {OUTPUT_FILE}")
+    if writer.ann is not None or dtype != "float32":
+        # 以 float32 暴力检索为基准评估召回率，帮助选择 app 侧的 nprobe / 量化精度
+        index = index_store.KnowledgeIndex.open(INDEX_DIR)
+        exact = index.exact_vectors if index.exact_vectors is not None else index.vectors
+        if writer.ann is not None:
+            ann_index.print_recall_report(ann_index.recall_report(exact, writer.ann))
+        if dtype != "float32" and index.exact_vectors is not None:
+            report = quantize.recall_report(index.exact_vectors, index.vectors, index.scales)
+            quantize.print_recall_report(report, dtype)
+        index.close()
     print("👉 现在你可以去运行前端代码了，它会自动读取这个文件！")
+    print_stats(stats, stats.pop("extract_wall", 0.0), time.perf_counter() - build_start)
+
+
+def print_stats(stats, extract_wall, total_wall):
+    """打印各阶段耗时：parse / ocr 为各工作进程 CPU 时间之和，可与解析阶段墙钟时间对比并行度"""
+    print("⏱️  阶段耗时:")
+    print(f"    parse  {stats['parse']:8.1f}s (进程累计)")
+    print(f"    ocr    {stats['ocr']:8.1f}s (进程累计)")
+    print(f"    解析墙钟 {extract_wall:6.1f}s")
+    print(f"    chunk  {stats['chunk']:8.1f}s")
+    print(f"    embed  {stats['embed']:8.1f}s")
+    ocr_total = stats["ocr_hit"] + stats["ocr_miss"]
+    hit_rate = stats["ocr_hit"] / ocr_total * 100 if ocr_total else 0.0
+    print(f"    OCR 缓存: 命中 {stats['ocr_hit']} | 未命中 {stats['ocr_miss']} | "
+          f"小图跳过 {stats['ocr_skip']} | 命中率 {hit_rate:.1f}%")
+    print(f"    总计   {total_wall:8.1f}s")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+"""core.ann_index：IVF 构建 / 查询，scripts/build_ann.py 重建后运行中的 KnowledgeStore 能发现新索引"""
+import importlib.util
+import os
+import sys
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core import ann_index, index_store, knowledge_store, retrieval  # noqa: E402
+
+N, DIM = 600, 16
+BUILD_ANN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "build_ann.py")
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return retrieval.normalize_rows(np.random.default_rng(0).normal(size=(N, DIM)))
+
+
+def test_lists_partition_all_rows(matrix):
+    ivf = ann_index.IvfIndex.build(matrix, 12)
+    assert ivf.n_lists == 12 and ivf.list_offsets[-1] == N
+    assert sorted(ivf.list_rows.tolist()) == list(range(N))
+
+
+def test_full_nprobe_equals_brute_force(matrix, tmp_path):
+    ivf = ann_index.IvfIndex.build(matrix, 12)
+    ivf.write(str(tmp_path))
+    ivf = ann_index.IvfIndex.open(str(tmp_path), expected_count=N)
+    queries = retrieval.normalize_rows(np.random.default_rng(1).normal(size=(20, DIM)))
+    for q in queries:
+        rows, scores = ivf.search(matrix, q, 10, nprobe=ivf.n_lists)
+        assert rows.tolist() == retrieval.top_k_indices(matrix @ q, 10).tolist()
+        np.testing.assert_allclose(scores, np.sort(matrix @ q)[::-1][:10], rtol=1e-5)
+        # nprobe 更小时只是候选变少，返回的都是候选中的真实得分
+        rows, scores = ivf.search(matrix, q, 10, nprobe=2)
+        np.testing.assert_allclose(scores, matrix[rows] @ q, rtol=1e-5)
+    # 切片数对不上视为过期
+    assert ann_index.IvfIndex.open(str(tmp_path), expected_count=N + 1) is None
+
+
+def test_build_ann_bumps_version_seen_by_store(matrix, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "knowledge_index")
+    with index_store.IndexWriter(index_dir, dim=DIM, lexical=False) as writer:
+        writer.add_batch(list(range(N)), [f"切片 {i}" for i in range(N)], matrix, [""] * N)
+    store = knowledge_store.KnowledgeStore(None, index_dir, str(tmp_path / "missing.json"), check_interval=0)
+    before = store.current()
+    assert before.index.ann is None
+
+    spec = importlib.util.spec_from_file_location("build_ann", BUILD_ANN)
+    build_ann = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(build_ann)
+    monkeypatch.setattr(sys, "argv", ["build_ann.py", "--index", index_dir, "--lists", "8", "--nprobe", "8",
+                                      "--queries", "20"])
+    build_ann.main()
+
+    deadline = time.time() + 10
+    snapshot = store.current()
+    while snapshot is before and time.time() < deadline:
+        time.sleep(0.05)
+        snapshot = store.current()
+    assert snapshot.version != before.version
+    assert snapshot.index.ann is not None and snapshot.index.ann.n_lists == 8
+    assert index_store.read_header(index_dir)["ann_lists"] == 8
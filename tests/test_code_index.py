@@ -0,0 +1,70 @@
+"""core.code_index：交易码 / 常量名 -> 入口方法"""
+import pytest
+
+from core import code_index
+
+CONTROLLER = '''package com.bank.loan.web;
+
+import com.bank.loan.service.LoanService;
+
+@RestController
+@RequestMapping("/loan")
+public class LoanController {
+    private static final String TX_APPROVAL = "loan_approval_01";
+    private LoanService loanService;
+
+    @TxCode(TX_APPROVAL)
+    @PostMapping("/approve")
+    public Result approve(LoanRequest req) {
+        return loanService.approve(req);
+    }
+
+    @PostMapping("/query")
+    public Result query(String id) {
+        Runnable r = new Runnable() {
+            public void run() { audit("loan_query_02"); }
+        };
+        return loanService.query("loan_query_01");
+    }
+}
+'''
+
+SERVICE = '''package com.bank.loan.service;
+
+@Service
+public class LoanService {
+    public Result approve(LoanRequest req) { return null; }
+    public Result query(String id) { return null; }
+}
+'''
+
+
+@pytest.fixture
+def index(tmp_path):
+    project = tmp_path / "code"
+    (project / "web").mkdir(parents=True)
+    (project / "service").mkdir()
+    (project / "web" / "LoanController.java").write_text(CONTROLLER, encoding="utf-8")
+    (project / "service" / "LoanService.java").write_text(SERVICE, encoding="utf-8")
+    idx = code_index.CodeIndex(str(project), db_path=str(tmp_path / "code_index.sqlite"))
+    idx.refresh()
+    return idx
+
+
+def test_literal_ownership():
+    literals = {value: (cid, mid, field) for value, cid, mid, field, _ in code_index._JavaParser(CONTROLLER).parse()["literals"]}
+    assert literals["loan_approval_01"][2] == "TX_APPROVAL"
+    assert literals["/loan"][1] is None
+    assert literals["/approve"][1] == literals["loan_query_01"][1] - 1
+
+
+def test_lookup_by_value_and_constant_name(index):
+    by_value = index.find_entries("loan_approval_01")
+    by_name = index.find_entries("TX_APPROVAL")
+    assert by_value and by_value[0]["method"] == "approve"
+    assert [e["method_id"] for e in by_name] == [e["method_id"] for e in by_value]
+
+
+def test_lookup_literal_in_method_body(index):
+    entries = index.find_entries("loan_query_01")
+    assert entries[0]["method"] == "query" and entries[0]["reason"] == "字面量"
@@ -0,0 +1,94 @@
+"""core.index_store：二进制索引写入 / 打开，旧版 JSON 转换"""
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core import index_store  # noqa: E402
+
+DIM = 8
+
+
+def write_json(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+    return str(path)
+
+
+def test_convert_legacy_json_with_vectors(tmp_path):
+    rng = np.random.default_rng(0)
+    records = [{"id": f"c{i}", "content": f"切片 {i}", "vector": rng.normal(size=DIM).tolist(),
+                "source": "docs/a.pdf", "page": i + 1} for i in range(5)]
+    index_dir = str(tmp_path / "knowledge_index")
+    assert index_store.convert_json_index(write_json(tmp_path / "k.json", records), index_dir) == 5
+    index = index_store.KnowledgeIndex.open(index_dir)
+    assert len(index) == 5 and index.has_vectors
+    assert index[3]["content"] == "切片 3" and index[3]["page"] == 4
+    index.close()
+
+
+def test_convert_text_only_json_fails_clearly(tmp_path):
+    # 新版 vectorize.py 输出的 JSON 只含文本
+    records = [{"id": f"c{i}", "content": f"切片 {i}", "source": "docs/a.md", "page": None} for i in range(3)]
+    index_dir = tmp_path / "knowledge_index"
+    with pytest.raises(ValueError, match="不含向量"):
+        index_store.convert_json_index(write_json(tmp_path / "k.json", records), str(index_dir))
+    assert not index_dir.exists()
+
+
+def random_rows(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def write_index(index_dir, texts, vectors, **kwargs):
+    with index_store.IndexWriter(index_dir, dim=DIM, **kwargs) as writer:
+        writer.add_batch(list(range(len(texts))), texts, vectors, [f"docs/{i % 2}.pdf" for i in range(len(texts))],
+                         [i + 1 for i in range(len(texts))])
+    return writer
+
+
+def test_round_trip(tmp_path):
+    index_dir = str(tmp_path / "knowledge_index")
+    texts = ["放款流程说明", "", "InterestCalcUtil 利息计算", "交易码 loan_approval_01"]
+    vectors = random_rows(len(texts))
+    write_index(index_dir, texts, vectors)
+    index = index_store.KnowledgeIndex.open(index_dir)
+    assert isinstance(index.vectors, np.memmap) and len(index) == 4
+    assert [index.content(i) for i in range(4)] == texts
+    assert index.meta(2) == {"id": 2, "source": "docs/0.pdf", "page": 3}
+    # 写入时按行归一化
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(index.vectors, expected, rtol=1e-6)
+    assert index.lexical.search("loan_approval_01", 1)[0][0] == 3
+    index.close()
+
+
+def test_header_written_last_and_directory_swapped(tmp_path):
+    index_dir = str(tmp_path / "knowledge_index")
+    write_index(index_dir, ["旧版本"], random_rows(1))
+    with index_store.IndexWriter(index_dir, dim=DIM) as writer:
+        writer.add_batch([0, 1], ["新版本 a", "新版本 b"], random_rows(2, seed=1), ["a.md", "b.md"])
+        # 写入过程中：新内容只在 .tmp 目录，还没有 header；读者仍能完整打开旧索引
+        assert not os.path.exists(os.path.join(writer._tmp_dir, index_store.HEADER_FILE))
+        old = index_store.KnowledgeIndex.open(index_dir)
+        assert old.content(0) == "旧版本"
+        old.close()
+    assert not os.path.exists(index_dir + ".tmp") and not os.path.exists(index_dir + ".old")
+    index = index_store.KnowledgeIndex.open(index_dir)
+    assert len(index) == 2 and index.content(1) == "新版本 b"
+    index.close()
+
+
+def test_failed_write_keeps_old_index(tmp_path):
+    index_dir = str(tmp_path / "knowledge_index")
+    write_index(index_dir, ["旧版本"], random_rows(1))
+    with pytest.raises(RuntimeError):
+        with index_store.IndexWriter(index_dir, dim=DIM) as writer:
+            writer.add_batch([0], ["写了一半"], random_rows(1, seed=1), ["a.md"])
+            raise RuntimeError("解析失败")
+    assert not os.path.exists(index_dir + ".tmp")
+    index = index_store.KnowledgeIndex.open(index_dir)
+    assert len(index) == 1 and index.content(0) == "旧版本"
+    index.close()
@@ -0,0 +1,39 @@
+"""core.log_compact：折叠重复日志时不能吞掉不同的事件"""
+from core import log_compact
+
+PREFIX = "[deposit-service.log] 2026-01-31 10:30:00.{ms:03d} [INFO ] [G889820260131001] [T1] c.b.BalanceService - "
+
+
+def line(ms, msg, hit=True):
+    return (">> " if hit else "   ") + PREFIX.format(ms=ms) + msg
+
+
+def test_distinct_hit_events_survive():
+    text = "\n".join([
+        line(150, "[动账] 准备加锁, Key: LOCK:ACCT:6222****8888"),
+        line(160, "[动账] 获取锁成功, 当前余额: 200.00, 变动: +50000.00"),
+        line(220, "[动账] 释放锁 Key: LOCK:ACCT:6222****8888"),
+        line(230, "[动账] 释放锁, Key: LOCK:ACCT:6222****8888"),
+    ])
+    result = log_compact.compact(text)
+    for event in ("准备加锁", "获取锁成功", "释放锁 Key", "释放锁, Key"):
+        assert event in result.text
+    assert "×" not in result.text
+
+
+def test_repeated_hits_fold_into_template():
+    text = "\n".join(line(100 + i, f"[动账] 获取锁成功, 当前余额: {i}00.00, 变动: +{i}0.00") for i in range(1, 4))
+    result = log_compact.compact(text)
+    assert result.compact_lines == 1
+    assert f"当前余额: {log_compact.WILDCARD}" in result.text
+    assert "×3" in result.text
+
+
+def test_similar_context_lines_need_high_similarity():
+    # 上下文行 4 个词中只有 1 个常量词不同 (相似度 0.75)，低于阈值，不合并
+    text = "\n".join([
+        line(150, "[动账] 准备加锁, Key: LOCK:ACCT:6222****9999", hit=False),
+        line(220, "[动账] 释放锁, Key: LOCK:ACCT:6222****9999", hit=False),
+    ])
+    result = log_compact.compact(text)
+    assert "准备加锁" in result.text and "释放锁" in result.text
@@ -0,0 +1,77 @@
+"""core.log_index：倒排索引与全量扫描回退 (基于仓库自带的 logs/ 样例)"""
+import os
+import shutil
+
+import pytest
+
+from core import log_index, log_scan
+
+SAMPLE_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+
+
+@pytest.fixture
+def index(tmp_path):
+    log_dir = tmp_path / "logs"
+    shutil.copytree(SAMPLE_LOG_DIR, log_dir)
+    idx = log_index.LogIndex(str(log_dir), str(tmp_path / "log_index.sqlite"))
+    idx.refresh()
+    return idx
+
+
+def count(hits):
+    return sum(len(lines) for lines in hits.values())
+
+
+def test_plain_word_is_not_a_trace_id(index):
+    # "TaskUtils" 以 T 开头，但不是编号，应走全量扫描而不是查倒排
+    assert not log_index.is_trace_id("TaskUtils")
+    hits = log_index.search_hits(index, index.log_dir, "TaskUtils")
+    assert count(hits) == count(log_scan.scan_logs(index.log_dir, "TaskUtils")) > 0
+
+
+def test_partial_trace_id_falls_back_to_scan(index):
+    # 编号前缀没有精确的倒排，应退回子串扫描，命中所有以它开头的流水
+    partial = "G8898202601310"
+    assert log_index.is_trace_id(partial) and not index.has_postings(partial)
+    hits = log_index.search_hits(index, index.log_dir, partial)
+    assert count(hits) == count(log_scan.scan_logs(index.log_dir, partial)) > 0
+
+
+def test_full_trace_id_uses_postings(index):
+    trace_id = "G889820260131003"
+    assert index.has_postings(trace_id)
+    hits = log_index.search_hits(index, index.log_dir, trace_id)
+    assert count(hits) == count(log_scan.scan_logs(index.log_dir, trace_id))
+
+
+LINE = "2026-01-31 10:00:0{n} [ERROR] [G8898000000000{n}] [T8898000000000{n}] c.f.l.s.LoanService - 放款失败"
+
+
+@pytest.mark.parametrize("name, age", [("loan-service.log.1", 0), ("loan-service.log", 3600)])
+def test_last_line_without_newline_in_closed_file(tmp_path, name, age):
+    # 轮转归档 / 早已写完的文件：最后一行没有换行也要进索引，否则查询会漏掉它
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    path = log_dir / name
+    # 同一流水号前面已有命中：search_hits 信任倒排、不再全量扫描，漏索引的最后一行就查不到了
+    path.write_text(LINE.format(n=2) + "\n" + LINE.format(n=1) + "\n" + LINE.format(n=2), encoding="utf-8")
+    mtime = path.stat().st_mtime - age
+    os.utime(path, (mtime, mtime))
+    idx = log_index.LogIndex(str(log_dir), str(tmp_path / "log_index.sqlite"))
+    idx.refresh()
+    hits = log_index.search_hits(idx, str(log_dir), "G88980000000002")
+    assert count(hits) == 2 and hits[name][-1][1] == LINE.format(n=2)
+
+
+def test_last_line_of_active_file_waits_for_newline(tmp_path):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    path = log_dir / "loan-service.log"
+    path.write_text(LINE.format(n=1) + "\n" + LINE.format(n=2)[:40], encoding="utf-8")
+    idx = log_index.LogIndex(str(log_dir), str(tmp_path / "log_index.sqlite"))
+    idx.refresh()
+    assert not idx.has_postings("G88980000000002")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(LINE.format(n=2)[40:] + "\n")
+    idx.refresh()
+    assert idx.lookup("G88980000000002") == [("loan-service.log", len(LINE.format(n=1).encode("utf-8")) + 1)]
@@ -0,0 +1,52 @@
+"""core.log_timeline：跨服务时间线在日志乱序、带上下文时仍按命中行时间排序"""
+import gzip
+
+import pytest
+
+from core import log_scan, log_timeline
+
+TRACE_ID = "G100000000000001"
+
+# a.log 中第 2 行写入时间晚于后面的行 (多线程日志常见)，b.log 的命中行夹在 a.log 的命中行之间
+A_LOG = f"""2026-01-31 10:00:00.100 [INFO ] [{TRACE_ID}] [T1] A - a1
+2026-01-31 10:00:09.000 [INFO ] [G100000000000999] [T9] A - 乱序的无关行
+2026-01-31 10:00:00.200 [INFO ] [G100000000000999] [T9] A - 无关行
+2026-01-31 10:00:00.300 [INFO ] [{TRACE_ID}] [T1] A - a2
+2026-01-31 10:00:00.900 [ERROR] [{TRACE_ID}] [T1] A - a3
+\tat com.demo.A.run(A.java:10)
+2026-01-31 10:00:01.000 [INFO ] [G100000000000999] [T9] A - 尾部无关行
+"""
+B_LOG = f"""2026-01-31 10:00:05.000 [INFO ] [G100000000000998] [T8] B - 乱序的无关行
+2026-01-31 10:00:00.250 [INFO ] [{TRACE_ID}] [T2] B - b1
+2026-01-31 10:00:00.500 [INFO ] [{TRACE_ID}] [T2] B - b2
+"""
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def log_dir(request, tmp_path):
+    for name, content in (("a.log", A_LOG), ("b.log", B_LOG)):
+        if request.param == "gzip":
+            with gzip.open(tmp_path / f"{name}.gz", "wb") as f:
+                f.write(content.encode("utf-8"))
+        else:
+            (tmp_path / name).write_text(content, encoding="utf-8")
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("context", [0, 1, 2])
+def test_hits_sorted_across_services(log_dir, context):
+    hits = log_scan.scan_logs(log_dir, TRACE_ID)
+    timeline = log_timeline.build_timeline(TRACE_ID, log_dir, hits, context, context)
+    hit_lines = [e.line.rsplit(" - ", 1)[1] for e in timeline.entries if e.is_hit]
+    assert hit_lines == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_context_attached_to_its_hit_once(log_dir):
+    hits = log_scan.scan_logs(log_dir, TRACE_ID)
+    timeline = log_timeline.build_timeline(TRACE_ID, log_dir, hits, 1, 1)
+    lines = [e.line for e in timeline.entries]
+    # 每行最多出现一次，堆栈续行紧跟在 a3 后面
+    assert len(lines) == len(set(lines))
+    a3 = next(i for i, line in enumerate(lines) if line.endswith(" - a3"))
+    assert lines[a3 + 1].strip().startswith("at com.demo.A.run")
+    assert timeline.entries[a3 + 1].ts == timeline.entries[a3].ts
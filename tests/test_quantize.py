@@ -0,0 +1,75 @@
+"""core.quantize：int8 / float16 量化、分块打分，以及检索时前 200 个候选的精确重排"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core import index_store, quantize, retrieval  # noqa: E402
+
+N, DIM, TOP_K = 2000, 64, 10
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return retrieval.normalize_rows(np.random.default_rng(0).normal(size=(N, DIM)))
+
+
+@pytest.fixture(scope="module")
+def queries(matrix):
+    rng = np.random.default_rng(1)
+    picks = rng.choice(N, 50, replace=False)
+    return retrieval.normalize_rows(matrix[picks] + 0.3 * rng.normal(size=(50, DIM)))
+
+
+def top_k(scores, k=TOP_K):
+    return retrieval.top_k_indices(np.asarray(scores, dtype=np.float32), k).tolist()
+
+
+def test_int8_round_trip_error_within_half_step(matrix):
+    scales = quantize.int8_scales(matrix, block_rows=128)
+    np.testing.assert_allclose(scales, np.abs(matrix).max(axis=0) / quantize.INT8_MAX, rtol=1e-6)
+    q = quantize.quantize_int8(matrix, scales)
+    assert q.dtype == np.int8
+    assert np.all(np.abs(q.astype(np.float32) * scales - matrix) <= scales / 2 + 1e-7)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_compact_scores_close_to_float32(matrix, queries, dtype):
+    scales = quantize.int8_scales(matrix) if dtype == "int8" else None
+    compact = quantize.quantize_int8(matrix, scales) if dtype == "int8" else matrix.astype(np.float16)
+    exact = queries @ matrix.T
+    approx = quantize.compact_scores(compact, queries, scales, block_rows=300)
+    assert approx.dtype == np.float32 and approx.shape == exact.shape
+    assert np.abs(approx - exact).max() < (0.05 if dtype == "int8" else 0.005)
+    rows = np.array([3, 10, 1999])
+    np.testing.assert_allclose(quantize.compact_scores(compact, queries, scales, rows=rows), approx[:, rows],
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_int8_recall_without_rerank(matrix, queries):
+    scales = quantize.int8_scales(matrix)
+    compact = quantize.quantize_int8(matrix, scales)
+    hit = sum(len(set(top_k(e)) & set(top_k(a)))
+              for e, a in zip(queries @ matrix.T, quantize.compact_scores(compact, queries, scales)))
+    assert hit / (TOP_K * len(queries)) >= 0.9
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_rerank_matches_float32_top_k(tmp_path, matrix, queries, dtype):
+    # 量化索引保留原始向量：近似得分前 RERANK_CANDIDATES 个候选精确重排后，top-10 与 float32 暴力检索一致
+    index_dir = str(tmp_path / "knowledge_index")
+    texts = [f"切片 {i}" for i in range(N)]
+    with index_store.IndexWriter(index_dir, dim=DIM, dtype=dtype, lexical=False) as writer:
+        writer.add_batch(list(range(N)), texts, matrix, [""] * N)
+    index = index_store.KnowledgeIndex.open(index_dir)
+    assert index.vectors.dtype == np.dtype(dtype) and index.exact_vectors is not None
+
+    class Embedder:
+        def embed_documents(self, batch):
+            return [queries[int(t)] for t in batch]
+
+    retriever = retrieval.VectorRetriever(index, Embedder(), use_lexical=False)
+    assert retriever.quantized
+    results = retriever.search_batch([str(i) for i in range(len(queries))], TOP_K)
+    for q, hits in zip(queries, results):
+        assert [item["id"] for item, _ in hits] == top_k(matrix @ q)
+    index.close()
@@ -0,0 +1,32 @@
+"""core.query_cache：索引热加载只作废结果缓存，query 向量缓存随 Embedding 模型走"""
+from core import query_cache
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def filled_cache(version):
+    cache = query_cache.QueryCache()
+    cache.reset(version, MODEL)
+    cache.put_vectors(["VPN 怎么连？"], [[0.1, 0.2]], 5.0)
+    cache.put_results([cache.result_key(version, "VPN 怎么连", 3)], [[(7, 0.9)]], 8.0)
+    return cache
+
+
+def test_new_index_version_keeps_query_vectors():
+    cache = filled_cache("v1")
+    cache.reset("v2", MODEL)
+    assert cache.get_vector("vpn 怎么连") == [0.1, 0.2]
+    assert cache.stats()["result_entries"] == 0
+    assert cache.get_result(cache.result_key("v1", "VPN 怎么连", 3)) is None
+
+
+def test_same_version_keeps_everything():
+    cache = filled_cache("v1")
+    cache.reset("v1", MODEL)
+    assert cache.get_result(cache.result_key("v1", "vpn 怎么连!", 3)) == [(7, 0.9)]
+
+
+def test_model_change_clears_query_vectors():
+    cache = filled_cache("v1")
+    cache.reset("v1", "BAAI/bge-small-zh-v1.5")
+    assert cache.get_vector("VPN 怎么连") is None
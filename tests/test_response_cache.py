@@ -0,0 +1,71 @@
+"""core.response_cache：TTL / LRU 淘汰，只缓存完整且成功的回答"""
+import pytest
+
+from core import response_cache
+
+MESSAGES = [{"role": "user", "content": "G889820260131003 为什么失败"}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return response_cache.ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+
+
+def fake_stream(chunks, calls=None):
+    def stream_fn(model, messages, metrics):
+        if calls is not None:
+            calls.append((model, messages))
+        yield from chunks
+    return stream_fn
+
+
+def test_second_call_replays_cached_answer(cache):
+    calls = []
+    stream_fn = fake_stream(["根因：", "额度不足"], calls)
+    assert "".join(cache.cached_stream("qwen2.5", MESSAGES, stream_fn)) == "根因：额度不足"
+    metrics = {}
+    assert "".join(cache.cached_stream("qwen2.5", MESSAGES, stream_fn, metrics=metrics)) == "根因：额度不足"
+    assert len(calls) == 1 and metrics["cached"] is True
+    # 模型不同视为不同请求
+    list(cache.cached_stream("llama3", MESSAGES, stream_fn))
+    assert len(calls) == 2
+
+
+def test_error_chunk_is_never_cached(cache):
+    calls = []
+    stream_fn = fake_stream(["部分输出", "❌ 推理中断: timeout"], calls)
+    list(cache.cached_stream("qwen2.5", MESSAGES, stream_fn))
+    list(cache.cached_stream("qwen2.5", MESSAGES, stream_fn))
+    assert len(calls) == 2 and cache.stats()["entries"] == 0
+
+
+def test_interrupted_stream_is_not_cached(cache):
+    stream = cache.cached_stream("qwen2.5", MESSAGES, fake_stream(["第一段", "第二段"]))
+    assert next(stream) == "第一段"
+    stream.close()  # 页面重跑 / 点了重置
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_expiry(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    key = cache.key_of("qwen2.5", MESSAGES)
+    cache.put(key, "qwen2.5", "回答")
+    now[0] += cache.ttl - 1
+    assert cache.get(key) == "回答"
+    now[0] += 2
+    assert cache.get(key) is None and cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = response_cache.ResponseCache(str(tmp_path / "llm_cache.sqlite"), max_bytes=25)
+    for name in ("a", "b", "c"):
+        now[0] += 1
+        cache.put(name, "m", name * 10)
+    now[0] += 1
+    cache.get("a")  # a 最近被用过，b 最久没用
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" * 10 and cache.get("c") == "c" * 10
@@ -0,0 +1,85 @@
+"""core.retrieval：向量 / BM25 混合排序，IVF 候选与 BM25 候选合并"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core import index_store, retrieval  # noqa: E402
+
+DIM = 8
+PER_CLUSTER = 20
+TARGET = PER_CLUSTER + 7  # B 簇中唯一带交易码的切片
+QUERY = "loan_approval_01 怎么配置"
+
+
+class FakeEmbedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[t] for t in texts]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    # 两个分得很开的簇：A 簇围绕 e0，B 簇围绕 e1
+    rng = np.random.default_rng(0)
+    centers = np.eye(DIM, dtype=np.float32)[[0, 1]]
+    vectors = np.concatenate([centers[c] + 0.05 * rng.normal(size=(PER_CLUSTER, DIM)) for c in (0, 1)])
+    texts = [f"放款说明 第 {i} 段" for i in range(2 * PER_CLUSTER)]
+    texts[TARGET] = "交易码 loan_approval_01 的参数配置"
+    index_dir = str(tmp_path_factory.mktemp("kb") / "knowledge_index")
+    with index_store.IndexWriter(index_dir, dim=DIM, ann_lists=2) as writer:
+        writer.add_batch(list(range(len(texts))), texts, vectors, ["docs/a.pdf"] * len(texts))
+    idx = index_store.KnowledgeIndex.open(index_dir)
+    yield idx
+    idx.close()
+
+
+@pytest.fixture(scope="module")
+def embedder():
+    # query 向量更靠近 A 簇：只看向量时交易码所在的 B 簇切片排不到前面，nprobe=1 时甚至不在候选里
+    query_vec = retrieval.normalize_rows(np.eye(DIM, dtype=np.float32)[0] + 0.8 * np.eye(DIM, dtype=np.float32)[1])
+    return FakeEmbedder({QUERY: query_vec})
+
+
+def rows_of(hits):
+    return [item["id"] for item, _ in hits]
+
+
+def scores_of(hits):
+    return [round(score, 5) for _, score in hits]
+
+
+def test_top_k_indices_matches_argsort():
+    scores = np.random.default_rng(1).normal(size=100).astype(np.float32)
+    assert retrieval.top_k_indices(scores, 5).tolist() == np.argsort(-scores)[:5].tolist()
+    assert retrieval.top_k_indices(scores, 500).tolist() == np.argsort(-scores).tolist()
+
+
+def test_bm25_boost_promotes_literal_match(index, embedder):
+    vector_only = retrieval.VectorRetriever(index, embedder, use_lexical=False)
+    hybrid = retrieval.VectorRetriever(index, embedder)
+    full = index.ann.n_lists
+    assert TARGET not in rows_of(vector_only.search(QUERY, 3, nprobe=full))
+    hits = hybrid.search(QUERY, 3, nprobe=full)
+    assert rows_of(hits)[0] == TARGET
+    assert hits[0][1] == pytest.approx(float(np.dot(index.vectors[TARGET], embedder.vectors[QUERY])) +
+                                       retrieval.LEXICAL_WEIGHT, rel=1e-5)
+
+
+def test_ivf_candidates_merged_with_bm25_candidates(index, embedder):
+    assert index.ann is not None and index.ann.n_lists == 2
+    # nprobe=1 只探 A 簇；交易码所在的切片靠 BM25 候选并入后参与打分
+    vector_only = retrieval.VectorRetriever(index, embedder, use_lexical=False)
+    assert TARGET not in rows_of(vector_only.search(QUERY, 2 * PER_CLUSTER, nprobe=1))
+    hybrid = retrieval.VectorRetriever(index, embedder)
+    hits = hybrid.search(QUERY, 3, nprobe=1)
+    assert rows_of(hits)[0] == TARGET
+    exact = hybrid.search(QUERY, 3, nprobe=index.ann.n_lists)
+    assert rows_of(hits) == rows_of(exact) and scores_of(hits) == scores_of(exact)
+
+
+def test_without_embedder_falls_back_to_bm25(index):
+    retriever = retrieval.VectorRetriever(index, None)
+    assert retriever.mode == "BM25 检索"
+    assert rows_of(retriever.search(QUERY, 1)) == [TARGET]
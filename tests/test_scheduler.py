@@ -0,0 +1,124 @@
+"""core.scheduler：排队 / 相同请求合并 / 取消 (用可控的假 chat_stream 生成器)"""
+import threading
+import time
+
+import pytest
+
+from core import scheduler
+
+TIMEOUT = 5
+
+
+class FakeModel:
+    """每个请求先输出 "开始"，等 release 之后再输出剩余内容；记录调用次数和生成器是否被关闭"""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.closed = threading.Event()
+
+    def stream(self, model, messages, metrics):
+        self.calls.append(messages[-1]["content"])
+        try:
+            yield "开始"
+            self.started.set()
+            assert self.release.wait(TIMEOUT)
+            yield "，结束"
+            yield "。"
+        finally:
+            self.closed.set()
+
+
+def msgs(text):
+    return [{"role": "user", "content": text}]
+
+
+def wait_until(predicate):
+    deadline = time.time() + TIMEOUT
+    while not predicate():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fake():
+    return FakeModel()
+
+
+@pytest.fixture
+def sched(fake):
+    return scheduler.InferenceScheduler(fake.stream, max_concurrent=1, max_workers=4)
+
+
+def test_identical_inflight_requests_share_one_generation(sched, fake):
+    first = sched.submit("qwen2.5", msgs("同一个问题"))
+    assert fake.started.wait(TIMEOUT)
+    second = sched.submit("qwen2.5", msgs("同一个问题"))
+    assert sched.stats()["deduplicated"] == 1
+    outputs = {}
+
+    def read(ticket):
+        outputs[ticket] = "".join(sched.stream(ticket))
+
+    readers = [threading.Thread(target=read, args=(t,)) for t in (first, second)]
+    for r in readers:
+        r.start()
+    fake.release.set()
+    for r in readers:
+        r.join(TIMEOUT)
+    assert fake.calls == ["同一个问题"]
+    assert outputs == {first: "开始，结束。", second: "开始，结束。"}
+
+
+def test_requests_queue_beyond_max_concurrent(sched, fake):
+    running = sched.submit("qwen2.5", msgs("A"))
+    assert fake.started.wait(TIMEOUT)
+    queued = sched.submit("qwen2.5", msgs("B"))
+    assert sched.queue_position(queued) == 1 and sched.queue_position(running) == 0
+    assert sched.stats()["queued"] == {"qwen2.5": 1}
+
+    metrics, positions = {}, []
+    # A 占用时间超过一个轮询间隔，排队中的订阅者至少收到一次 on_wait
+    hold = scheduler.WAIT_POLL_SECONDS + 0.3
+    threading.Timer(hold, fake.release.set).start()
+    assert "".join(sched.stream(queued, metrics, on_wait=positions.append)) == "开始，结束。"
+    assert fake.calls == ["A", "B"] and positions and positions[0] == 1
+    # 排队耗时到任务开始为止，约等于 A 占用的时间
+    assert hold * 1000 * 0.8 <= metrics["queue_ms"] <= metrics["ttft_ms"]
+    assert "".join(sched.stream(running)) == "开始，结束。"
+
+
+def test_cancel_queued_request_never_runs(sched, fake):
+    running = sched.submit("qwen2.5", msgs("A"))
+    assert fake.started.wait(TIMEOUT)
+    queued = sched.submit("qwen2.5", msgs("B"))
+    sched.cancel(queued)
+    assert sched.stats()["queued"] == {"qwen2.5": 0}
+    fake.release.set()
+    assert "".join(sched.stream(running)) == "开始，结束。"
+    assert fake.calls == ["A"]
+
+
+def test_last_subscriber_leaving_stops_generation(sched, fake):
+    ticket = sched.submit("qwen2.5", msgs("A"))
+    stream = sched.stream(ticket)
+    assert next(stream) == "开始"
+    stream.close()  # 页面重跑：生成器被关闭 -> cancel
+    fake.release.set()
+    assert fake.closed.wait(TIMEOUT)
+    wait_until(lambda: sched.stats()["running"] == {"qwen2.5": 0})
+    # 后续同样的请求重新生成，不会挂到已取消的任务上
+    again = sched.submit("qwen2.5", msgs("A"))
+    assert "".join(sched.stream(again)) == "开始，结束。"
+    assert fake.calls == ["A", "A"]
+
+
+def test_remaining_subscriber_keeps_generation(sched, fake):
+    leaving = sched.submit("qwen2.5", msgs("A"))
+    staying = sched.submit("qwen2.5", msgs("A"))
+    assert fake.started.wait(TIMEOUT)
+    sched.cancel(leaving)
+    fake.release.set()
+    assert "".join(sched.stream(staying)) == "开始，结束。"
+    assert fake.calls == ["A"]